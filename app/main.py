@@ -9,7 +9,7 @@ import json
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from client.data_analysis_client import DataAnalysisClient
-from config.server_config import MCP_SERVERS
+from config.server_config import MCP_SERVERS, ANALYSIS_DATABASE_CONFIG
 
 async def main():
     parser = argparse.ArgumentParser(description="Data Memory System")
@@ -18,7 +18,7 @@ async def main():
     args = parser.parse_args()
     
     # Create client
-    client = DataAnalysisClient()
+    client = DataAnalysisClient(connection_string=ANALYSIS_DATABASE_CONFIG["connection_string"])
     
     try:
         # Connect to servers
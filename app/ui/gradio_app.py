@@ -9,7 +9,7 @@ import json
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from client.data_analysis_client import DataAnalysisClient
-from config.server_config import MCP_SERVERS
+from config.server_config import MCP_SERVERS, ANALYSIS_DATABASE_CONFIG
 
 class GradioApp:
     def __init__(self):
@@ -19,7 +19,7 @@ class GradioApp:
         
     async def init_client(self):
         """Initialize the client and connect to servers"""
-        self.client = DataAnalysisClient()
+        self.client = DataAnalysisClient(connection_string=ANALYSIS_DATABASE_CONFIG["connection_string"])
         
         # Connect to servers
         await self.client.connect_to_servers({
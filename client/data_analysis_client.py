@@ -1,6 +1,7 @@
 import asyncio
 from typing import Dict, Any, List, Optional
 import json
+import time
 import uuid
 from contextlib import AsyncExitStack
 
@@ -10,7 +11,7 @@ from mcp.client.stdio import stdio_client
 from .intent_detection import IntentDetector
 
 class DataAnalysisClient:
-    def __init__(self):
+    def __init__(self, approximate_first: bool = True, connection_string: str = "sqlite:///data/example.db"):
         self.memory_session = None
         self.sql_session = None
         self.visualization_session = None
@@ -18,12 +19,19 @@ class DataAnalysisClient:
         self.exit_stack = AsyncExitStack()
         self.user_id = str(uuid.uuid4())
         
+        # Run new analyses on table samples first and only go exact on confirmation
+        self.approximate_first = approximate_first
+        
+        # Database to analyze; its schema comes from the SQL server
+        self.connection_string = connection_string
+        
         # Initialize components
         self.intent_detector = IntentDetector()
         
         # State
         self.last_query = ""
         self.last_data_artifacts = []
+        self.pending_exact = None
         
     async def connect_to_servers(self, server_paths):
         """Connect to all required MCP servers"""
@@ -57,80 +65,55 @@ class DataAnalysisClient:
         })
         
         # 2. Analyze user intent
-        intent = self.intent_detector.detect_intent(user_input)
+        intent = self.intent_detector.detect_intent(user_input, awaiting_confirmation=self.pending_exact is not None)
         
         # For a new analysis request
         if intent["type"] == "new_analysis":
+            # A new question supersedes any estimate still waiting for confirmation
+            self.pending_exact = None
+            
             # 3a. Generate SQL query
             query = await self.sql_session.call_tool('generate_sql_query', {
                 "question": user_input,
-                "schema": self._get_database_schema()
+                "schema": await self._get_database_schema(),
+                "connection_string": self._get_connection_string()
             })
             
-            # 3b. Execute SQL query
+            # 3b. Execute SQL query (on a sample first when exploring)
             result_json = await self.sql_session.call_tool('execute_sql_query', {
                 "query": query,
-                "connection_string": self._get_connection_string()
-            })
-            
-            # 3c. Summarize dataset
-            summary = await self.summarization_session.call_tool('summarize_dataset', {
-                "data_json": result_json
-            })
-            
-            # 3d. Generate visualization goals
-            goals = await self.summarization_session.call_tool('generate_exploration_goals', {
-                "summary": summary
-            })
-            
-            # 3e. Select most relevant goal
-            selected_goal = self._select_goal(goals, user_input)
-            
-            # 3f. Generate visualization
-            viz_code = await self.visualization_session.call_tool('generate_visualization', {
-                "data_json": result_json,
-                "goal": selected_goal
+                "connection_string": self._get_connection_string(),
+                "orient": "columns",
+                "approximate": self.approximate_first
             })
             
-            # 3g. Evaluate visualization
-            evaluation = await self.visualization_session.call_tool('evaluate_visualization', {
-                "code": viz_code,
-                "data_json": result_json,
-                "goal": selected_goal
-            })
+            response = await self._analyze_result(user_input, memory_id, query, result_json)
             
-            # 3h. Refine if needed
-            eval_data = json.loads(evaluation)
-            if "scores" in eval_data and "overall" in eval_data["scores"] and eval_data["scores"]["overall"] < 0.8:
-                viz_code = await self.visualization_session.call_tool('refine_visualization', {
-                    "code": viz_code,
-                    "feedback": eval_data["feedback"],
-                    "data_json": result_json
-                })
+            # Offer the exact answer once the user has seen the estimate
+            data = response["data"]
+            if isinstance(data, dict) and data.get("approximate"):
+                self.pending_exact = {"user_input": user_input, "memory_id": memory_id, "query": query}
+                response["confirmation_prompt"] = (
+                    f"These results are estimated from a {data['sample_fraction']:.1%} sample. "
+                    "Reply 'confirm' to run the exact query."
+                )
+            return response
+        
+        # The user confirmed they want the exact answer to the last approximate result
+        elif intent["type"] == "confirmation":
+            if self.pending_exact is None:
+                return {"error": "No approximate result is waiting for confirmation"}
             
-            # 3i. Store results in memory
-            await self.memory_session.call_tool('store_data_artifact', {
-                "memory_id": memory_id,
-                "data_type": "query_result",
-                "data_content": result_json,
-                "summary": f"Data for: {user_input}"
-            })
+            pending = self.pending_exact
+            self.pending_exact = None
             
-            await self.memory_session.call_tool('store_data_artifact', {
-                "memory_id": memory_id,
-                "data_type": "visualization",
-                "data_content": viz_code,
-                "summary": f"Visualization for: {selected_goal}"
+            result_json = await self.sql_session.call_tool('execute_sql_query', {
+                "query": pending["query"],
+                "connection_string": self._get_connection_string(),
+                "orient": "columns"
             })
             
-            # 3j. Generate response
-            return {
-                "query": query,
-                "data": json.loads(result_json) if isinstance(result_json, str) else result_json,
-                "summary": json.loads(summary) if isinstance(summary, str) else summary,
-                "visualization_code": viz_code,
-                "goals": json.loads(goals)["goals"] if isinstance(goals, str) and "goals" in json.loads(goals) else []
-            }
+            return await self._analyze_result(pending["user_input"], pending["memory_id"], pending["query"], result_json)
             
         # For a refinement request
         elif intent["type"] == "refinement":
@@ -171,34 +154,105 @@ class DataAnalysisClient:
         else:
             return {"error": f"Unsupported intent type: {intent['type']}"}
     
-    def _get_database_schema(self):
-        """Get database schema - placeholder"""
-        return json.dumps({
-            "tables": [
-                {
-                    "name": "sales",
-                    "columns": [
-                        {"name": "date", "type": "DATE"},
-                        {"name": "product_id", "type": "INTEGER"},
-                        {"name": "region", "type": "TEXT"},
-                        {"name": "amount", "type": "REAL"}
-                    ]
-                },
-                {
-                    "name": "products",
-                    "columns": [
-                        {"name": "id", "type": "INTEGER"},
-                        {"name": "name", "type": "TEXT"},
-                        {"name": "category", "type": "TEXT"},
-                        {"name": "price", "type": "REAL"}
-                    ]
-                }
-            ]
+    async def _analyze_result(self, user_input: str, memory_id, query: str, result_json) -> Dict[str, Any]:
+        """Summarize, visualize and store a query result"""
+        # Spilled results live on the SQL server's disk only until their TTL
+        if self._spill_expired(result_json):
+            return {"query": query, "error": "The query result expired before it could be analyzed; run the query again"}
+        
+        # 3c. Summarize dataset
+        summary = await self.summarization_session.call_tool('summarize_dataset', {
+            "data_json": result_json
+        })
+        
+        # 3d. Generate visualization goals
+        goals = await self.summarization_session.call_tool('generate_exploration_goals', {
+            "summary": summary
+        })
+        
+        # 3e. Select most relevant goal
+        selected_goal = self._select_goal(goals, user_input)
+        
+        # 3f. Generate visualization
+        viz_code = await self.visualization_session.call_tool('generate_visualization', {
+            "data_json": result_json,
+            "goal": selected_goal
+        })
+        
+        # 3g. Evaluate visualization
+        evaluation = await self.visualization_session.call_tool('evaluate_visualization', {
+            "code": viz_code,
+            "data_json": result_json,
+            "goal": selected_goal
+        })
+        
+        # 3h. Refine if needed
+        eval_data = json.loads(evaluation)
+        if "scores" in eval_data and "overall" in eval_data["scores"] and eval_data["scores"]["overall"] < 0.8:
+            viz_code = await self.visualization_session.call_tool('refine_visualization', {
+                "code": viz_code,
+                "feedback": eval_data["feedback"],
+                "data_json": result_json
+            })
+        
+        # 3i. Store results in memory
+        await self.memory_session.call_tool('store_data_artifact', {
+            "memory_id": memory_id,
+            "data_type": "query_result",
+            "data_content": self._durable_result(result_json),
+            "summary": f"Data for: {user_input}"
+        })
+        
+        await self.memory_session.call_tool('store_data_artifact', {
+            "memory_id": memory_id,
+            "data_type": "visualization",
+            "data_content": viz_code,
+            "summary": f"Visualization for: {selected_goal}"
+        })
+        
+        # 3j. Generate response
+        return {
+            "query": query,
+            "data": json.loads(result_json) if isinstance(result_json, str) else result_json,
+            "summary": json.loads(summary) if isinstance(summary, str) else summary,
+            "visualization_code": viz_code,
+            "goals": json.loads(goals)["goals"] if isinstance(goals, str) and "goals" in json.loads(goals) else []
+        }
+    
+    async def _get_database_schema(self):
+        """Get the database schema document (cached by the SQL server until the schema changes)"""
+        return await self.sql_session.call_tool('get_database_schema', {
+            "connection_string": self._get_connection_string()
         })
     
+    @staticmethod
+    def _spill_payload(result_json) -> Optional[Dict[str, Any]]:
+        """The payload of a spilled result (a handle to rows on the SQL server's disk), or None"""
+        try:
+            payload = json.loads(result_json) if isinstance(result_json, str) else result_json
+        except (TypeError, ValueError):
+            return None
+        if isinstance(payload, dict) and str(payload.get("handle", "")).startswith("spill://"):
+            return payload
+        return None
+    
+    def _spill_expired(self, result_json) -> bool:
+        """Whether a result is a spill handle whose file has been garbage-collected"""
+        payload = self._spill_payload(result_json)
+        return payload is not None and payload.get("expires_at", float("inf")) <= time.time()
+    
+    def _durable_result(self, result_json) -> str:
+        """A result as stored in memory: spill handles expire, so only their schema, row count and sample are kept"""
+        payload = self._spill_payload(result_json)
+        if payload is None:
+            return result_json
+        durable = {key: value for key, value in payload.items() if key not in ("handle", "expires_at")}
+        durable["spilled"] = True
+        return json.dumps(durable)
+    
     def _get_connection_string(self):
-        """Get database connection string - placeholder"""
-        return "sqlite:///example.db"
+        """Get database connection string"""
+        return self.connection_string
     
     def _get_artifact_data(self, memory_id):
         """Get data associated with an artifact - placeholder"""
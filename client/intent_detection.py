@@ -7,10 +7,29 @@ class IntentDetector:
     def __init__(self):
         pass
     
-    def detect_intent(self, query: str) -> Dict[str, Any]:
-        """Detect intent from user query"""
+    def detect_intent(self, query: str, awaiting_confirmation: bool = False) -> Dict[str, Any]:
+        """Detect intent from user query
+
+        A confirmation is only detected while an approximate result is
+        waiting for one, and only from a short reply such as "yes" or
+        "yes, exact"; anything longer is treated as a new request.
+        """
         query_lower = query.lower()
-        
+
+        # Check for confirmation of an approximate result
+        confirmation_patterns = [
+            r"^\s*(yes|yep|y|ok|okay|sure|confirm(ed)?|go ahead)\s*[.!]*\s*$",
+            r"^\s*((yes|yep|ok|okay|sure|confirm(ed)?|go ahead)[\s,]+)?((run|give me|show me|get)\s+)?(the\s+)?"
+            r"(exact|precise|full)(\s+(one|version|result|results|answer|data|query|numbers))?"
+            r"(\s*,?\s*please)?\s*[.!]*\s*$"
+        ]
+
+        if awaiting_confirmation and any(re.search(pattern, query_lower) for pattern in confirmation_patterns):
+            return {
+                "type": "confirmation",
+                "confidence": 0.8
+            }
+
         # Check for refinement intent
         refinement_patterns = [
             r"change",
@@ -1,5 +1,5 @@
 
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 # LLM provider configuration
 LLM_PROVIDER = "ollama"  # Options: openai, anthropic, ollama, etc.
@@ -41,6 +41,95 @@ def get_active_llm_config() -> Dict[str, Any]:
     else:
         raise ValueError(f"Unsupported LLM provider: {LLM_PROVIDER}")
 
+# Model tiers a stage can be routed to. "large" is the active configuration;
+# "fast" is a small local model for cheap, low-stakes stages.
+LLM_TIER_CONFIG = {
+    "fast": {"provider": "ollama", "model": "gemma3:4b-it-qat", "temperature": 0.2},
+    "large": {}
+}
+
+# Tier each stage (one per MCP tool) starts on. A stage whose output fails
+# validation on a cheaper tier is retried once on LLM_ESCALATION_TIER.
+LLM_STAGE_ROUTING = {
+    "sql_generation": "large",            # generate_sql_query
+    "sql_refinement": "large",            # refine_sql_query
+    "dataset_summary": "large",           # summarize_dataset
+    "exploration_goals": "fast",          # generate_exploration_goals
+    "insights": "large",                  # extract_insights
+    "visualization_generation": "large",  # generate_visualization
+    "visualization_evaluation": "fast",   # evaluate_visualization
+    "visualization_refinement": "large"   # refine_visualization
+}
+
+LLM_ESCALATION_TIER = "large"
+
+# Per-stage overrides applied on top of the stage's tier. A stage may name
+# another provider (its configuration is used as the base) and any of model,
+# temperature and max_tokens.
+LLM_STAGE_CONFIG = {
+    "sql_generation": {},
+    "sql_refinement": {},
+    "dataset_summary": {},
+    "exploration_goals": {},
+    "insights": {},
+    "visualization_generation": {},
+    "visualization_evaluation": {},
+    "visualization_refinement": {}
+}
+
+_PROVIDER_CONFIGS = {
+    "openai": OPENAI_CONFIG,
+    "anthropic": ANTHROPIC_CONFIG,
+    "ollama": OLLAMA_CONFIG
+}
+
+def get_stage_llm_config(stage: str, tier: Optional[str] = None) -> Dict[str, Any]:
+    """LLM configuration for a pipeline stage on its routed tier, or on the given tier (stage overrides are then ignored)"""
+    if tier is None:
+        routed = LLM_STAGE_ROUTING.get(stage, "large")
+        if routed not in LLM_TIER_CONFIG:
+            raise ValueError(f"Unknown LLM tier for stage {stage}: {routed}")
+        overrides = {**LLM_TIER_CONFIG[routed], **LLM_STAGE_CONFIG.get(stage, {})}
+    elif tier in LLM_TIER_CONFIG:
+        overrides = LLM_TIER_CONFIG[tier]
+    else:
+        raise ValueError(f"Unknown LLM tier: {tier}")
+    
+    provider = overrides.get("provider")
+    if provider is None:
+        base = get_active_llm_config()
+    elif provider in _PROVIDER_CONFIGS:
+        base = _PROVIDER_CONFIGS[provider]
+    else:
+        raise ValueError(f"Unsupported LLM provider for stage {stage}: {provider}")
+    return {**base, **overrides}
+
+# Hedged requests. When a stage's model has not answered by the given
+# percentile of its recent latencies (default_delay_seconds until min_samples
+# calls are known), the request also goes to the next fallback; errors fail
+# over at once. The first valid answer wins. Fallbacks name a provider and
+# optionally a model; ones identical to the stage's model are skipped. As
+# shipped, every tier and the only fallback are the same local Ollama model,
+# so nothing is hedged: add a fallback on another provider or model to use it.
+LLM_HEDGING_CONFIG = {
+    "enabled": True,
+    "fallbacks": [{"provider": "ollama"}],
+    "percentile": 0.95,
+    "min_samples": 20,
+    "default_delay_seconds": 15.0,
+    "latency_window": 500  # Recent calls per model the percentiles are computed from
+}
+
+def get_fallback_llm_configs() -> List[Dict[str, Any]]:
+    """Full LLM configurations of the hedging fallbacks, in order"""
+    configs = []
+    for fallback in LLM_HEDGING_CONFIG["fallbacks"]:
+        provider = fallback.get("provider")
+        if provider not in _PROVIDER_CONFIGS:
+            raise ValueError(f"Unsupported LLM provider for fallback: {provider}")
+        configs.append({**_PROVIDER_CONFIGS[provider], **fallback})
+    return configs
+
 # Embedding model configuration
 EMBEDDING_CONFIG = {
     "provider": "sentence-transformers",
@@ -27,8 +27,265 @@ DATABASE_CONFIG = {
     "path": "data/memory.db"
 }
 
+# Database the client analyzes; its schema is served by the SQL server
+ANALYSIS_DATABASE_CONFIG = {
+    "connection_string": "sqlite:///data/example.db"
+}
+
 # Vector store configuration
 VECTOR_STORE_CONFIG = {
     "type": "faiss",  # Options: faiss, pinecone, etc.
     "path": "data/vector_store"
 }
+
+# Memory server persistence configuration
+MEMORY_PERSISTENCE_CONFIG = {
+    "enabled": True,
+    "path": "data/memory_state",
+    "fsync_policy": "batched",  # Options: always, batched, interval
+    "fsync_batch_size": 64,  # Records per fsync for the batched policy
+    "fsync_interval": 1.0,  # Seconds between fsyncs for the interval policy
+    "snapshot_every": 1000  # WAL records between compacted snapshots
+}
+
+# Hybrid lexical + dense retrieval configuration
+HYBRID_RETRIEVAL_CONFIG = {
+    "candidate_limit": 100,  # Max BM25 candidates passed on to dense scoring
+    "rrf_k": 60  # Reciprocal rank fusion constant
+}
+
+# Near-duplicate detection and consolidation configuration
+DEDUP_CONFIG = {
+    "max_distance": 4,  # Max SimHash Hamming distance for a near-duplicate
+    "max_fingerprint_chars": 20000,  # Artifact text fingerprinted per item
+    "consolidation_interval": 300  # Seconds between background merges (0 disables)
+}
+
+# Embedding storage configuration for the memory server
+EMBEDDING_STORAGE_CONFIG = {
+    "dtype": "float16",  # Options: float32, float16, int8 (per-vector scale)
+    "rerank": False,  # Keep a float32 copy to rescore the top candidates exactly
+    "rerank_candidates": 50
+}
+
+# Thread pool size and per-tool concurrency limits for each MCP server
+TOOL_EXECUTOR_CONFIG = {
+    "memory": {
+        "max_workers": 8,
+        "tool_limits": {"consolidate_memories": 1}
+    },
+    "sql": {
+        "max_workers": 16,
+        "tool_limits": {"generate_sql_query": 4, "refine_sql_query": 4, "execute_sql_query": 8}
+    },
+    "visualization": {
+        "max_workers": 8,
+        "tool_limits": {"generate_visualization": 4, "evaluate_visualization": 4, "refine_visualization": 4}
+    },
+    "summarization": {
+        "max_workers": 8,
+        "tool_limits": {"summarize_dataset": 4, "generate_exploration_goals": 4, "extract_insights": 4}
+    }
+}
+
+# Read-only connection pool used by the SQL agent server
+SQL_POOL_CONFIG = {
+    "max_connections": 8,  # Per database file
+    "cache_size_kb": 65536,  # SQLite page cache per connection
+    "mmap_size": 268435456,  # Bytes of the database file to memory-map
+    "cached_statements": 256,  # Prepared statements kept per connection
+    "acquire_timeout": 30.0  # Seconds to wait for a free connection
+}
+
+# Result cache in front of execute_sql_query
+QUERY_CACHE_CONFIG = {
+    "enabled": True,
+    "max_bytes": 64 * 1024 * 1024,  # In-memory budget for serialized results
+    "ttl": 300.0,  # Seconds an entry stays valid
+    "spill_dir": "data/query_cache"  # Evicted entries are written here (None disables)
+}
+
+# Result streaming configuration for execute_sql_query
+SQL_RESULT_CONFIG = {
+    "fetch_batch_size": 1000  # Rows pulled per fetchmany call
+}
+
+# Spilling of large query results to local files
+SPILL_CONFIG = {
+    "enabled": True,
+    "directory": "data/spill",
+    "threshold_bytes": 1024 * 1024,  # Results larger than this are passed by handle
+    "ttl": 3600.0,  # Seconds before a spill file is garbage-collected
+    "sample_rows": 20,  # Rows included inline with the handle
+    "gc_interval": 600.0,  # Minimum seconds between garbage collection sweeps
+    "resolve_max_rows": 5000  # Rows a consuming tool reads from a spilled result, spread evenly over it
+}
+
+# Per-query budgets enforced by execute_sql_query (0 disables a limit)
+SQL_BUDGET_CONFIG = {
+    "timeout_seconds": 30.0,  # Wall-clock limit per query
+    "max_vm_steps": 0,  # SQLite virtual machine instructions per query
+    "max_rows": 5000000,  # Rows fetched per query
+    "max_bytes": 512 * 1024 * 1024,  # Serialized bytes fetched per query
+    "progress_interval": 10000  # VM instructions between budget checks
+}
+
+# EXPLAIN QUERY PLAN gate run before every execute_sql_query
+QUERY_PLAN_CONFIG = {
+    "enabled": True,
+    "mode": "warn",  # "warn" records flagged queries, "block" rejects them
+    "large_table_rows": 10000,  # Full scans of tables at least this large are flagged
+    "path": "data/query_shapes.json",  # Persisted query shape log
+    "max_shapes": 1000,  # Least recently seen shapes beyond this are dropped
+    "flush_every": 20  # Recorded executions between writes of the shape log
+}
+
+# Index advisor fed by the query shape log
+INDEX_ADVISOR_CONFIG = {
+    "allow_apply": False,  # Opt in to creating recommended indexes
+    "max_recommendations": 5,
+    "min_occurrences": 1  # Shapes seen fewer times are ignored
+}
+
+# Materialized rollups used to answer aggregate queries in execute_sql_query
+PREAGGREGATION_CONFIG = {
+    "enabled": True,
+    "directory": "data/rollups",  # Sidecar rollup databases, one per source database
+    "rollups": [
+        {
+            "name": "sales_by_region_month",
+            "fact_table": "sales",
+            "key": "id",  # Append-only key used as the refresh high-water mark
+            "dimensions": {
+                "region": "region",
+                "year": "strftime('%Y', date)",
+                "month": "strftime('%Y-%m', date)"
+            },
+            "measures": ["amount"]
+        },
+        {
+            "name": "sales_by_product",
+            "fact_table": "sales",
+            "key": "id",
+            "joins": [{"table": "products", "on": ["product_id", "id"]}],
+            "dimensions": {
+                "region": "region",
+                "year": "strftime('%Y', date)",
+                "month": "strftime('%Y-%m', date)",
+                "product_id": "product_id",
+                "product_name": "name",
+                "category": "category"
+            },
+            "measures": ["amount"]
+        }
+    ]
+}
+
+# Reservoir samples backing execute_sql_query(approximate=True)
+SAMPLING_CONFIG = {
+    "enabled": True,
+    "directory": "data/samples",  # Sidecar sample databases, one per source database
+    "confidence": 0.95,  # Confidence level of the reported error bounds
+    "batch_size": 10000,  # Rows read per batch while feeding the reservoir
+    "tables": [
+        {"table": "sales", "key": "id", "sample_size": 10000}
+    ]
+}
+
+# Process-parallel execution of large aggregate queries
+PARALLEL_QUERY_CONFIG = {
+    "enabled": True,
+    "max_workers": 0,  # Worker processes (0 uses every CPU)
+    "min_rows": 200000,  # Tables with fewer rows are aggregated serially
+    "partitions_per_worker": 2,  # Rowid ranges per worker, to even out skewed ranges
+    "start_method": "spawn"  # Fresh interpreters; forking a process with open SQLite handles is unsafe
+}
+
+# Query engines behind execute_sql_query, chosen by connection string scheme
+QUERY_ENGINE_CONFIG = {
+    # Engine for sqlite:/// sources: "sqlite", "duckdb" or "auto" (GROUP BY/aggregate
+    # queries on DuckDB when it is installed, falling back to SQLite on dialect errors).
+    # DuckDB is opt-in: its sqlite extension may need to be downloaded on first use
+    "sqlite_engine": "sqlite",
+    "duckdb": {
+        "threads": 0,  # Worker threads per query (0 uses every CPU)
+        "memory_limit": "",  # e.g. "4GB"; empty keeps DuckDB's default
+        "extension_directory": ""  # Where the sqlite extension is installed; empty keeps the default
+    }
+}
+
+# Schema documents served by get_database_schema
+SCHEMA_INTROSPECTION_CONFIG = {
+    "max_distinct_values": 20,  # Columns with more distinct values in the sample are not enumerated
+    "sample_rows": 10000,  # Rows scanned per column when collecting distinct values
+    "max_value_length": 64  # Columns with longer values are not enumerated
+}
+
+# Question-driven pruning of the schema sent to generate_sql_query
+SCHEMA_RETRIEVAL_CONFIG = {
+    "enabled": True,
+    "top_k": 5,  # Most relevant tables kept, plus the tables they reference
+    "min_tables": 8,  # Schemas with this many tables or fewer are sent whole
+    "max_values": 10,  # Column values included in a column's description
+    "max_cached_embeddings": 50000,  # Table and column description vectors kept in memory
+    "embedding": {"provider": "sentence-transformers", "model_name": "all-MiniLM-L6-v2"}
+}
+
+# Semantic cache in front of generate_sql_query and refine_sql_query
+SQL_GENERATION_CACHE_CONFIG = {
+    "enabled": True,
+    "threshold": 0.92,  # Minimum cosine similarity of question templates
+    "max_entries": 2000,
+    "ttl_seconds": 86400,
+    "embedding": {"provider": "sentence-transformers", "model_name": "all-MiniLM-L6-v2"}
+}
+
+# Exact-match LLM response cache shared by every server and LLMService
+LLM_CACHE_CONFIG = {
+    "enabled": True,
+    "path": "data/llm_cache.db",
+    "ttl_seconds": 7 * 86400,
+    "max_bytes": 256 * 1024 * 1024,  # Least recently used responses are evicted beyond this
+    "touch_interval_seconds": 60,  # Hits refresh an entry's recency at most this often
+    "bypass": False  # Always call the provider (fresh responses are still stored)
+}
+
+# Client-side limits on LLM provider calls. Request and token buckets live in a
+# SQLite file shared by every server; concurrency adapts per process (AIMD).
+# A rate of 0 disables that bucket; "providers" overrides the defaults.
+LLM_RATE_LIMIT_CONFIG = {
+    "enabled": True,
+    "path": "data/llm_limits.db",
+    "providers": {
+        "openai": {"requests_per_minute": 500, "tokens_per_minute": 30000},
+        "anthropic": {"requests_per_minute": 50, "tokens_per_minute": 40000},
+        "ollama": {"initial_concurrency": 2, "max_concurrency": 4, "latency_target_seconds": 60.0}
+    },
+    "initial_concurrency": 4,
+    "min_concurrency": 1,
+    "max_concurrency": 32,
+    "latency_target_seconds": 30.0,  # Slower responses shrink the concurrency limit
+    "decrease_factor": 0.5,
+    "max_retries": 5,  # Retries of rate-limited and transient failures
+    "backoff_base_seconds": 1.0,
+    "backoff_max_seconds": 60.0,
+    "background_reserve": 0.2,  # Share of each bucket background calls leave for interactive ones
+    "default_completion_tokens": 1000  # Reserved when a request sets no max_tokens
+}
+
+# Query results inlined into LLM prompts (data_json) are replaced by a schema,
+# column profile and stratified row sample when they exceed the budget of the
+# stage's model (estimated tokens of the data alone)
+PROMPT_COMPACTION_CONFIG = {
+    "enabled": True,
+    "default_budget_tokens": 4000,
+    "model_budgets": {
+        "gpt-4": 4000,
+        "claude-2": 20000,
+        "gemma3:4b-it-qat": 2000
+    },
+    "max_sample_rows": 50,
+    "max_categories": 10,  # Most common values listed per categorical column
+    "max_strata": 10,  # A categorical column with at most this many values stratifies the sample
+    "max_value_length": 200
+}
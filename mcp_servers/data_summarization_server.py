@@ -1,10 +1,29 @@
 from mcp.server.fastmcp import FastMCP
-import openai
 import json
 from ..prompts.summarization_prompts import dataset_summary_prompt, exploration_goals_prompt, insights_prompt
+from ..config.server_config import TOOL_EXECUTOR_CONFIG, SPILL_CONFIG, PROMPT_COMPACTION_CONFIG
+from ..utils.concurrency import ToolExecutor
+from ..models.llm import get_stage_services
+from ..utils.llm_output import is_json
+from ..utils.spill import ResultSpillStore, resolve_data_json
+from ..utils.prompt_compaction import PromptCompactor
 
 mcp = FastMCP("data_summarization_server")
 
+# Blocking tool work runs on a bounded thread pool
+executor = ToolExecutor("data_summarization_server", **TOOL_EXECUTOR_CONFIG["summarization"])
+
+# Each pipeline stage calls the model tier it is routed to in llm_config, escalating to the
+# large model when its output fails validation; identical requests are answered from the
+# LLM response cache shared by all servers
+llm = get_stage_services()
+
+# Reads query results that the SQL server spilled to local files
+spill_store = ResultSpillStore(**SPILL_CONFIG)
+
+# Keeps inlined query results within the smallest token budget of the models a stage may use
+compactor = PromptCompactor(**PROMPT_COMPACTION_CONFIG)
+
 @mcp.prompt()
 def summarization_system_prompt() -> str:
     """System prompt for data summarization"""
@@ -16,8 +35,13 @@ def exploration_system_prompt() -> str:
     return exploration_goals_prompt()
 
 @mcp.tool()
+@executor.offload
 def summarize_dataset(data_json: str) -> str:
     """Create a comprehensive summary of the dataset"""
+    # Accept either inline data or a spill handle, compacted to fit the prompt
+    data_json = resolve_data_json(data_json, spill_store)
+    data_json = compactor.compact(data_json, llm.models("dataset_summary"))
+    
     # Get the prompt
     prompt_template = dataset_summary_prompt()
     
@@ -25,15 +49,10 @@ def summarize_dataset(data_json: str) -> str:
     prompt = prompt_template.replace("{{data_json}}", data_json)
     
     # Call LLM
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
+    response_text = llm.generate("dataset_summary", prompt, validate=is_json)
     
     # Extract summary
-    summary = response.choices[0].message.content.strip()
+    summary = response_text.strip()
     
     # Validate that it's proper JSON
     try:
@@ -44,6 +63,7 @@ def summarize_dataset(data_json: str) -> str:
         return json.dumps({"raw_summary": summary})
 
 @mcp.tool()
+@executor.offload
 def generate_exploration_goals(summary: str) -> str:
     """Generate visualization goals based on data summary"""
     # Get the prompt
@@ -53,15 +73,10 @@ def generate_exploration_goals(summary: str) -> str:
     prompt = prompt_template.replace("{{summary}}", summary)
     
     # Call LLM
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
+    response_text = llm.generate("exploration_goals", prompt, validate=is_json)
     
     # Extract goals
-    goals = response.choices[0].message.content.strip()
+    goals = response_text.strip()
     
     # Validate that it's proper JSON
     try:
@@ -72,8 +87,13 @@ def generate_exploration_goals(summary: str) -> str:
         return json.dumps({"raw_goals": goals})
 
 @mcp.tool()
+@executor.offload
 def extract_insights(code: str, data_json: str) -> str:
     """Extract insights from a visualization"""
+    # Accept either inline data or a spill handle, compacted to fit the prompt
+    data_json = resolve_data_json(data_json, spill_store)
+    data_json = compactor.compact(data_json, llm.models("insights"))
+    
     # Get the prompt
     prompt_template = insights_prompt()
     
@@ -81,15 +101,10 @@ def extract_insights(code: str, data_json: str) -> str:
     prompt = prompt_template.replace("{{code}}", code).replace("{{data_json}}", data_json)
     
     # Call LLM
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
+    response_text = llm.generate("insights", prompt, validate=is_json)
     
     # Extract insights
-    insights = response.choices[0].message.content.strip()
+    insights = response_text.strip()
     
     # Validate that it's proper JSON
     try:
@@ -1,10 +1,29 @@
 from mcp.server.fastmcp import FastMCP
-import openai
 import json
 from ..prompts.visualization_prompts import generation_prompt, evaluation_prompt, refinement_prompt
+from ..config.server_config import TOOL_EXECUTOR_CONFIG, SPILL_CONFIG, PROMPT_COMPACTION_CONFIG
+from ..utils.concurrency import ToolExecutor
+from ..models.llm import get_stage_services
+from ..utils.llm_output import is_json_object, is_python_code
+from ..utils.spill import ResultSpillStore, resolve_data_json
+from ..utils.prompt_compaction import PromptCompactor
 
 mcp = FastMCP("data_visualization_server")
 
+# Blocking tool work runs on a bounded thread pool
+executor = ToolExecutor("data_visualization_server", **TOOL_EXECUTOR_CONFIG["visualization"])
+
+# Each pipeline stage calls the model tier it is routed to in llm_config, escalating to the
+# large model when its output fails validation; identical requests are answered from the
+# LLM response cache shared by all servers
+llm = get_stage_services()
+
+# Reads query results that the SQL server spilled to local files
+spill_store = ResultSpillStore(**SPILL_CONFIG)
+
+# Keeps inlined query results within the smallest token budget of the models a stage may use
+compactor = PromptCompactor(**PROMPT_COMPACTION_CONFIG)
+
 @mcp.prompt()
 def visualization_generation_system_prompt() -> str:
     """System prompt for visualization generation"""
@@ -16,8 +35,13 @@ def visualization_evaluation_system_prompt() -> str:
     return evaluation_prompt()
 
 @mcp.tool()
+@executor.offload
 def generate_visualization(data_json: str, goal: str) -> str:
     """Generate Plotly visualization code based on data and goal"""
+    # Accept either inline data or a spill handle, compacted to fit the prompt
+    data_json = resolve_data_json(data_json, spill_store)
+    data_json = compactor.compact(data_json, llm.models("visualization_generation"))
+    
     # Get the prompt
     prompt_template = generation_prompt()
     
@@ -25,20 +49,20 @@ def generate_visualization(data_json: str, goal: str) -> str:
     prompt = prompt_template.replace("{{data_json}}", data_json).replace("{{goal}}", goal)
     
     # Call LLM
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
+    response_text = llm.generate("visualization_generation", prompt, validate=is_python_code)
     
     # Extract visualization code
-    viz_code = response.choices[0].message.content.strip()
+    viz_code = response_text.strip()
     return viz_code
 
 @mcp.tool()
+@executor.offload
 def evaluate_visualization(code: str, data_json: str, goal: str) -> str:
     """Evaluate visualization quality across multiple dimensions"""
+    # Accept either inline data or a spill handle, compacted to fit the prompt
+    data_json = resolve_data_json(data_json, spill_store)
+    data_json = compactor.compact(data_json, llm.models("visualization_evaluation"))
+    
     # Get the prompt
     prompt_template = evaluation_prompt()
     
@@ -46,20 +70,20 @@ def evaluate_visualization(code: str, data_json: str, goal: str) -> str:
     prompt = prompt_template.replace("{{code}}", code).replace("{{data_json}}", data_json).replace("{{goal}}", goal)
     
     # Call LLM
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
+    response_text = llm.generate("visualization_evaluation", prompt, validate=is_json_object)
     
     # Extract evaluation
-    evaluation = response.choices[0].message.content.strip()
+    evaluation = response_text.strip()
     return evaluation
 
 @mcp.tool()
+@executor.offload
 def refine_visualization(code: str, feedback: str, data_json: str) -> str:
     """Refine visualization based on feedback"""
+    # Accept either inline data or a spill handle, compacted to fit the prompt
+    data_json = resolve_data_json(data_json, spill_store)
+    data_json = compactor.compact(data_json, llm.models("visualization_refinement"))
+    
     # Get the prompt
     prompt_template = refinement_prompt()
     
@@ -67,18 +91,14 @@ def refine_visualization(code: str, feedback: str, data_json: str) -> str:
     prompt = prompt_template.replace("{{code}}", code).replace("{{feedback}}", feedback).replace("{{data_json}}", data_json)
     
     # Call LLM
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
+    response_text = llm.generate("visualization_refinement", prompt, validate=is_python_code)
     
     # Extract refined code
-    refined_code = response.choices[0].message.content.strip()
+    refined_code = response_text.strip()
     return refined_code
 
 @mcp.tool()
+@executor.offload
 def render_visualization(code: str) -> str:
     """Execute Plotly visualization code and return as HTML"""
     try:
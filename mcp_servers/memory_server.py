@@ -3,48 +3,150 @@ import numpy as np
 import json
 import time
 import hashlib
+import atexit
+import sys
+import threading
 from sentence_transformers import SentenceTransformer
+from ..config.server_config import (
+    MEMORY_PERSISTENCE_CONFIG, HYBRID_RETRIEVAL_CONFIG, DEDUP_CONFIG, EMBEDDING_STORAGE_CONFIG,
+    TOOL_EXECUTOR_CONFIG
+)
+from ..memory.persistence import MemoryPersistence
+from ..memory.lexical_index import BM25Index, reciprocal_rank_fusion
+from ..memory.dedup import SimHashLSH, simhash
+from ..memory.vector_index import EmbeddingIndex
+from ..utils.concurrency import ToolExecutor
 
 # Initialize MCP server
 mcp = FastMCP("memory_server")
 
+# Blocking tool work runs on a bounded thread pool
+executor = ToolExecutor("memory_server", **TOOL_EXECUTOR_CONFIG["memory"])
+
 # Initialize embedding model
 embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
 embedding_dimension = 384
 
-# In-memory storage for this example
-# In production, would use proper databases
+# In-memory storage, made durable by a write-ahead log and snapshots
 conversation_memories = {}
 data_artifacts = {}
-memory_embeddings = {}
+memory_embeddings = EmbeddingIndex(embedding_dimension, **EMBEDDING_STORAGE_CONFIG)
+
+# Guards the state against the background consolidation job
+state_lock = threading.RLock()
+
+persistence = None
+if MEMORY_PERSISTENCE_CONFIG.get("enabled", False):
+    persistence = MemoryPersistence(**MEMORY_PERSISTENCE_CONFIG)
+    recovered = persistence.recover()
+    conversation_memories.update(recovered["conversation_memories"])
+    data_artifacts.update(recovered["data_artifacts"])
+    memory_embeddings.update(recovered["memory_embeddings"])
+    atexit.register(persistence.close)
+
+# Per-user BM25 indexes over conversation memory text
+lexical_indexes = {}
+
+def _index_text(memory_id: str, memory: dict):
+    """Add a conversation memory to its user's lexical index"""
+    if memory["user_id"] not in lexical_indexes:
+        lexical_indexes[memory["user_id"]] = BM25Index()
+    lexical_indexes[memory["user_id"]].add(memory_id, memory["text"])
+
+# LSH indexes of canonical (non-duplicate) items, keyed by scope
+duplicate_indexes = {}
+
+def _dedup_scope(item_id: str):
+    """Scope within which near-duplicates of an item are looked up"""
+    if item_id in conversation_memories:
+        memory = conversation_memories[item_id]
+        return ("memory", memory["user_id"], memory["memory_type"])
+    
+    artifact = data_artifacts[item_id]
+    owner = conversation_memories.get(artifact["memory_id"], {}).get("user_id", "")
+    return ("artifact", owner, artifact["data_type"])
+
+def _dedup_text(item_id: str) -> str:
+    """Text fingerprinted for near-duplicate detection"""
+    if item_id in conversation_memories:
+        return conversation_memories[item_id]["text"]
+    
+    artifact = data_artifacts[item_id]
+    text = artifact["summary"] + "\n" + artifact["data_content"]
+    return text[:DEDUP_CONFIG["max_fingerprint_chars"]]
+
+def _find_near_duplicate(item_id: str):
+    """Return the canonical item this one nearly duplicates, indexing it otherwise"""
+    scope = _dedup_scope(item_id)
+    if scope not in duplicate_indexes:
+        duplicate_indexes[scope] = SimHashLSH(max_distance=DEDUP_CONFIG["max_distance"])
+    
+    fingerprint = simhash(_dedup_text(item_id))
+    matches = duplicate_indexes[scope].query(fingerprint)
+    if matches:
+        return matches[0][0]
+    
+    duplicate_indexes[scope].add(item_id, fingerprint)
+    return None
+
+for _memory_id, _memory in conversation_memories.items():
+    _index_text(_memory_id, _memory)
+    if "duplicate_of" not in _memory:
+        _find_near_duplicate(_memory_id)
+
+for _artifact_id, _artifact in data_artifacts.items():
+    if "duplicate_of" not in _artifact:
+        _find_near_duplicate(_artifact_id)
+
+def _log_mutation(op: str, key: str, record: dict = None, embedding: np.ndarray = None):
+    """Record a state mutation in the WAL and compact when due"""
+    if persistence is None:
+        return
+    persistence.append(op, key, record, embedding)
+    if persistence.should_snapshot():
+        persistence.snapshot(conversation_memories, data_artifacts, memory_embeddings)
 
 @mcp.tool()
+@executor.offload
 def store_memory(text: str, user_id: str, memory_type: str = "conversation") -> str:
     """Store a new memory in the memory bank"""
     # Generate embedding
     embedding = embedding_model.encode(text)
     
-    # Create memory entry
-    timestamp = time.time()
-    memory_id = f"{user_id}_{timestamp}_{memory_type}"
-    
-    # Store memory
-    conversation_memories[memory_id] = {
-        "text": text,
-        "user_id": user_id,
-        "memory_type": memory_type,
-        "timestamp": timestamp,
-        "relevance_score": 1.0,
-        "access_count": 0,
-        "last_accessed": timestamp
-    }
-    
-    # Store embedding
-    memory_embeddings[memory_id] = embedding
+    with state_lock:
+        # Create memory entry
+        timestamp = time.time()
+        memory_id = f"{user_id}_{timestamp}_{memory_type}"
+        
+        # Store memory
+        conversation_memories[memory_id] = {
+            "text": text,
+            "user_id": user_id,
+            "memory_type": memory_type,
+            "timestamp": timestamp,
+            "relevance_score": 1.0,
+            "access_count": 0,
+            "last_accessed": timestamp
+        }
+        
+        # Flag near-duplicates for the consolidation job
+        duplicate_of = _find_near_duplicate(memory_id)
+        if duplicate_of:
+            conversation_memories[memory_id]["duplicate_of"] = duplicate_of
+        
+        # Store embedding
+        memory_embeddings[memory_id] = embedding
+        
+        # Keep the lexical index up to date
+        _index_text(memory_id, conversation_memories[memory_id])
+        
+        # Make the mutation durable
+        _log_mutation("store_memory", memory_id, conversation_memories[memory_id], embedding)
     
     return memory_id
 
 @mcp.tool()
+@executor.offload
 def store_data_artifact(memory_id: str, data_type: str, data_content: str, summary: str) -> str:
     """Store a data artifact associated with a memory"""
     # Generate hash of content for deduplication
@@ -53,98 +155,257 @@ def store_data_artifact(memory_id: str, data_type: str, data_content: str, summa
     # Create artifact ID
     artifact_id = f"{memory_id}_{data_type}"
     
-    # Store in database
-    data_artifacts[artifact_id] = {
-        "memory_id": memory_id,
-        "data_type": data_type,
-        "data_content": data_content,
-        "summary": summary,
-        "hash": content_hash,
-        "timestamp": time.time()
-    }
-    
-    # Also store embedding of summary for retrieval
+    # Embed the summary for retrieval
     summary_embedding = embedding_model.encode(summary)
-    memory_embeddings[artifact_id] = summary_embedding
+    
+    with state_lock:
+        # Store in database
+        data_artifacts[artifact_id] = {
+            "memory_id": memory_id,
+            "data_type": data_type,
+            "data_content": data_content,
+            "summary": summary,
+            "hash": content_hash,
+            "timestamp": time.time()
+        }
+        
+        # Flag near-duplicates for the consolidation job
+        duplicate_of = _find_near_duplicate(artifact_id)
+        if duplicate_of:
+            data_artifacts[artifact_id]["duplicate_of"] = duplicate_of
+        
+        memory_embeddings[artifact_id] = summary_embedding
+        
+        # Make the mutation durable
+        _log_mutation("store_data_artifact", artifact_id, data_artifacts[artifact_id], summary_embedding)
     
     return artifact_id
 
+def _score_memories(query_embedding: np.ndarray, memory_ids: list) -> dict:
+    """Combine cosine similarity with the time-decayed relevance of each memory"""
+    # Calculate similarity in one pass over the contiguous index
+    similarities = memory_embeddings.similarities(query_embedding, memory_ids)
+    
+    scores = {}
+    now = time.time()
+    for memory_id, similarity in zip(memory_ids, similarities):
+        memory = conversation_memories[memory_id]
+        
+        # Apply time decay
+        time_elapsed = (now - memory["timestamp"]) / (60 * 60 * 24)  # days
+        decay_rate = 0.01
+        decayed_score = memory["relevance_score"] * ((1 - decay_rate) ** time_elapsed)
+        
+        # Final score is combination of relevance and similarity
+        scores[memory_id] = float((decayed_score + similarity) / 2)
+    
+    return scores
+
 @mcp.tool()
-def retrieve_conversation_context(query: str, user_id: str, max_results: int = 5) -> str:
-    """Retrieve relevant conversation memories for context"""
+@executor.offload
+def retrieve_conversation_context(query: str, user_id: str, max_results: int = 5, mode: str = "dense") -> str:
+    """Retrieve relevant conversation memories for context.
+    
+    mode is "dense" for embedding similarity over every memory of the user, or
+    "hybrid" to use BM25 hits as a candidate prefilter, score only those
+    candidates densely and fuse both rankings with reciprocal rank fusion.
+    """
     # Generate query embedding
     query_embedding = embedding_model.encode(query)
     
-    # Find relevant memories
-    results = []
-    for memory_id, embedding in memory_embeddings.items():
-        # Check if it's a conversation memory for this user
-        if memory_id in conversation_memories and conversation_memories[memory_id]["user_id"] == user_id:
-            # Calculate similarity
-            similarity = np.dot(query_embedding, embedding) / (
-                np.linalg.norm(query_embedding) * np.linalg.norm(embedding)
+    with state_lock:
+        lexical_hits = []
+        if mode == "hybrid" and user_id in lexical_indexes:
+            lexical_hits = lexical_indexes[user_id].search(
+                query, limit=HYBRID_RETRIEVAL_CONFIG["candidate_limit"]
             )
+        
+        if lexical_hits:
+            # Dense scoring is bounded to the lexical candidate set
+            dense_scores = _score_memories(query_embedding, [memory_id for memory_id, _ in lexical_hits])
+            dense_ranking = sorted(dense_scores, key=dense_scores.get, reverse=True)
+            lexical_ranking = [memory_id for memory_id, _ in lexical_hits]
             
-            memory = conversation_memories[memory_id]
-            
-            # Apply time decay
-            time_elapsed = (time.time() - memory["timestamp"]) / (60 * 60 * 24)  # days
-            decay_rate = 0.01
-            decayed_score = memory["relevance_score"] * ((1 - decay_rate) ** time_elapsed)
+            fused = reciprocal_rank_fusion([lexical_ranking, dense_ranking], k=HYBRID_RETRIEVAL_CONFIG["rrf_k"])
             
-            # Final score is combination of relevance and similarity
-            final_score = (decayed_score + similarity) / 2
+            results = []
+            for memory_id in sorted(fused, key=fused.get, reverse=True):
+                memory = conversation_memories[memory_id]
+                results.append({
+                    "memory_id": memory_id,
+                    "text": memory["text"],
+                    "type": memory["memory_type"],
+                    "relevance": dense_scores[memory_id],
+                    "rrf_score": fused[memory_id]
+                })
             
+            return json.dumps({"memories": results[:max_results]})
+        
+        # Dense retrieval, also the fallback when no lexical candidates exist
+        # Conversation memories for this user
+        memory_ids = [memory_id for memory_id, memory in conversation_memories.items()
+                      if memory["user_id"] == user_id]
+        
+        results = []
+        for memory_id, final_score in _score_memories(query_embedding, memory_ids).items():
             if final_score >= 0.5:  # relevance threshold
+                memory = conversation_memories[memory_id]
                 results.append({
                     "memory_id": memory_id,
                     "text": memory["text"],
                     "type": memory["memory_type"],
-                    "relevance": float(final_score)
+                    "relevance": final_score
                 })
-    
-    # Sort by relevance
-    results.sort(key=lambda x: x["relevance"], reverse=True)
-    
-    # Return top results
-    return json.dumps({"memories": results[:max_results]})
+        
+        # Sort by relevance
+        results.sort(key=lambda x: x["relevance"], reverse=True)
+        
+        # Return top results
+        return json.dumps({"memories": results[:max_results]})
 
 @mcp.tool()
+@executor.offload
 def retrieve_data_artifacts(query: str, user_id: str, max_results: int = 3) -> str:
     """Retrieve relevant data artifacts based on query"""
     # Generate query embedding
     query_embedding = embedding_model.encode(query)
     
-    # Find relevant artifacts
-    results = []
-    for artifact_id, embedding in memory_embeddings.items():
-        # Check if it's a data artifact
-        if artifact_id in data_artifacts:
-            artifact = data_artifacts[artifact_id]
-            memory_id = artifact["memory_id"]
+    with state_lock:
+        # Data artifacts belonging to this user
+        artifact_ids = [
+            artifact_id for artifact_id, artifact in data_artifacts.items()
+            if artifact["memory_id"] in conversation_memories
+            and conversation_memories[artifact["memory_id"]]["user_id"] == user_id
+        ]
+        
+        # Calculate similarity in one pass over the contiguous index
+        similarities = memory_embeddings.similarities(query_embedding, artifact_ids)
+        
+        # Find relevant artifacts
+        results = []
+        for artifact_id, similarity in zip(artifact_ids, similarities):
+            if similarity >= 0.5:  # relevance threshold
+                artifact = data_artifacts[artifact_id]
+                results.append({
+                    "artifact_id": artifact_id,
+                    "memory_id": artifact["memory_id"],
+                    "data_type": artifact["data_type"],
+                    "summary": artifact["summary"],
+                    "relevance": float(similarity),
+                    "data_content": artifact["data_content"]
+                })
+        
+        # Sort by relevance
+        results.sort(key=lambda x: x["relevance"], reverse=True)
+        
+        # Return top results
+        return json.dumps({"artifacts": results[:max_results]})
+
+def _forget(item_id: str):
+    """Remove a memory or artifact from the state and every index"""
+    memory = conversation_memories.pop(item_id, None)
+    if memory is not None and memory["user_id"] in lexical_indexes:
+        lexical_indexes[memory["user_id"]].remove(item_id)
+    data_artifacts.pop(item_id, None)
+    memory_embeddings.pop(item_id, None)
+    _log_mutation("delete", item_id)
+
+def _resolve_canonical(item_id: str, items: dict):
+    """Follow duplicate_of links to the surviving canonical item"""
+    seen = set()
+    while item_id in items and "duplicate_of" in items[item_id] and item_id not in seen:
+        seen.add(item_id)
+        item_id = items[item_id]["duplicate_of"]
+    return item_id if item_id in items else None
+
+def _consolidate(user_id: str = "") -> dict:
+    """Merge flagged near-duplicates into their canonical items"""
+    merged_memories = 0
+    merged_artifacts = 0
+    
+    with state_lock:
+        # Index artifacts by owning memory so they can be re-pointed
+        artifacts_by_memory = {}
+        for artifact_id, artifact in data_artifacts.items():
+            artifacts_by_memory.setdefault(artifact["memory_id"], []).append(artifact_id)
+        
+        for memory_id, memory in list(conversation_memories.items()):
+            if "duplicate_of" not in memory or (user_id and memory["user_id"] != user_id):
+                continue
             
-            # Check if it belongs to this user
-            if memory_id in conversation_memories and conversation_memories[memory_id]["user_id"] == user_id:
-                # Calculate similarity
-                similarity = np.dot(query_embedding, embedding) / (
-                    np.linalg.norm(query_embedding) * np.linalg.norm(embedding)
-                )
-                
-                if similarity >= 0.5:  # relevance threshold
-                    results.append({
-                        "artifact_id": artifact_id,
-                        "memory_id": memory_id,
-                        "data_type": artifact["data_type"],
-                        "summary": artifact["summary"],
-                        "relevance": float(similarity),
-                        "data_content": artifact["data_content"]
-                    })
-    
-    # Sort by relevance
-    results.sort(key=lambda x: x["relevance"], reverse=True)
-    
-    # Return top results
-    return json.dumps({"artifacts": results[:max_results]})
+            canonical_id = _resolve_canonical(memory["duplicate_of"], conversation_memories)
+            if canonical_id is None:
+                # The canonical memory is gone, so this one becomes canonical
+                del memory["duplicate_of"]
+                _find_near_duplicate(memory_id)
+                _log_mutation("update_memory", memory_id, memory)
+                continue
+            
+            # Keep usage statistics of the merged memory
+            canonical = conversation_memories[canonical_id]
+            canonical["access_count"] = canonical.get("access_count", 0) + memory.get("access_count", 0)
+            canonical["duplicate_count"] = canonical.get("duplicate_count", 0) + memory.get("duplicate_count", 0) + 1
+            canonical["last_accessed"] = max(canonical.get("last_accessed", 0), memory.get("last_accessed", 0))
+            _log_mutation("update_memory", canonical_id, canonical)
+            
+            for artifact_id in artifacts_by_memory.pop(memory_id, []):
+                data_artifacts[artifact_id]["memory_id"] = canonical_id
+                artifacts_by_memory.setdefault(canonical_id, []).append(artifact_id)
+                _log_mutation("update_data_artifact", artifact_id, data_artifacts[artifact_id])
+            
+            _forget(memory_id)
+            merged_memories += 1
+        
+        for artifact_id, artifact in list(data_artifacts.items()):
+            if "duplicate_of" not in artifact:
+                continue
+            owner = conversation_memories.get(artifact["memory_id"], {}).get("user_id", "")
+            if user_id and owner != user_id:
+                continue
+            
+            canonical_id = _resolve_canonical(artifact["duplicate_of"], data_artifacts)
+            if canonical_id is None:
+                del artifact["duplicate_of"]
+                _find_near_duplicate(artifact_id)
+                _log_mutation("update_data_artifact", artifact_id, artifact)
+                continue
+            
+            _forget(artifact_id)
+            merged_artifacts += 1
+    
+    return {"merged_memories": merged_memories, "merged_artifacts": merged_artifacts}
+
+@mcp.tool()
+@executor.offload
+def consolidate_memories(user_id: str = "") -> str:
+    """Merge near-duplicate memories and artifacts, optionally for a single user"""
+    return json.dumps(_consolidate(user_id))
+
+@mcp.tool()
+@executor.offload
+def embedding_index_stats() -> str:
+    """Report size and storage mode of the embedding index"""
+    with state_lock:
+        return json.dumps({
+            "vectors": len(memory_embeddings),
+            "dimension": memory_embeddings.dimension,
+            "dtype": memory_embeddings.dtype,
+            "rerank": memory_embeddings.rerank,
+            "bytes": memory_embeddings.nbytes
+        })
+
+def _consolidation_loop():
+    """Background job that periodically consolidates near-duplicates"""
+    while True:
+        time.sleep(DEDUP_CONFIG["consolidation_interval"])
+        try:
+            _consolidate()
+        except Exception as e:
+            # stdout carries the MCP protocol, so report on stderr
+            print(f"Memory consolidation failed: {str(e)}", file=sys.stderr)
+
+if DEDUP_CONFIG.get("consolidation_interval", 0) > 0:
+    threading.Thread(target=_consolidation_loop, daemon=True).start()
 
 @mcp.prompt()
 def memory_system_prompt() -> str:
@@ -1,11 +1,75 @@
 from mcp.server.fastmcp import FastMCP
-import openai
+import os
 import json
 import sqlite3
+import hashlib
+import asyncio
 from ..prompts.sql_prompts import generation_prompt, refinement_prompt, error_handling_prompt
+from ..config.server_config import (
+    TOOL_EXECUTOR_CONFIG, SQL_POOL_CONFIG, QUERY_CACHE_CONFIG, SQL_RESULT_CONFIG, SPILL_CONFIG,
+    SQL_BUDGET_CONFIG, QUERY_PLAN_CONFIG, INDEX_ADVISOR_CONFIG, PREAGGREGATION_CONFIG,
+    SAMPLING_CONFIG, PARALLEL_QUERY_CONFIG, QUERY_ENGINE_CONFIG, ANALYSIS_DATABASE_CONFIG, SCHEMA_INTROSPECTION_CONFIG,
+    SCHEMA_RETRIEVAL_CONFIG, SQL_GENERATION_CACHE_CONFIG
+)
+from ..utils.concurrency import ToolExecutor
+from ..models.llm import get_stage_services
+from ..utils.database import get_read_only_pool, parse_sqlite_path
+from ..utils.query_cache import QueryResultCache, database_stamp
+from ..utils.sql_results import ORIENTS, decode_cursor, encode_cursor, paged_query, fetch_rows, serialize_result
+from ..utils.spill import ResultSpillStore, fetch_or_spill
+from ..utils.query_budget import QueryBudget
+from ..utils.query_planner import QueryShapeLog, QueryPlanGate, IndexAdvisor, explain_query_plan
+from ..utils.preaggregation import PreAggregator
+from ..utils.sampling import SampleStore, ApproximateQuery
+from ..utils.parallel_query import ParallelQueryExecutor
+from ..utils.query_engines import QueryEngineRouter, DuckDBEngine, parse_connection_string
+from ..utils.schema_introspection import SchemaIntrospector
+from ..utils.schema_retrieval import SchemaRetriever
+from ..utils.sql_generation_cache import SemanticSQLCache, schema_hash
 
 mcp = FastMCP("sql_agent_server")
 
+# Blocking tool work runs on a bounded thread pool
+executor = ToolExecutor("sql_agent_server", **TOOL_EXECUTOR_CONFIG["sql"])
+
+# Each pipeline stage calls the model tier it is routed to in llm_config, escalating to the
+# large model when its output fails validation; identical requests are answered from the
+# LLM response cache shared by all servers
+llm = get_stage_services()
+
+# Serialized query results, invalidated when the database file changes
+query_cache = QueryResultCache(**QUERY_CACHE_CONFIG) if QUERY_CACHE_CONFIG.get("enabled", False) else None
+
+# Results above the size threshold are written to local files and passed by handle
+spill_store = ResultSpillStore(**SPILL_CONFIG) if SPILL_CONFIG.get("enabled", False) else None
+
+# Every query is explained first; shapes and predicates feed the index advisor
+shape_log = QueryShapeLog(**QUERY_PLAN_CONFIG)
+plan_gate = QueryPlanGate(shape_log=shape_log, **QUERY_PLAN_CONFIG) if QUERY_PLAN_CONFIG.get("enabled", False) else None
+index_advisor = IndexAdvisor(shape_log, **INDEX_ADVISOR_CONFIG)
+
+# Materialized rollups that answer common aggregate queries without scanning the fact table
+preaggregator = PreAggregator(**PREAGGREGATION_CONFIG) if PREAGGREGATION_CONFIG.get("enabled", False) else None
+
+# Reservoir samples of large tables for approximate, exploratory answers
+sample_store = SampleStore(**SAMPLING_CONFIG) if SAMPLING_CONFIG.get("enabled", False) else None
+
+# Large GROUP BY aggregates are split by rowid range across worker processes
+parallel_executor = ParallelQueryExecutor(pool_config=SQL_POOL_CONFIG, **PARALLEL_QUERY_CONFIG) \
+    if PARALLEL_QUERY_CONFIG.get("enabled", False) else None
+
+# SQLite by default; DuckDB for duckdb:/// and parquet:/// sources and routed analytical queries
+engine_router = QueryEngineRouter(**QUERY_ENGINE_CONFIG)
+
+# Schema documents for SQL generation, rebuilt only when PRAGMA schema_version changes
+schema_introspector = SchemaIntrospector(**SCHEMA_INTROSPECTION_CONFIG)
+
+# Only the tables relevant to a question (and the tables they reference) go into the prompt
+schema_retriever = SchemaRetriever(**SCHEMA_RETRIEVAL_CONFIG) if SCHEMA_RETRIEVAL_CONFIG.get("enabled", False) else None
+
+# Generated SQL reused for equivalent questions (literals swapped), re-validated with EXPLAIN
+sql_cache = SemanticSQLCache(**SQL_GENERATION_CACHE_CONFIG) if SQL_GENERATION_CACHE_CONFIG.get("enabled", False) else None
+
 @mcp.prompt()
 def sql_generation_system_prompt() -> str:
     """System prompt for SQL generation"""
@@ -16,9 +80,49 @@ def sql_refinement_system_prompt() -> str:
     """System prompt for SQL refinement"""
     return refinement_prompt()
 
+def _still_valid(query: str, connection_string: str) -> bool:
+    """Whether a generated or cached query prepares against a SQLite database (EXPLAIN, nothing is run)"""
+    if not query:
+        return False
+    source, db_path = parse_connection_string(connection_string)
+    if not connection_string or source != "sqlite":
+        return True
+    try:
+        with get_read_only_pool(db_path, **SQL_POOL_CONFIG).connection() as conn:
+            explain_query_plan(conn, query)
+        return True
+    except sqlite3.Error:
+        return False
+
+def _cached_sql(namespace: str, question: str, connection_string: str):
+    """Valid cached SQL for a question, dropping entries that no longer prepare"""
+    if sql_cache is None:
+        return None
+    hit = sql_cache.lookup(namespace, question)
+    if hit is None:
+        return None
+    if not _still_valid(hit["sql"], connection_string):
+        sql_cache.invalidate(hit["key"])
+        return None
+    return hit["sql"]
+
 @mcp.tool()
-def generate_sql_query(question: str, schema: str) -> str:
-    """Generate SQL query based on natural language question and database schema"""
+@executor.offload
+def generate_sql_query(question: str, schema: str, connection_string: str = "") -> str:
+    """Generate SQL query based on natural language question and database schema.
+    
+    Equivalent questions about the same schema reuse earlier SQL; with a
+    connection_string, reused SQL is first checked with EXPLAIN.
+    """
+    namespace = "generate:" + schema_hash(schema)
+    cached = _cached_sql(namespace, question, connection_string)
+    if cached is not None:
+        return cached
+    
+    # Keep only the relevant part of large JSON schema documents
+    if schema_retriever is not None:
+        schema = schema_retriever.prune_json(schema, question)
+    
     # Get the prompt
     prompt_template = generation_prompt()
     
@@ -26,44 +130,218 @@ def generate_sql_query(question: str, schema: str) -> str:
     prompt = prompt_template.replace("{{question}}", question).replace("{{schema}}", schema)
     
     # Call LLM
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
+    response_text = llm.generate("sql_generation", prompt, validate=lambda text: _still_valid(text.strip(), connection_string))
     
     # Extract SQL query
-    query = response.choices[0].message.content.strip()
+    query = response_text.strip()
+    
+    if sql_cache is not None:
+        sql_cache.store(namespace, question, query)
     return query
 
-@mcp.tool()
-def execute_sql_query(query: str, connection_string: str) -> str:
-    """Execute SQL query and return results as JSON"""
+def _execute_on_sample(approximate_query: ApproximateQuery, db_path: str, max_rows: int,
+                       orient: str, budget: QueryBudget) -> str:
+    """Run a sample-rewritten query and attach its estimates' error bounds"""
+    with get_read_only_pool(sample_store.sidecar_path(db_path), **SQL_POOL_CONFIG).connection() as conn:
+        # Tables that are not sampled are read from the source database
+        sample_store.attach_source(conn, db_path)
+        budget.install(conn)
+        try:
+            db_cursor = conn.execute(approximate_query.sql)
+            columns, rows, has_more = fetch_rows(db_cursor, max_rows, SQL_RESULT_CONFIG["fetch_batch_size"])
+            db_cursor.close()
+        finally:
+            budget.uninstall(conn)
+    
+    columns, rows, metadata = approximate_query.result(columns, rows)
+    payload = json.loads(serialize_result(columns, rows, orient))
+    if isinstance(payload, list):
+        payload = {"data": payload, "row_count": len(rows)}
+    payload.update(metadata)
+    payload["truncated"] = has_more
+    return json.dumps(payload)
+
+def _fetch_on_engine(engine: DuckDBEngine, source: str, db_path: str, query: str, max_rows: int,
+                     offset: int, budget: QueryBudget):
+    """Run a query on DuckDB, returning fetch_or_spill's (columns, rows, has_more, handle)"""
+    with engine.connection(source, db_path) as conn:
+        budget.install(conn)
+        try:
+            db_cursor = engine.execute(conn, query, max_rows, offset)
+            fetched = fetch_or_spill(db_cursor, spill_store, max_rows, SQL_RESULT_CONFIG["fetch_batch_size"], budget)
+            db_cursor.close()
+            return fetched
+        finally:
+            budget.uninstall(conn)
+
+def _execute_sql_query(query: str, connection_string: str, max_rows: int, cursor: str,
+                       orient: str, budget: QueryBudget, approximate: bool = False) -> str:
+    """Run a query within its budget; executed on the tool thread pool"""
     try:
-        # Parse connection string (in a real system, would be more secure)
-        db_path = connection_string.replace("sqlite:///", "")
+        if orient not in ORIENTS:
+            raise ValueError(f"Unsupported result orient: {orient}")
+        offset = decode_cursor(cursor)
+        page_options = {"max_rows": max_rows, "offset": offset, "orient": orient}
+        
+        # Parse connection string (in a real system, would be more secure) and pick the engine
+        source, db_path, engine = engine_router.route(connection_string, query)
+        
+        # Exploratory mode: estimate from a maintained sample (falls back to exact when it cannot)
+        if approximate and sample_store is not None and source == "sqlite" and not offset:
+            approximate_query, _ = sample_store.plan(query, db_path)
+            if approximate_query is not None:
+                return _execute_on_sample(approximate_query, db_path, max_rows, orient, budget)
+        
+        # Serve repeated queries without touching SQLite (Parquet directories are not stamped)
+        cache = query_cache if os.path.isfile(db_path) else None
+        if cache is not None:
+            cached = cache.get(query, db_path, **page_options)
+            if cached is not None:
+                return cached
+            stamp = database_stamp(db_path)
+        
+        # Answer matching aggregates from a rollup, refreshed with any appended rows first
+        target_path, target_query = db_path, query
+        rewrite = preaggregator.rewrite(query, db_path) if preaggregator is not None and source == "sqlite" else None
+        if rewrite is not None:
+            target_path, target_query, _ = rewrite
+        
+        # Columnar engine for DuckDB/Parquet sources and, per configuration, analytical SQLite queries
+        if engine is not None and rewrite is None:
+            try:
+                columns, rows, has_more, handle = _fetch_on_engine(engine, source, db_path, query, max_rows, offset, budget)
+            except Exception as e:
+                # SQLite-dialect queries DuckDB cannot run fall back to SQLite
+                if source != "sqlite" or budget.error_for(e) is not None:
+                    raise
+                engine = None
+        else:
+            engine = None
         
-        # Connect to database
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        if engine is None:
+            # Borrow a warm read-only connection from the database's pool
+            merge_conn = None
+            with get_read_only_pool(target_path, **SQL_POOL_CONFIG).connection() as conn:
+                # Enforce time and VM-step budgets while the statement runs
+                budget.install(conn)
+                try:
+                    # Check the plan for full scans of large tables before running anything
+                    if plan_gate is not None and rewrite is None:
+                        report = plan_gate.inspect(conn, query, db_path)
+                        if report["blocked"]:
+                            return json.dumps({
+                                "error": "plan_rejected",
+                                "message": "; ".join(report["warnings"]),
+                                "full_scans": report["full_scans"],
+                                "plan": report["plan"],
+                                "query": query
+                            })
+                    
+                    # Split large decomposable aggregates into rowid ranges run on worker processes
+                    parallel = parallel_executor.plan(conn, query) if parallel_executor is not None and rewrite is None else None
+                    if parallel is not None:
+                        parallel_plan, ranges = parallel
+                        merge_conn = parallel_executor.run(db_path, parallel_plan, ranges, budget)
+                        run_conn, target_query = merge_conn, parallel_plan.final_sql
+                    else:
+                        run_conn = conn
+                    
+                    # Execute query (prepared statements are reused via the statement cache)
+                    if max_rows or offset:
+                        paged_sql, params = paged_query(target_query, max_rows, offset)
+                        db_cursor = run_conn.execute(paged_sql, params)
+                    else:
+                        db_cursor = run_conn.execute(target_query)
+                    
+                    # Stream rows in batches, spilling to disk once they grow too large
+                    columns, rows, has_more, handle = fetch_or_spill(
+                        db_cursor, spill_store, max_rows, SQL_RESULT_CONFIG["fetch_batch_size"], budget
+                    )
+                    db_cursor.close()
+                finally:
+                    budget.uninstall(conn)
+                    if merge_conn is not None:
+                        merge_conn.close()
         
-        # Execute query
-        cursor.execute(query)
+        row_count = len(rows) if handle is None else handle["row_count"]
+        next_cursor = encode_cursor(offset + row_count) if has_more else None
         
-        # Fetch results
-        rows = cursor.fetchall()
+        if handle is not None:
+            # Handles point at files with their own expiry, so they are not cached
+            handle["next_cursor"] = next_cursor
+            return json.dumps(handle)
         
-        # Convert to list of dicts
-        results = []
-        for row in rows:
-            results.append({key: row[key] for key in row.keys()})
+        result_json = serialize_result(columns, rows, orient, next_cursor)
         
-        # Close connection
-        conn.close()
+        if cache is not None:
+            cache.put(query, db_path, result_json, stamp=stamp, **page_options)
         
-        return json.dumps(results)
+        return result_json
+        
+    except Exception as e:
+        # Report budget overruns with what was done before the query stopped
+        exceeded = budget.error_for(e)
+        if exceeded is not None:
+            return json.dumps({**exceeded.to_dict(), "query": query})
+        
+        return json.dumps({
+            "error": str(e),
+            "query": query
+        })
+
+@mcp.tool()
+async def execute_sql_query(query: str, connection_string: str, max_rows: int = 0,
+                            cursor: str = "", orient: str = "records", timeout_seconds: float = 0,
+                            approximate: bool = False) -> str:
+    """Execute SQL query and return results as JSON.
+    
+    connection_string is sqlite:///file.db, duckdb:///file (a SQLite or
+    DuckDB file read by DuckDB) or parquet:///path (a Parquet file or a
+    directory whose files and partitioned subdirectories become tables).
+    
+    max_rows limits the page size (0 returns every row) and cursor resumes
+    from the next_cursor of a previous page. orient is "records" (list of
+    dicts), "columns" ({"columns": [...], "data": [[...]]}) or "arrow".
+    
+    Results larger than the spill threshold are written to a local file and
+    a handle with schema, row count and a sample is returned instead.
+    
+    The query runs under wall-clock, VM-step, row and byte budgets
+    (timeout_seconds overrides the configured time budget) and is
+    interrupted if the request is cancelled.
+    
+    With approximate=True, queries over a sampled table run on its reservoir
+    sample instead: SUM/COUNT are scaled up and the result is a dict with
+    "approximate": true, per-column "error_bounds" (confidence interval
+    half-widths per row) and sample metadata. Queries a sample cannot answer
+    run exactly and return the usual format.
+    """
+    budget_config = dict(SQL_BUDGET_CONFIG)
+    if timeout_seconds > 0:
+        budget_config["timeout_seconds"] = timeout_seconds
+    budget = QueryBudget(**budget_config)
+    
+    try:
+        return await executor.run(
+            "execute_sql_query", _execute_sql_query, query, connection_string, max_rows, cursor, orient, budget,
+            approximate
+        )
+    except asyncio.CancelledError:
+        # The client abandoned the request, so stop the statement on its thread
+        budget.cancel()
+        raise
+
+@mcp.tool()
+@executor.offload
+def explain_sql_query(query: str, connection_string: str) -> str:
+    """Show the SQLite query plan and flag full scans of large tables without running the query"""
+    try:
+        db_path = parse_sqlite_path(connection_string)
+        gate = plan_gate or QueryPlanGate(**QUERY_PLAN_CONFIG)
+        with get_read_only_pool(db_path, **SQL_POOL_CONFIG).connection() as conn:
+            report = gate.inspect(conn, query)
+        report.pop("blocked")
+        return json.dumps({**report, "query": query})
         
     except Exception as e:
         return json.dumps({
@@ -72,8 +350,127 @@ def execute_sql_query(query: str, connection_string: str) -> str:
         })
 
 @mcp.tool()
-def refine_sql_query(query: str, feedback: str) -> str:
+@executor.offload
+def recommend_indexes(connection_string: str, apply: bool = False) -> str:
+    """Recommend indexes from the logged query shapes.
+    
+    With apply=True the recommended indexes are created, which also requires
+    allow_apply in INDEX_ADVISOR_CONFIG since it writes to the database.
+    """
+    try:
+        db_path = parse_sqlite_path(connection_string)
+        with get_read_only_pool(db_path, **SQL_POOL_CONFIG).connection() as conn:
+            recommendations = index_advisor.recommend(conn, db_path)
+        
+        result = {"recommendations": recommendations, "applied": []}
+        if apply:
+            if not INDEX_ADVISOR_CONFIG.get("allow_apply", False):
+                result["error"] = "Applying indexes is disabled (set allow_apply in INDEX_ADVISOR_CONFIG)"
+            elif recommendations:
+                result["applied"] = index_advisor.apply(db_path, recommendations)
+                shape_log.flush()
+        
+        return json.dumps(result)
+        
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+@mcp.tool()
+@executor.offload
+def query_shape_log(connection_string: str = "", limit: int = 20) -> str:
+    """Most frequent query shapes with their full scans and predicate columns"""
+    db_path = parse_sqlite_path(connection_string) if connection_string else None
+    return json.dumps(shape_log.shapes(db_path, limit))
+
+@mcp.tool()
+@executor.offload
+def refresh_rollups(connection_string: str, rebuild: bool = False) -> str:
+    """Bring the materialized rollups of a database up to date (rebuild=True recomputes them)"""
+    if preaggregator is None:
+        return json.dumps({"error": "Pre-aggregation is disabled"})
+    try:
+        db_path = parse_sqlite_path(connection_string)
+        return json.dumps(preaggregator.refresh_all(db_path, rebuild))
+        
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+@mcp.tool()
+@executor.offload
+def rollup_status(connection_string: str) -> str:
+    """Dimensions, measures, high-water mark and size of each materialized rollup"""
+    if preaggregator is None:
+        return json.dumps({"error": "Pre-aggregation is disabled"})
+    try:
+        db_path = parse_sqlite_path(connection_string)
+        return json.dumps(preaggregator.status(db_path))
+        
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+@mcp.tool()
+@executor.offload
+def refresh_samples(connection_string: str, rebuild: bool = False) -> str:
+    """Feed newly appended rows into the reservoir samples (rebuild=True resamples from scratch)"""
+    if sample_store is None:
+        return json.dumps({"error": "Sampling is disabled"})
+    try:
+        db_path = parse_sqlite_path(connection_string)
+        return json.dumps([
+            sample_store.refresh(db_path, config["table"], rebuild) or {"table": config["table"], "available": False}
+            for config in SAMPLING_CONFIG["tables"]
+        ])
+        
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+@mcp.tool()
+@executor.offload
+def sample_status(connection_string: str) -> str:
+    """Size, population and high-water mark of each table sample"""
+    if sample_store is None:
+        return json.dumps({"error": "Sampling is disabled"})
+    try:
+        db_path = parse_sqlite_path(connection_string)
+        return json.dumps(sample_store.status(db_path))
+        
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+def _describe_database(connection_string: str) -> str:
+    """Schema document of a SQLite database as JSON"""
+    db_path = parse_sqlite_path(connection_string)
+    with get_read_only_pool(db_path, **SQL_POOL_CONFIG).connection() as conn:
+        return json.dumps(schema_introspector.describe(conn, db_path))
+
+@mcp.tool()
+@executor.offload
+def get_database_schema(connection_string: str = "") -> str:
+    """Tables, columns, types, indexes, row counts and low-cardinality column values as JSON.
+    
+    Defaults to the configured analysis database. The document is cached
+    until the database schema changes.
+    """
+    try:
+        return _describe_database(connection_string or ANALYSIS_DATABASE_CONFIG["connection_string"])
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+@mcp.resource("schema://analysis-database")
+@executor.offload
+def analysis_database_schema() -> str:
+    """Schema document of the configured analysis database"""
+    return _describe_database(ANALYSIS_DATABASE_CONFIG["connection_string"])
+
+@mcp.tool()
+@executor.offload
+def refine_sql_query(query: str, feedback: str, connection_string: str = "") -> str:
     """Refine SQL query based on feedback"""
+    namespace = "refine:" + hashlib.sha1(" ".join(query.split()).encode("utf-8")).hexdigest()
+    cached = _cached_sql(namespace, feedback, connection_string)
+    if cached is not None:
+        return cached
+    
     # Get the prompt
     prompt_template = refinement_prompt()
     
@@ -81,15 +478,13 @@ def refine_sql_query(query: str, feedback: str) -> str:
     prompt = prompt_template.replace("{{query}}", query).replace("{{feedback}}", feedback)
     
     # Call LLM
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": prompt}
-        ]
-    )
+    response_text = llm.generate("sql_refinement", prompt, validate=lambda text: _still_valid(text.strip(), connection_string))
     
     # Extract refined SQL query
-    refined_query = response.choices[0].message.content.strip()
+    refined_query = response_text.strip()
+    
+    if sql_cache is not None:
+        sql_cache.store(namespace, feedback, refined_query)
     return refined_query
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+import hashlib
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+from .lexical_index import TOKEN_PATTERN
+
+def simhash(text: str, bits: int = 64) -> int:
+    """Compute a SimHash fingerprint over word unigrams and bigrams"""
+    words = TOKEN_PATTERN.findall(text.lower())
+    features = Counter(words)
+    features.update(" ".join(pair) for pair in zip(words, words[1:]))
+
+    weights = [0] * bits
+    for feature, count in features.items():
+        digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            if digest >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two fingerprints"""
+    return bin(a ^ b).count("1")
+
+class SimHashLSH:
+    """Banded LSH index over SimHash fingerprints.
+
+    The fingerprint is split into max_distance + 1 bands, so by the pigeonhole
+    principle any fingerprint within max_distance bits of an indexed one shares
+    at least one band exactly. Lookups only inspect the matching buckets.
+    """
+
+    def __init__(self, bits: int = 64, max_distance: int = 3):
+        self.bits = bits
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_width = -(-bits // self.bands)
+        self.buckets: Dict[Tuple[int, int], Set[str]] = {}
+        self.fingerprints: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    def _band_keys(self, fingerprint: int) -> List[Tuple[int, int]]:
+        """Split a fingerprint into (band index, band value) bucket keys"""
+        mask = (1 << self.band_width) - 1
+        return [(band, fingerprint >> (band * self.band_width) & mask) for band in range(self.bands)]
+
+    def add(self, item_id: str, fingerprint: int):
+        """Index a fingerprint"""
+        self.remove(item_id)
+        self.fingerprints[item_id] = fingerprint
+        for key in self._band_keys(fingerprint):
+            self.buckets.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id: str) -> bool:
+        """Remove a fingerprint from the index"""
+        fingerprint = self.fingerprints.pop(item_id, None)
+        if fingerprint is None:
+            return False
+
+        for key in self._band_keys(fingerprint):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(item_id)
+                if not bucket:
+                    del self.buckets[key]
+        return True
+
+    def query(self, fingerprint: int) -> List[Tuple[str, int]]:
+        """Return (item_id, distance) pairs within max_distance, closest first"""
+        candidates = set()
+        for key in self._band_keys(fingerprint):
+            candidates.update(self.buckets.get(key, ()))
+
+        matches = []
+        for item_id in candidates:
+            distance = hamming_distance(fingerprint, self.fingerprints[item_id])
+            if distance <= self.max_distance:
+                matches.append((item_id, distance))
+
+        matches.sort(key=lambda match: match[1])
+        return matches
@@ -0,0 +1,92 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple, Optional
+
+# Words too common to be useful as a lexical prefilter
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "show", "the",
+    "to", "was", "what", "which", "with", "you"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase terms, keeping identifiers like product_id intact"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """Incrementally maintained inverted index with BM25 scoring"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Counter] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def add(self, doc_id: str, text: str):
+        """Index a document, replacing any previous version"""
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+
+        terms = Counter(tokenize(text))
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[doc_id]
+
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id: str) -> bool:
+        """Remove a document from the index"""
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return False
+
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+        return True
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return (doc_id, score) pairs for documents sharing terms with the query"""
+        n_docs = len(self.doc_terms)
+        if n_docs == 0:
+            return []
+
+        avg_length = self.total_length / n_docs
+        scores: Dict[str, float] = {}
+
+        # Only documents in the postings of query terms are touched
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+
+            df = len(posting)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+            for doc_id, tf in posting.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit] if limit else ranked
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """Combine several ranked ID lists into a single RRF score per ID"""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused
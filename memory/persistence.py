@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import base64
+import threading
+from typing import Dict, Any, Optional
+import numpy as np
+
+FSYNC_POLICIES = ("always", "batched", "interval")
+
+class MemoryPersistence:
+    """Append-only write-ahead log of memory server mutations, compacted into periodic snapshots"""
+
+    def __init__(self, path: str = "data/memory_state", fsync_policy: str = "batched",
+                 fsync_batch_size: int = 64, fsync_interval: float = 1.0,
+                 snapshot_every: int = 1000, **_):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unsupported fsync policy: {fsync_policy}")
+
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.fsync_batch_size = max(1, fsync_batch_size)
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+
+        self.wal_path = os.path.join(path, "wal.log")
+        self.current_path = os.path.join(path, "CURRENT")
+
+        self.lsn = 0
+        self.records_since_snapshot = 0
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+        os.makedirs(path, exist_ok=True)
+        self._wal = None
+        self._flusher = None
+
+    def recover(self) -> Dict[str, Dict[str, Any]]:
+        """Load the latest snapshot, replay the WAL and return the state dicts"""
+        state = {
+            "conversation_memories": {},
+            "data_artifacts": {},
+            "memory_embeddings": {}
+        }
+
+        snapshot_lsn = self._load_snapshot(state)
+        self.lsn = snapshot_lsn
+
+        # Replay WAL records newer than the snapshot
+        if os.path.exists(self.wal_path):
+            valid_end = 0
+            with open(self.wal_path, "rb") as f:
+                for line in f:
+                    # A record is complete only with its newline
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        # Torn write at the tail of the log, nothing after it is valid
+                        break
+                    valid_end += len(line)
+
+                    if entry["lsn"] <= snapshot_lsn:
+                        continue
+
+                    apply_record(state, entry)
+                    self.lsn = entry["lsn"]
+                    self.records_since_snapshot += 1
+
+            # Cut off a torn tail so new records do not get glued onto it
+            if valid_end < os.path.getsize(self.wal_path):
+                with open(self.wal_path, "r+b") as f:
+                    f.truncate(valid_end)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        self._open_wal()
+        return state
+
+    def append(self, op: str, key: str, record: Optional[Dict[str, Any]] = None,
+               embedding: Optional[np.ndarray] = None) -> int:
+        """Append a mutation to the WAL and return its LSN"""
+        with self._lock:
+            self.lsn += 1
+            entry = {"lsn": self.lsn, "op": op, "key": key}
+
+            if record is not None:
+                entry["record"] = record
+            if embedding is not None:
+                entry["embedding"] = _encode_vector(embedding)
+
+            self._wal.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._wal.flush()
+            self._unsynced += 1
+            self.records_since_snapshot += 1
+
+            if self.fsync_policy == "always" or (
+                self.fsync_policy == "batched" and self._unsynced >= self.fsync_batch_size
+            ):
+                self._sync()
+
+            return self.lsn
+
+    def should_snapshot(self) -> bool:
+        """Check whether enough WAL records have accumulated to compact"""
+        return self.snapshot_every > 0 and self.records_since_snapshot >= self.snapshot_every
+
+    def snapshot(self, conversation_memories: Dict[str, Any], data_artifacts: Dict[str, Any],
+                 memory_embeddings: Dict[str, np.ndarray]) -> int:
+        """Write a compacted snapshot of the full state and truncate the WAL.
+
+        The caller must prevent concurrent mutations while this runs so that
+        the snapshot is consistent with the current LSN.
+        """
+        with self._lock:
+            snapshot_lsn = self.lsn
+
+            ids = list(memory_embeddings.keys())
+            if ids:
+                matrix = np.stack([np.asarray(memory_embeddings[i], dtype=np.float32) for i in ids])
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+
+            vectors_file = f"snapshot-{snapshot_lsn}.npy"
+            meta_file = f"snapshot-{snapshot_lsn}.json"
+
+            # np.save appends .npy to names without it, so write through a file object
+            with open(os.path.join(self.path, vectors_file + ".tmp"), "wb") as f:
+                np.save(f, matrix)
+                f.flush()
+                os.fsync(f.fileno())
+
+            with open(os.path.join(self.path, meta_file + ".tmp"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "lsn": snapshot_lsn,
+                    "ids": ids,
+                    "conversation_memories": conversation_memories,
+                    "data_artifacts": data_artifacts
+                }, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(os.path.join(self.path, vectors_file + ".tmp"), os.path.join(self.path, vectors_file))
+            os.replace(os.path.join(self.path, meta_file + ".tmp"), os.path.join(self.path, meta_file))
+
+            # Atomically point CURRENT at the new snapshot
+            with open(self.current_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(str(snapshot_lsn))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.current_path + ".tmp", self.current_path)
+
+            # Everything in the WAL is now covered by the snapshot
+            self._wal.close()
+            self._wal = open(self.wal_path, "w", encoding="utf-8")
+            self._sync()
+            self.records_since_snapshot = 0
+
+            self._remove_old_snapshots(snapshot_lsn)
+            return snapshot_lsn
+
+    def close(self):
+        """Flush outstanding records and stop the background flusher"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._wal is not None:
+                self._sync()
+                self._wal.close()
+
+    def _open_wal(self):
+        """Open the WAL for appending and start the interval flusher if configured"""
+        self._wal = open(self.wal_path, "a", encoding="utf-8")
+
+        if self.fsync_policy == "interval" and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        """Periodically fsync the WAL for the interval policy"""
+        while True:
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                if self._closed:
+                    return
+                if self._unsynced:
+                    self._sync()
+
+    def _sync(self):
+        """fsync the WAL file; the caller holds the lock"""
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+        self._unsynced = 0
+
+    def _load_snapshot(self, state: Dict[str, Dict[str, Any]]) -> int:
+        """Load the snapshot referenced by CURRENT into state and return its LSN"""
+        if not os.path.exists(self.current_path):
+            return 0
+
+        with open(self.current_path, "r", encoding="utf-8") as f:
+            snapshot_lsn = int(f.read().strip() or 0)
+
+        meta_path = os.path.join(self.path, f"snapshot-{snapshot_lsn}.json")
+        vectors_path = os.path.join(self.path, f"snapshot-{snapshot_lsn}.npy")
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        matrix = np.load(vectors_path)
+
+        state["conversation_memories"].update(meta["conversation_memories"])
+        state["data_artifacts"].update(meta["data_artifacts"])
+        for row, key in enumerate(meta["ids"]):
+            state["memory_embeddings"][key] = matrix[row]
+
+        return snapshot_lsn
+
+    def _remove_old_snapshots(self, keep_lsn: int):
+        """Delete snapshot files superseded by the current one"""
+        keep = {f"snapshot-{keep_lsn}.npy", f"snapshot-{keep_lsn}.json"}
+        for name in os.listdir(self.path):
+            if name.startswith("snapshot-") and name not in keep:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+def apply_record(state: Dict[str, Dict[str, Any]], entry: Dict[str, Any]):
+    """Apply a single WAL record to the in-memory state"""
+    op = entry["op"]
+    key = entry["key"]
+
+    if op in ("store_memory", "update_memory"):
+        state["conversation_memories"][key] = entry["record"]
+    elif op in ("store_data_artifact", "update_data_artifact"):
+        state["data_artifacts"][key] = entry["record"]
+    elif op == "delete":
+        state["conversation_memories"].pop(key, None)
+        state["data_artifacts"].pop(key, None)
+        state["memory_embeddings"].pop(key, None)
+    else:
+        raise ValueError(f"Unknown WAL operation: {op}")
+
+    if "embedding" in entry:
+        state["memory_embeddings"][key] = _decode_vector(entry["embedding"])
+
+def _encode_vector(vector: np.ndarray) -> str:
+    """Encode a vector as base64 float32 bytes"""
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+def _decode_vector(data: str) -> np.ndarray:
+    """Decode a vector written by _encode_vector"""
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).copy()
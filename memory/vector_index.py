@@ -0,0 +1,200 @@
+from typing import Dict, List, Iterator, Optional, Tuple
+import numpy as np
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# Rows upcast at once when scoring quantized vectors
+SCORE_BLOCK_ROWS = 4096
+
+class EmbeddingIndex:
+    """Contiguous, optionally quantized store of unit-normalized embeddings.
+
+    Vectors live in one preallocated matrix instead of one ndarray per memory.
+    With dtype "float16" each vector takes half the space; with "int8" each
+    vector is scalar-quantized against its own max-abs scale and takes a
+    quarter. Similarities are computed on the stored data directly. When
+    rerank is enabled a float32 copy is kept and the top candidates are
+    rescored exactly, trading the memory savings for full precision.
+
+    The index behaves like a dict of id -> float32 vector so it can stand in
+    for the plain dict the memory server used before.
+    """
+
+    def __init__(self, dimension: int, dtype: str = "float32", rerank: bool = False,
+                 rerank_candidates: int = 50, initial_capacity: int = 1024):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+
+        self.dimension = dimension
+        self.dtype = dtype
+        self.rerank = rerank and dtype != "float32"
+        self.rerank_candidates = rerank_candidates
+
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self._vectors = np.zeros((initial_capacity, dimension), dtype=dtype)
+        self._scales = np.ones(initial_capacity, dtype=np.float32)
+        self._full = np.zeros((initial_capacity, dimension), dtype=np.float32) if self.rerank else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.positions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.ids))
+
+    def __getitem__(self, item_id: str) -> np.ndarray:
+        return self._dequantize(self.positions[item_id])
+
+    def __setitem__(self, item_id: str, vector: np.ndarray):
+        self.add(item_id, vector)
+
+    def keys(self) -> List[str]:
+        return list(self.ids)
+
+    def items(self) -> Iterator[Tuple[str, np.ndarray]]:
+        for item_id in list(self.ids):
+            yield item_id, self[item_id]
+
+    def update(self, other: Dict[str, np.ndarray]):
+        for item_id, vector in other.items():
+            self.add(item_id, vector)
+
+    def pop(self, item_id: str, default=None):
+        if item_id not in self.positions:
+            return default
+        vector = self[item_id]
+        self.remove(item_id)
+        return vector
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the stored vectors (excluding unused capacity)"""
+        count = len(self.ids)
+        total = count * self.dimension * self._vectors.itemsize
+        if self.dtype == "int8":
+            total += count * self._scales.itemsize
+        if self._full is not None:
+            total += count * self.dimension * self._full.itemsize
+        return total
+
+    def add(self, item_id: str, vector: np.ndarray):
+        """Insert or replace a vector"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        unit = vector / norm if norm > 0 else vector
+
+        if item_id in self.positions:
+            row = self.positions[item_id]
+        else:
+            row = len(self.ids)
+            if row == self._vectors.shape[0]:
+                self._grow()
+            self.ids.append(item_id)
+            self.positions[item_id] = row
+
+        if self.dtype == "int8":
+            scale = float(np.abs(unit).max()) / 127 if norm > 0 else 1.0
+            self._vectors[row] = np.round(unit / scale).astype(np.int8)
+            self._scales[row] = scale
+        else:
+            self._vectors[row] = unit
+
+        if self._full is not None:
+            self._full[row] = unit
+
+    def remove(self, item_id: str) -> bool:
+        """Remove a vector, moving the last row into its slot"""
+        row = self.positions.pop(item_id, None)
+        if row is None:
+            return False
+
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self._vectors[row] = self._vectors[last]
+            self._scales[row] = self._scales[last]
+            if self._full is not None:
+                self._full[row] = self._full[last]
+            self.ids[row] = moved_id
+            self.positions[moved_id] = row
+        self.ids.pop()
+        return True
+
+    def similarities(self, query: np.ndarray, item_ids: List[str]) -> np.ndarray:
+        """Cosine similarity between the query and each listed vector"""
+        if not item_ids:
+            return np.zeros(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        rows = np.fromiter((self.positions[item_id] for item_id in item_ids), dtype=np.int64, count=len(item_ids))
+
+        # Score directly on the stored representation, a block at a time so
+        # the upcast to float32 for BLAS never materializes the whole matrix
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block = rows[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = self._vectors[block].astype(np.float32, copy=False) @ query
+        if self.dtype == "int8":
+            scores *= self._scales[rows]
+
+        # Rescore the best approximate candidates at full precision
+        if self._full is not None and len(rows) > 0:
+            top = np.argsort(-scores)[:self.rerank_candidates]
+            scores[top] = self._full[rows[top]] @ query
+
+        return scores
+
+    def search(self, query: np.ndarray, limit: int = 10,
+               item_ids: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Return the (id, similarity) pairs closest to the query"""
+        candidates = list(self.ids) if item_ids is None else item_ids
+        scores = self.similarities(query, candidates)
+        order = np.argsort(-scores)[:limit]
+        return [(candidates[i], float(scores[i])) for i in order]
+
+    def _dequantize(self, row: int) -> np.ndarray:
+        """Reconstruct the float32 unit vector stored at a row"""
+        if self._full is not None:
+            return self._full[row].copy()
+        vector = self._vectors[row].astype(np.float32)
+        if self.dtype == "int8":
+            vector *= self._scales[row]
+        return vector
+
+    def _grow(self):
+        """Double the capacity of the backing arrays"""
+        capacity = self._vectors.shape[0] * 2
+        self._vectors = _resize(self._vectors, capacity)
+        self._scales = np.concatenate([self._scales, np.ones(capacity - len(self._scales), dtype=np.float32)])
+        if self._full is not None:
+            self._full = _resize(self._full, capacity)
+
+def _resize(matrix: np.ndarray, capacity: int) -> np.ndarray:
+    """Copy a matrix into a larger zero-filled one"""
+    resized = np.zeros((capacity, matrix.shape[1]), dtype=matrix.dtype)
+    resized[:matrix.shape[0]] = matrix
+    return resized
+
+def measure_recall(vectors: np.ndarray, queries: np.ndarray, dtype: str,
+                   k: int = 10, rerank: bool = False) -> float:
+    """Recall@k of a quantized index against exact float32 search"""
+    exact = EmbeddingIndex(vectors.shape[1], "float32", initial_capacity=len(vectors))
+    approx = EmbeddingIndex(vectors.shape[1], dtype, rerank=rerank, initial_capacity=len(vectors))
+    for i, vector in enumerate(vectors):
+        exact.add(str(i), vector)
+        approx.add(str(i), vector)
+
+    hits = 0
+    for query in queries:
+        truth = {item_id for item_id, _ in exact.search(query, k)}
+        found = {item_id for item_id, _ in approx.search(query, k)}
+        hits += len(truth & found)
+
+    return hits / (k * len(queries))
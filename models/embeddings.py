@@ -1,6 +1,7 @@
 
 from abc import ABC, abstractmethod
 from typing import List, Union, Dict, Any
+import threading
 import numpy as np
 
 class EmbeddingModel(ABC):
@@ -49,3 +50,14 @@ def get_embedding_model(config: Dict[str, Any] = None) -> EmbeddingModel:
         return SentenceTransformerEmbedding(model_name)
     else:
         raise ValueError(f"Unsupported embedding provider: {provider}")
+
+_shared_models: Dict[tuple, EmbeddingModel] = {}
+_shared_models_lock = threading.Lock()
+
+def get_shared_embedding_model(config: Dict[str, Any] = None) -> EmbeddingModel:
+    """Like get_embedding_model, but loads each configured model once per process"""
+    key = tuple(sorted((config or {}).items()))
+    with _shared_models_lock:
+        if key not in _shared_models:
+            _shared_models[key] = get_embedding_model(config)
+        return _shared_models[key]
@@ -1,10 +1,112 @@
 
+import time
+import asyncio
+import threading
+import contextvars
+import weakref
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from typing import Dict, Any, List, Optional, Union, Callable, Awaitable, AsyncIterator, Tuple
+
+from .llm_cache import LLMResponseCache
+from .llm_limits import LLMRateLimiter
+from ..utils.llm_output import estimate_tokens
+
+_clients: Dict[tuple, Any] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, Any]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+def _shared_client(key: tuple, factory: Callable[[], Any]) -> Any:
+    """Long-lived provider client, created once per process and reused by every service"""
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+def _shared_async_client(key: tuple, factory: Callable[[], Any]) -> Any:
+    """Long-lived async client for the running event loop (async connection pools are bound to one loop)"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = factory()
+        return clients[key]
 
 class LLMService(ABC):
     """Abstract base class for LLM services"""
     
+    provider = ""
+    cache: Optional[LLMResponseCache] = None
+    limiter: Optional[LLMRateLimiter] = None
+    latency: Optional["LatencyTracker"] = None
+    
+    @property
+    def name(self) -> str:
+        """Provider and model, e.g. for latency statistics"""
+        return f"{self.provider}:{getattr(self, 'model', '')}"
+    
+    @staticmethod
+    def _token_estimate(request: Dict[str, Any]) -> Tuple[int, Optional[int]]:
+        """Estimated prompt tokens and the completion token limit of a request"""
+        text = "".join(str(message.get("content", "")) for message in request.get("messages", []))
+        return estimate_tokens(text), request.get("max_tokens")
+    
+    def _limited(self, request: Dict[str, Any], call: Callable[[], Any]) -> Callable[[], Any]:
+        """A provider call that runs within the rate limiter and records its latency"""
+        if self.latency is not None:
+            untimed = call
+            
+            def call() -> Any:
+                started = time.monotonic()
+                result = untimed()
+                self.latency.record(self.name, time.monotonic() - started)
+                return result
+        
+        if self.limiter is None:
+            return call
+        return lambda: self.limiter.call(self.provider, call, *self._token_estimate(request))
+    
+    def _cached(self, request: Dict[str, Any], call: Callable[[], Any], bypass: bool = False,
+                validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Serve a request from the response cache, calling the provider (rate limited) on a miss.
+        
+        Responses validate rejects are not cached.
+        """
+        call = self._limited(request, call)
+        if self.cache is None:
+            return call()
+        return self.cache.cached({"provider": self.provider, **request}, call, bypass, validate)
+    
+    async def _acached(self, request: Dict[str, Any], call: Callable[[], Awaitable[Any]], bypass: bool = False,
+                       validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """_cached() for coroutine calls"""
+        if self.latency is not None:
+            untimed = call
+            
+            async def call() -> Any:
+                started = time.monotonic()
+                result = await untimed()
+                self.latency.record(self.name, time.monotonic() - started)
+                return result
+        
+        if self.limiter is not None:
+            unlimited = call
+            call = lambda: self.limiter.acall(self.provider, unlimited, *self._token_estimate(request))
+        if self.cache is None:
+            return await call()
+        return await self.cache.acached({"provider": self.provider, **request}, call, bypass, validate)
+    
+    def _astream_cached(self, request: Dict[str, Any], stream: Callable[[], AsyncIterator[str]],
+                        bypass: bool = False) -> AsyncIterator[str]:
+        """Stream through the response cache; a hit arrives as a single chunk"""
+        if self.limiter is not None:
+            unlimited = stream
+            stream = lambda: self.limiter.astream(self.provider, unlimited, *self._token_estimate(request))
+        if self.cache is None:
+            return stream()
+        return self.cache.astream_cached({"provider": self.provider, **request}, stream, bypass)
+    
     @abstractmethod
     def generate(self, prompt: str, **kwargs) -> str:
         """Generate text from a prompt"""
@@ -14,20 +116,42 @@ class LLMService(ABC):
     def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
         """Generate text with potential tool calls"""
         pass
+    
+    @abstractmethod
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        """Generate text from a prompt without blocking the event loop"""
+        pass
+    
+    @abstractmethod
+    def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Generate text from a prompt, yielding chunks as they arrive"""
+        pass
 
 class OpenAIService(LLMService):
     """OpenAI API service"""
     
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        """Initialize with API key and model"""
-        import openai
-        openai.api_key = api_key
+    provider = "openai"
+    
+    def __init__(self, api_key: str, model: str = "gpt-4", cache: Optional[LLMResponseCache] = None,
+                 limiter: Optional[LLMRateLimiter] = None):
+        """Initialize with API key, model, an optional response cache and an optional rate limiter"""
+        self.api_key = api_key
         self.model = model
+        self.cache = cache
+        self.limiter = limiter
     
-    def generate(self, prompt: str, **kwargs) -> str:
-        """Generate text from a prompt"""
+    def _client(self):
+        """Shared synchronous client for this API key"""
         import openai
-        
+        return _shared_client(("openai", self.api_key), lambda: openai.OpenAI(api_key=self.api_key))
+    
+    def _async_client(self):
+        """Shared async client for this API key and event loop"""
+        import openai
+        return _shared_async_client(("openai", self.api_key), lambda: openai.AsyncOpenAI(api_key=self.api_key))
+    
+    def _request(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Chat completion request for a plain prompt"""
         # Set default parameters
         params = {
             "model": self.model,
@@ -36,22 +160,54 @@ class OpenAIService(LLMService):
             **kwargs
         }
         
-        # Call the API
-        response = openai.ChatCompletion.create(
-            model=params["model"],
-            messages=[
+        return {
+            "model": params["model"],
+            "messages": [
                 {"role": "system", "content": "You are a helpful assistant."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=params["max_tokens"],
-            temperature=params["temperature"]
-        )
+            "max_tokens": params["max_tokens"],
+            "temperature": params["temperature"]
+        }
+    
+    def generate(self, prompt: str, bypass_cache: bool = False, validate: Optional[Callable[[str], bool]] = None,
+                 **kwargs) -> str:
+        """Generate text from a prompt"""
+        request = self._request(prompt, kwargs)
         
-        return response.choices[0].message.content
+        # Call the API
+        def call() -> str:
+            response = self._client().chat.completions.create(**request)
+            return response.choices[0].message.content
+        
+        return self._cached(request, call, bypass_cache, validate)
     
-    def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+    async def agenerate(self, prompt: str, bypass_cache: bool = False,
+                        validate: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+        """Generate text from a prompt without blocking the event loop"""
+        request = self._request(prompt, kwargs)
+        
+        async def call() -> str:
+            response = await self._async_client().chat.completions.create(**request)
+            return response.choices[0].message.content
+        
+        return await self._acached(request, call, bypass_cache, validate)
+    
+    def astream(self, prompt: str, bypass_cache: bool = False, **kwargs) -> AsyncIterator[str]:
+        """Generate text from a prompt, yielding chunks as they arrive"""
+        request = self._request(prompt, kwargs)
+        
+        async def stream() -> AsyncIterator[str]:
+            chunks = await self._async_client().chat.completions.create(**request, stream=True)
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        
+        return self._astream_cached(request, stream, bypass_cache)
+    
+    def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], bypass_cache: bool = False,
+                            **kwargs) -> Dict[str, Any]:
         """Generate text with potential tool calls"""
-        import openai
         import json
         
         # Format tools for OpenAI API
@@ -75,46 +231,63 @@ class OpenAIService(LLMService):
             **kwargs
         }
         
-        # Call the API
-        response = openai.ChatCompletion.create(
-            model=params["model"],
-            messages=[
+        request = {
+            "model": params["model"],
+            "messages": [
                 {"role": "system", "content": "You are a helpful assistant with access to tools."},
                 {"role": "user", "content": prompt}
             ],
-            tools=formatted_tools,
-            max_tokens=params["max_tokens"],
-            temperature=params["temperature"]
-        )
+            "tools": formatted_tools,
+            "max_tokens": params["max_tokens"],
+            "temperature": params["temperature"]
+        }
         
-        message = response.choices[0].message
+        # Call the API
+        def call() -> Dict[str, Any]:
+            response = self._client().chat.completions.create(**request)
+            message = response.choices[0].message
+            
+            # Check if the model wants to call a tool
+            if hasattr(message, 'tool_calls') and message.tool_calls:
+                tool_call = message.tool_calls[0]
+                return {
+                    "type": "tool_call",
+                    "tool": tool_call.function.name,
+                    "arguments": json.loads(tool_call.function.arguments)
+                }
+            else:
+                return {
+                    "type": "text",
+                    "content": message.content
+                }
         
-        # Check if the model wants to call a tool
-        if hasattr(message, 'tool_calls') and message.tool_calls:
-            tool_call = message.tool_calls[0]
-            return {
-                "type": "tool_call",
-                "tool": tool_call.function.name,
-                "arguments": json.loads(tool_call.function.arguments)
-            }
-        else:
-            return {
-                "type": "text",
-                "content": message.content
-            }
+        return self._cached(request, call, bypass_cache)
 
 class AnthropicService(LLMService):
     """Anthropic API service"""
     
-    def __init__(self, api_key: str, model: str = "claude-2"):
-        """Initialize with API key and model"""
+    provider = "anthropic"
+    
+    def __init__(self, api_key: str, model: str = "claude-2", cache: Optional[LLMResponseCache] = None,
+                 limiter: Optional[LLMRateLimiter] = None):
+        """Initialize with API key, model, an optional response cache and an optional rate limiter"""
         self.api_key = api_key
         self.model = model
+        self.cache = cache
+        self.limiter = limiter
     
-    def generate(self, prompt: str, **kwargs) -> str:
-        """Generate text from a prompt"""
+    def _client(self):
+        """Shared synchronous client for this API key"""
         import anthropic
-        
+        return _shared_client(("anthropic", self.api_key), lambda: anthropic.Anthropic(api_key=self.api_key))
+    
+    def _async_client(self):
+        """Shared async client for this API key and event loop"""
+        import anthropic
+        return _shared_async_client(("anthropic", self.api_key), lambda: anthropic.AsyncAnthropic(api_key=self.api_key))
+    
+    def _params(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Completion parameters and their cache key request for a plain prompt"""
         # Set default parameters
         params = {
             "max_tokens": 1000,
@@ -122,20 +295,57 @@ class AnthropicService(LLMService):
             **kwargs
         }
         
+        completion = {
+            "model": self.model,
+            "prompt": f"\n\nHuman: {prompt}\n\nAssistant:",
+            "max_tokens_to_sample": params["max_tokens"],
+            "temperature": params["temperature"]
+        }
+        request = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": params["max_tokens"],
+            "temperature": params["temperature"]
+        }
+        return {"completion": completion, "request": request}
+    
+    def generate(self, prompt: str, bypass_cache: bool = False, validate: Optional[Callable[[str], bool]] = None,
+                 **kwargs) -> str:
+        """Generate text from a prompt"""
+        params = self._params(prompt, kwargs)
+        
         # Call the API
-        client = anthropic.Anthropic(api_key=self.api_key)
-        response = client.completions.create(
-            model=self.model,
-            prompt=f"\n\nHuman: {prompt}\n\nAssistant:",
-            max_tokens_to_sample=params["max_tokens"],
-            temperature=params["temperature"]
-        )
+        def call() -> str:
+            return self._client().completions.create(**params["completion"]).completion
         
-        return response.completion
+        return self._cached(params["request"], call, bypass_cache, validate)
     
-    def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+    async def agenerate(self, prompt: str, bypass_cache: bool = False,
+                        validate: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+        """Generate text from a prompt without blocking the event loop"""
+        params = self._params(prompt, kwargs)
+        
+        async def call() -> str:
+            response = await self._async_client().completions.create(**params["completion"])
+            return response.completion
+        
+        return await self._acached(params["request"], call, bypass_cache, validate)
+    
+    def astream(self, prompt: str, bypass_cache: bool = False, **kwargs) -> AsyncIterator[str]:
+        """Generate text from a prompt, yielding chunks as they arrive"""
+        params = self._params(prompt, kwargs)
+        
+        async def stream() -> AsyncIterator[str]:
+            events = await self._async_client().completions.create(**params["completion"], stream=True)
+            async for event in events:
+                if event.completion:
+                    yield event.completion
+        
+        return self._astream_cached(params["request"], stream, bypass_cache)
+    
+    def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], bypass_cache: bool = False,
+                            **kwargs) -> Dict[str, Any]:
         """Generate text with potential tool calls - note: not all models support this"""
-        import anthropic
         import json
         import re
         
@@ -176,16 +386,26 @@ class AnthropicService(LLMService):
         }
         
         # Call the API
-        client = anthropic.Anthropic(api_key=self.api_key)
-        response = client.completions.create(
-            model=self.model,
-            prompt=tool_prompt,
-            max_tokens_to_sample=params["max_tokens"],
-            temperature=params["temperature"]
-        )
+        def call() -> str:
+            response = self._client().completions.create(
+                model=self.model,
+                prompt=tool_prompt,
+                max_tokens_to_sample=params["max_tokens"],
+                temperature=params["temperature"]
+            )
+            return response.completion
+        
+        request = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": tool_prompt}],
+            "tools": tools,
+            "max_tokens": params["max_tokens"],
+            "temperature": params["temperature"]
+        }
+        completion = self._cached(request, call, bypass_cache)
         
         # Parse the response to check for tool call
-        tool_call_match = re.search(r"<tool>(.*?)</tool>", response.completion, re.DOTALL)
+        tool_call_match = re.search(r"<tool>(.*?)</tool>", completion, re.DOTALL)
         
         if tool_call_match:
             try:
@@ -199,36 +419,83 @@ class AnthropicService(LLMService):
                 # If we can't parse the JSON, treat it as regular text
                 return {
                     "type": "text",
-                    "content": response.completion
+                    "content": completion
                 }
         else:
             return {
                 "type": "text",
-                "content": response.completion
+                "content": completion
             }
 
 class OllamaService(LLMService):
     """Ollama local LLM service"""
     
-    def __init__(self, model: str = "gemma3:4b-it-qat"):
-        """Initialize with model name"""
+    provider = "ollama"
+    
+    def __init__(self, model: str = "gemma3:4b-it-qat", cache: Optional[LLMResponseCache] = None,
+                 limiter: Optional[LLMRateLimiter] = None):
+        """Initialize with model name, an optional response cache and an optional rate limiter"""
         self.model = model
+        self.cache = cache
+        self.limiter = limiter
     
-    def generate(self, prompt: str, **kwargs) -> str:
-        """Generate text from a prompt"""
+    def _client(self):
+        """Shared synchronous client for the local Ollama server"""
         import ollama
+        return _shared_client(("ollama",), ollama.Client)
+    
+    def _async_client(self):
+        """Shared async client for the local Ollama server and event loop"""
+        import ollama
+        return _shared_async_client(("ollama",), ollama.AsyncClient)
+    
+    def _request(self, prompt: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Chat request for a prompt; temperature is passed as a model option"""
+        request = {
+            "model": kwargs.get("model", self.model),
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        if kwargs.get("temperature") is not None:
+            request["options"] = {"temperature": kwargs["temperature"]}
+        return request
+    
+    def generate(self, prompt: str, bypass_cache: bool = False, validate: Optional[Callable[[str], bool]] = None,
+                 **kwargs) -> str:
+        """Generate text from a prompt"""
+        request = self._request(prompt, kwargs)
         
         # Call the API
-        response = ollama.chat(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        def call() -> str:
+            response = self._client().chat(**request)
+            return response['message']['content']
         
-        return response['message']['content']
+        return self._cached(request, call, bypass_cache, validate)
     
-    def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+    async def agenerate(self, prompt: str, bypass_cache: bool = False,
+                        validate: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+        """Generate text from a prompt without blocking the event loop"""
+        request = self._request(prompt, kwargs)
+        
+        async def call() -> str:
+            response = await self._async_client().chat(**request)
+            return response['message']['content']
+        
+        return await self._acached(request, call, bypass_cache, validate)
+    
+    def astream(self, prompt: str, bypass_cache: bool = False, **kwargs) -> AsyncIterator[str]:
+        """Generate text from a prompt, yielding chunks as they arrive"""
+        request = self._request(prompt, kwargs)
+        
+        async def stream() -> AsyncIterator[str]:
+            async for part in await self._async_client().chat(**request, stream=True):
+                if part['message']['content']:
+                    yield part['message']['content']
+        
+        return self._astream_cached(request, stream, bypass_cache)
+    
+    def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], bypass_cache: bool = False,
+                            **kwargs) -> Dict[str, Any]:
         """Generate text with potential tool calls"""
-        import ollama
         import json
         import re
         
@@ -260,13 +527,14 @@ class OllamaService(LLMService):
         User query: {prompt}
         """
         
+        request = self._request(tool_prompt, kwargs)
+        
         # Call the API
-        response = ollama.chat(
-            model=self.model,
-            messages=[{"role": "user", "content": tool_prompt}]
-        )
+        def call() -> str:
+            response = self._client().chat(**request)
+            return response['message']['content']
         
-        response_text = response['message']['content']
+        response_text = self._cached({**request, "tools": tools}, call, bypass_cache)
         
         # Check for JSON tool call pattern
         json_pattern = r"```json\s*(.*?)\s*```"
@@ -292,20 +560,409 @@ class OllamaService(LLMService):
                 "content": response_text
             }
 
-def get_llm_service(config: Dict[str, Any]) -> LLMService:
-    """Factory function to get an LLM service based on configuration"""
+def get_llm_service(config: Dict[str, Any], cache: Optional[LLMResponseCache] = None,
+                    limiter: Optional[LLMRateLimiter] = None) -> LLMService:
+    """Factory function to get an LLM service based on configuration, optionally with a response cache and rate limiter"""
     provider = config.get("provider", "ollama").lower()
     
+    # Provider configs name their model "default_model"; stage overrides use "model"
+    model = config.get("model", config.get("default_model"))
+    
     if provider == "openai":
         api_key = config.get("api_key", "")
-        model = config.get("model", "gpt-4")
-        return OpenAIService(api_key, model)
+        return OpenAIService(api_key, model or "gpt-4", cache, limiter)
     elif provider == "anthropic":
         api_key = config.get("api_key", "")
-        model = config.get("model", "claude-2")
-        return AnthropicService(api_key, model)
+        return AnthropicService(api_key, model or "claude-2", cache, limiter)
     elif provider == "ollama":
-        model = config.get("model", "gemma3:4b-it-qat")
-        return OllamaService(model)
+        return OllamaService(model or "gemma3:4b-it-qat", cache, limiter)
     else:
         raise ValueError(f"Unsupported LLM provider: {provider}")
+
+class LatencyTracker:
+    """Latencies of recent provider calls per service, for percentile estimates"""
+    
+    def __init__(self, window: int = 500):
+        self.window = window
+        
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, name: str, seconds: float):
+        """Add the latency of a completed call"""
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+    
+    def percentile(self, name: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """The q-quantile of a service's recent latencies, or None with fewer than min_samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Sample count, median and p95 per service"""
+        with self._lock:
+            names = list(self._samples)
+        return {
+            name: {
+                "samples": len(self._samples[name]),
+                "p50": self.percentile(name, 0.5),
+                "p95": self.percentile(name, 0.95)
+            }
+            for name in names
+        }
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    """Thread pool that runs the competing synchronous calls of hedged requests"""
+    global _hedge_pool
+    with _clients_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+        return _hedge_pool
+
+class HedgedLLMService(LLMService):
+    """Sends a request to a primary service and hedges it with fallbacks.
+    
+    If the latest service tried has not answered by its recent latency
+    percentile (default_delay_seconds until min_samples calls are known),
+    the same request also goes to the next fallback; an error or an invalid
+    answer (empty, or rejected by the caller's validate function) moves on
+    to the next one immediately. The first valid
+    answer wins and the calls still running are cancelled; synchronous
+    calls cannot be interrupted, so theirs are left to finish in the
+    background, where they still fill the response cache. Streams fail over
+    but are not hedged.
+    """
+    
+    def __init__(self, primary: LLMService, fallbacks: List[LLMService], latency: "LatencyTracker",
+                 percentile: float = 0.95, min_samples: int = 20, default_delay_seconds: float = 15.0):
+        self.primary = primary
+        self.fallbacks = fallbacks
+        self.latency = latency
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay_seconds = default_delay_seconds
+        
+        self.provider = primary.provider
+        self.model = getattr(primary, "model", "")
+        self.hedged = 0
+        self.failovers = 0
+    
+    @property
+    def services(self) -> List[LLMService]:
+        """The primary followed by the fallbacks, in hedging order"""
+        return [self.primary] + self.fallbacks
+    
+    def _delay(self, service: LLMService) -> float:
+        """How long to wait for a service before hedging it"""
+        delay = self.latency.percentile(service.name, self.percentile, self.min_samples)
+        return self.default_delay_seconds if delay is None else delay
+    
+    @staticmethod
+    def _valid(result: Any, validate: Optional[Callable[[Any], bool]] = None) -> bool:
+        """Whether an answer may win: non-empty text (that validate accepts) or a tool-call response"""
+        if isinstance(result, str):
+            return bool(result.strip()) and (validate is None or validate(result))
+        return result is not None
+    
+    @staticmethod
+    def _exhausted(last_error: Optional[BaseException]) -> BaseException:
+        """The error to raise when no service produced a result"""
+        return last_error if last_error is not None else RuntimeError("No LLM service produced a response")
+    
+    def _hedge(self, call: Callable[[LLMService], Any], validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Run call on the services in turn, hedging slow ones, and return the first valid result"""
+        pool = _hedge_executor()
+        services = self.services
+        pending = set()
+        launched = 0
+        deadline = 0.0
+        last_error: Optional[BaseException] = None
+        last_invalid: Any = None
+        invalid_seen = False
+        
+        def launch():
+            # The call keeps the caller's context, e.g. its llm_priority
+            nonlocal launched, deadline
+            service = services[launched]
+            pending.add(pool.submit(contextvars.copy_context().run, call, service))
+            deadline = time.monotonic() + self._delay(service)
+            launched += 1
+        
+        launch()
+        try:
+            while pending:
+                timeout = max(0.0, deadline - time.monotonic()) if launched < len(services) else None
+                done, _ = wait_futures(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    self.hedged += 1
+                    launch()
+                    continue
+                
+                for future in done:
+                    pending.discard(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if self._valid(result, validate):
+                        return result
+                    last_invalid = result
+                    invalid_seen = True
+                
+                if not pending and launched < len(services):
+                    self.failovers += 1
+                    launch()
+        finally:
+            for future in pending:
+                future.cancel()
+        
+        if invalid_seen:
+            return last_invalid
+        raise self._exhausted(last_error)
+    
+    async def _ahedge(self, call: Callable[[LLMService], Awaitable[Any]],
+                      validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """_hedge() for coroutine calls; losing calls are cancelled"""
+        services = self.services
+        pending = set()
+        launched = 0
+        deadline = 0.0
+        last_error: Optional[BaseException] = None
+        last_invalid: Any = None
+        invalid_seen = False
+        
+        def launch():
+            nonlocal launched, deadline
+            service = services[launched]
+            pending.add(asyncio.ensure_future(call(service)))
+            deadline = time.monotonic() + self._delay(service)
+            launched += 1
+        
+        launch()
+        try:
+            while pending:
+                timeout = max(0.0, deadline - time.monotonic()) if launched < len(services) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedged += 1
+                    launch()
+                    continue
+                
+                for task in done:
+                    pending.discard(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if self._valid(result, validate):
+                        return result
+                    last_invalid = result
+                    invalid_seen = True
+                
+                if not pending and launched < len(services):
+                    self.failovers += 1
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        if invalid_seen:
+            return last_invalid
+        raise self._exhausted(last_error)
+    
+    def generate(self, prompt: str, validate: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+        """Generate text from a prompt on whichever service answers validly first"""
+        return self._hedge(lambda service: service.generate(prompt, validate=validate, **kwargs), validate)
+    
+    def generate_with_tools(self, prompt: str, tools: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        """Generate text with potential tool calls on whichever service answers validly first"""
+        return self._hedge(lambda service: service.generate_with_tools(prompt, tools, **kwargs))
+    
+    async def agenerate(self, prompt: str, validate: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+        """Generate text from a prompt without blocking the event loop, hedging slow services"""
+        return await self._ahedge(lambda service: service.agenerate(prompt, validate=validate, **kwargs), validate)
+    
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Stream from the first service that starts answering, failing over on errors before the first chunk"""
+        last_error: Optional[BaseException] = None
+        for index, service in enumerate(self.services):
+            started = False
+            try:
+                async for chunk in service.astream(prompt, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                last_error = e
+                if index + 1 < len(self.services):
+                    self.failovers += 1
+        raise self._exhausted(last_error)
+
+class StageLLMServices:
+    """The configured LLM service of every pipeline stage, shared by a whole process.
+    
+    Each stage's configuration comes from stage_config(stage), which routes
+    it to a model tier; stages that resolve to the same provider, model and
+    key share one service instance (and so its long-lived clients), and
+    temperature/max_tokens are applied per call. When a stage on a cheaper
+    tier fails, or its output is rejected by the caller's validate function,
+    the request is retried once on stage_config(stage, escalation_tier).
+    Responses validate rejects are never stored in the response cache.
+    With fallback_configs, every stage's service is hedged with the
+    fallbacks (see HedgedLLMService and LLM_HEDGING_CONFIG).
+    """
+    
+    def __init__(self, stage_config: Callable[..., Dict[str, Any]], cache: Optional[LLMResponseCache] = None,
+                 escalation_tier: Optional[str] = "large", limiter: Optional[LLMRateLimiter] = None,
+                 fallback_configs: Optional[List[Dict[str, Any]]] = None, hedging: Optional[Dict[str, Any]] = None):
+        self.stage_config = stage_config
+        self.cache = cache
+        self.escalation_tier = escalation_tier
+        self.limiter = limiter
+        self.fallback_configs = fallback_configs or []
+        self.hedging = hedging or {}
+        
+        self.latency = LatencyTracker(self.hedging.get("latency_window", 500))
+        self._services: Dict[tuple, LLMService] = {}
+        self._hedged: Dict[Tuple[int, int], HedgedLLMService] = {}
+        self._lock = threading.Lock()
+        self.escalations: Dict[str, int] = {}
+    
+    def _service(self, config: Dict[str, Any]) -> LLMService:
+        """The shared provider service for a configuration"""
+        key = (config.get("provider"), config.get("model", config.get("default_model")), config.get("api_key"))
+        with self._lock:
+            if key not in self._services:
+                service = get_llm_service(config, self.cache, self.limiter)
+                service.latency = self.latency
+                self._services[key] = service
+            return self._services[key]
+    
+    def _resolve(self, config: Dict[str, Any], exclude: Optional[LLMService] = None) -> Tuple[LLMService, Dict[str, Any]]:
+        """The shared (hedged, if fallbacks are configured) service for a configuration and the per-call parameters it sets.
+        
+        exclude is a provider service that must not be used as a fallback.
+        """
+        service = self._service(config)
+        fallbacks = [
+            fallback for fallback in map(self._service, self.fallback_configs)
+            if fallback is not service and fallback is not exclude
+        ]
+        if fallbacks:
+            key = (id(service), id(exclude))
+            with self._lock:
+                if key not in self._hedged:
+                    self._hedged[key] = HedgedLLMService(
+                        service, fallbacks, self.latency, self.hedging.get("percentile", 0.95),
+                        self.hedging.get("min_samples", 20), self.hedging.get("default_delay_seconds", 15.0)
+                    )
+                service = self._hedged[key]
+        params = {name: config[name] for name in ("temperature", "max_tokens") if config.get(name) is not None}
+        return service, params
+    
+    def service(self, stage: str) -> Tuple[LLMService, Dict[str, Any]]:
+        """The service for a stage and the per-call parameters it is configured with"""
+        return self._resolve(self.stage_config(stage))
+    
+    def models(self, stage: str) -> List[str]:
+        """Names of every model a stage's prompt may be sent to: its tier's, the escalation tier's and the fallbacks'"""
+        configs = [self.stage_config(stage)] + self.fallback_configs
+        if self.escalation_tier is not None:
+            configs.append(self.stage_config(stage, self.escalation_tier))
+        models = [config.get("model", config.get("default_model")) for config in configs]
+        return list(dict.fromkeys(model for model in models if model))
+    
+    @staticmethod
+    def _provider_service(service: LLMService) -> LLMService:
+        """The provider service behind a possibly hedged service"""
+        return service.primary if isinstance(service, HedgedLLMService) else service
+    
+    def _escalation(self, stage: str, service: LLMService) -> Optional[Tuple[LLMService, Dict[str, Any]]]:
+        """The escalation tier's service for a stage, or None if the stage already runs on it.
+        
+        The tier escalated from is not hedged with, since its answer is the one being retried.
+        """
+        if self.escalation_tier is None:
+            return None
+        current = self._provider_service(service)
+        escalated = self._resolve(self.stage_config(stage, self.escalation_tier), exclude=current)
+        return None if self._provider_service(escalated[0]) is current else escalated
+    
+    def _count_escalation(self, stage: str):
+        """Record that a stage was retried on the escalation tier"""
+        with self._lock:
+            self.escalations[stage] = self.escalations.get(stage, 0) + 1
+    
+    def generate(self, stage: str, prompt: str, validate: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+        """Generate text for a stage, escalating if its tier fails or validate rejects the text"""
+        service, params = self.service(stage)
+        try:
+            text = service.generate(prompt, validate=validate, **{**params, **kwargs})
+        except Exception:
+            escalated = self._escalation(stage, service)
+            if escalated is None:
+                raise
+        else:
+            # Only validate when there is a tier to escalate to
+            escalated = None if validate is None else self._escalation(stage, service)
+            if escalated is None or validate(text):
+                return text
+        
+        self._count_escalation(stage)
+        service, params = escalated
+        return service.generate(prompt, validate=validate, **{**params, **kwargs})
+    
+    async def agenerate(self, stage: str, prompt: str, validate: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+        """generate() without blocking the event loop"""
+        service, params = self.service(stage)
+        try:
+            text = await service.agenerate(prompt, validate=validate, **{**params, **kwargs})
+        except Exception:
+            escalated = self._escalation(stage, service)
+            if escalated is None:
+                raise
+        else:
+            # Only validate when there is a tier to escalate to
+            escalated = None if validate is None else self._escalation(stage, service)
+            if escalated is None or validate(text):
+                return text
+        
+        self._count_escalation(stage)
+        service, params = escalated
+        return await service.agenerate(prompt, validate=validate, **{**params, **kwargs})
+    
+    def astream(self, stage: str, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Stream text for a stage from its routed tier (streamed text is not validated)"""
+        service, params = self.service(stage)
+        return service.astream(prompt, **{**params, **kwargs})
+
+_stage_services: Optional[StageLLMServices] = None
+
+def get_stage_services() -> StageLLMServices:
+    """The process-wide stage services, configured from llm_config with the shared response cache and rate limiter"""
+    global _stage_services
+    with _clients_lock:
+        if _stage_services is None:
+            from ..config.llm_config import (
+                get_stage_llm_config, get_fallback_llm_configs, LLM_ESCALATION_TIER, LLM_HEDGING_CONFIG
+            )
+            from ..config.server_config import LLM_CACHE_CONFIG, LLM_RATE_LIMIT_CONFIG
+            from .llm_cache import get_llm_cache
+            from .llm_limits import get_llm_rate_limiter
+            
+            cache = get_llm_cache(**LLM_CACHE_CONFIG)
+            limiter = get_llm_rate_limiter(**LLM_RATE_LIMIT_CONFIG) if LLM_RATE_LIMIT_CONFIG.get("enabled", False) else None
+            fallbacks = get_fallback_llm_configs() if LLM_HEDGING_CONFIG.get("enabled", False) else None
+            _stage_services = StageLLMServices(
+                get_stage_llm_config, cache, LLM_ESCALATION_TIER, limiter, fallbacks, LLM_HEDGING_CONFIG
+            )
+        return _stage_services
@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional, Callable, Awaitable, AsyncIterator
+
+class LLMResponseCache:
+    """Persistent exact-match cache of LLM responses in a local SQLite file.
+
+    Entries are keyed by a hash of everything that determines a response
+    (provider, model, messages, temperature, max_tokens, tools), expire
+    after ttl_seconds and are evicted least recently used once the stored
+    responses exceed max_bytes. The file may be shared by several server
+    processes. bypass skips the lookup but still stores the fresh response.
+    """
+
+    def __init__(self, path: str = "data/llm_cache.db", ttl_seconds: float = 7 * 86400,
+                 max_bytes: int = 256 * 1024 * 1024, enabled: bool = True, bypass: bool = False,
+                 touch_interval_seconds: float = 60.0, **_):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.bypass = bypass
+        self.touch_interval_seconds = touch_interval_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the cache database on first use"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """)
+            # Eviction reads keys and sizes in LRU order from this index alone, never the large values
+            conn.execute("DROP INDEX IF EXISTS responses_accessed")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (accessed_at, size, key)")
+            # Running total of the stored sizes, kept in step with every insert and delete
+            conn.execute("CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute(
+                "INSERT OR IGNORE INTO totals SELECT 'bytes', COALESCE(SUM(size), 0) FROM responses"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(provider: str, model: str, messages: List[Dict[str, Any]], temperature: Optional[float] = None,
+            max_tokens: Optional[int] = None, tools: Optional[List[Dict[str, Any]]] = None, **extra) -> str:
+        """Hash of every request parameter that can change the response"""
+        request = {
+            "provider": provider,
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "tools": tools,
+            **extra
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Cached response for a key, or None"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created_at, accessed_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._delete(conn, [key])
+                conn.commit()
+                return None
+            # Recency only needs to be roughly right, so hits write at most once per touch interval
+            if now - row[2] >= self.touch_interval_seconds:
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        """Store a response, evicting the least recently used ones beyond max_bytes"""
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete(conn, [key])
+                conn.execute(
+                    "INSERT INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, len(payload), now, now)
+                )
+                conn.execute("UPDATE totals SET value = value + ? WHERE name = 'bytes'", (len(payload),))
+                if self.max_bytes:
+                    total = conn.execute("SELECT value FROM totals WHERE name = 'bytes'").fetchone()[0]
+                    if total > self.max_bytes:
+                        self._evict(conn, total - self.max_bytes)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, keys: List[str]):
+        """Delete entries and take their sizes off the running total"""
+        freed = 0
+        for key in keys:
+            row = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                freed += row[0]
+        if freed:
+            conn.execute("UPDATE totals SET value = value - ? WHERE name = 'bytes'", (freed,))
+
+    @classmethod
+    def _evict(cls, conn: sqlite3.Connection, excess: int):
+        """Delete least recently used entries until excess bytes are freed"""
+        freed = 0
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if freed >= excess:
+                break
+            doomed.append(key)
+            freed += size
+        cls._delete(conn, doomed)
+
+    def invalidate(self, key: str):
+        """Drop a cached response, e.g. one its consumer rejected"""
+        with self._lock:
+            conn = self._connection()
+            self._delete(conn, [key])
+            conn.commit()
+
+    def _lookup(self, key: str, validate: Optional[Callable[[Any], bool]]) -> Optional[Any]:
+        """Cached response for a key that validate (if given) accepts; rejected ones are dropped"""
+        value = self.get(key)
+        if value is not None and validate is not None and not validate(value):
+            self.invalidate(key)
+            return None
+        return value
+
+    def cached(self, request: Dict[str, Any], call: Callable[[], Any], bypass: bool = False,
+               validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Return the cached response for a request, or call() and store what it returns.
+
+        request holds the key() parameters; call's result must be JSON-serializable.
+        Responses validate rejects are returned but neither stored nor served
+        from the cache.
+        """
+        if not self.enabled:
+            return call()
+
+        key = self.key(**request)
+        if not (bypass or self.bypass):
+            value = self._lookup(key, validate)
+            if value is not None:
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        value = call()
+        if validate is None or validate(value):
+            self.put(key, value)
+        return value
+
+    async def acached(self, request: Dict[str, Any], call: Callable[[], Awaitable[Any]], bypass: bool = False,
+                      validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """cached() for a coroutine call; the SQLite reads and writes run on a worker thread"""
+        if not self.enabled:
+            return await call()
+
+        key = self.key(**request)
+        if not (bypass or self.bypass):
+            value = await asyncio.to_thread(self._lookup, key, validate)
+            if value is not None:
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        value = await call()
+        if validate is None or validate(value):
+            await asyncio.to_thread(self.put, key, value)
+        return value
+
+    async def astream_cached(self, request: Dict[str, Any], stream: Callable[[], AsyncIterator[str]],
+                             bypass: bool = False) -> AsyncIterator[str]:
+        """Yield a cached text response in one chunk, or stream it and store the text once complete"""
+        key = self.key(**request)
+        if self.enabled and not (bypass or self.bypass):
+            value = await asyncio.to_thread(self.get, key)
+            if value is not None:
+                self.hits += 1
+                yield value
+                return
+
+        self.misses += 1
+        chunks = []
+        async for chunk in stream():
+            chunks.append(chunk)
+            yield chunk
+        if self.enabled:
+            await asyncio.to_thread(self.put, key, "".join(chunks))
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.execute("UPDATE totals SET value = 0 WHERE name = 'bytes'")
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, stored bytes and this process's hit/miss counters"""
+        with self._lock:
+            entries, size = self._connection().execute(
+                "SELECT (SELECT COUNT(*) FROM responses), value FROM totals WHERE name = 'bytes'"
+            ).fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+_caches: Dict[str, LLMResponseCache] = {}
+_caches_lock = threading.Lock()
+
+def get_llm_cache(path: str = "data/llm_cache.db", **config) -> LLMResponseCache:
+    """The shared cache for a database file, created on first use"""
+    key = os.path.abspath(path)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = LLMResponseCache(path, **config)
+        return _caches[key]
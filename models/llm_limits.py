@@ -0,0 +1,433 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable, AsyncIterator
+
+from ..utils.llm_output import estimate_tokens
+
+# Admission order: earlier classes go first
+PRIORITIES = ("interactive", "background")
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default="interactive")
+
+@contextmanager
+def llm_priority(priority: str):
+    """Run the LLM calls made inside the block at a priority class"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def _status(exc: BaseException) -> Optional[int]:
+    """HTTP status carried by a provider SDK exception, if any"""
+    for owner in (exc, getattr(exc, "response", None)):
+        for name in ("status_code", "status"):
+            status = getattr(owner, name, None)
+            if isinstance(status, int):
+                return status
+    return None
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """Whether a provider rejected a request for exceeding its rate limits"""
+    return _status(exc) == 429 or "RateLimit" in type(exc).__name__
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether a failed request is worth retrying: rate limits, server errors, timeouts and dropped connections"""
+    if is_rate_limited(exc) or isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    status = _status(exc)
+    if status is not None:
+        return status >= 500
+    return any(word in type(exc).__name__ for word in ("Timeout", "Connection"))
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds a provider asked to wait before retrying (Retry-After header), if any"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBuckets:
+    """Token buckets kept in a local SQLite file, so every server process draws on the same budget.
+
+    A bucket holds up to capacity units and refills at rate units per
+    second; levels are brought up to date lazily whenever a bucket is read.
+    """
+
+    def __init__(self, path: str = "data/llm_limits.db"):
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the bucket database on first use"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """)
+            self._conn = conn
+        return self._conn
+
+    def take(self, specs: List[Tuple[str, float, float, float]], reserve: float = 0.0) -> float:
+        """Atomically take amount from every (name, capacity, rate, amount) bucket.
+
+        Each bucket must keep reserve * capacity units after the take.
+        Returns 0 when granted, otherwise the seconds until it could be
+        (nothing is taken then).
+        """
+        if not specs:
+            return 0.0
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = []
+                wait = 0.0
+                for name, capacity, rate, amount in specs:
+                    row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+                    level = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+                    levels.append(level)
+                    floor = min(capacity, amount + reserve * capacity)
+                    if level < floor:
+                        wait = max(wait, (floor - level) / rate)
+                if wait == 0:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                        [(spec[0], level - spec[3], now) for spec, level in zip(specs, levels)]
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def give(self, name: str, capacity: float, amount: float):
+        """Return unused units to a bucket"""
+        if amount <= 0:
+            return
+        with self._lock:
+            self._connection().execute(
+                "UPDATE buckets SET level = MIN(?, level + ?) WHERE name = ?", (capacity, amount, name)
+            )
+
+class AdaptiveConcurrencyLimit:
+    """Additive-increase/multiplicative-decrease limit on in-flight requests to one provider"""
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32, latency_target: float = 30.0,
+                 decrease_factor: float = 0.5, decrease_interval: float = 2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+
+        self.in_flight = 0
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def _admissible(self, priority: str) -> bool:
+        """Whether a request of this priority may start now (call with the condition held)"""
+        if self.in_flight >= max(self.minimum, int(self.limit)):
+            return False
+        return not any(self._waiting[earlier] for earlier in PRIORITIES[:PRIORITIES.index(priority)])
+
+    def acquire(self, priority: str = "interactive"):
+        """Block until a request of this priority may start"""
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while not self._admissible(priority):
+                    self._condition.wait()
+                self.in_flight += 1
+            finally:
+                self._waiting[priority] -= 1
+
+    async def aacquire(self, priority: str = "interactive", poll_interval: float = 0.05):
+        """acquire() for coroutines; polls so a cancelled waiter never holds a slot"""
+        with self._condition:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                with self._condition:
+                    if self._admissible(priority):
+                        self.in_flight += 1
+                        return
+                await asyncio.sleep(poll_interval)
+        finally:
+            with self._condition:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False):
+        """Finish a request and adapt the limit to how it went; latency is None for failures"""
+        now = time.monotonic()
+        with self._condition:
+            self.in_flight -= 1
+            slow = latency is not None and self.latency_target and latency > self.latency_target
+            if overloaded or slow:
+                if now - self._last_decrease >= self.decrease_interval:
+                    self.limit = max(float(self.minimum), self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif latency is not None:
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+class LLMRateLimiter:
+    """Client-side rate, token and concurrency limits on provider calls, with retries"""
+
+    def __init__(self, path: str = "data/llm_limits.db", providers: Optional[Dict[str, Dict[str, Any]]] = None,
+                 requests_per_minute: float = 0, tokens_per_minute: float = 0, initial_concurrency: int = 4,
+                 min_concurrency: int = 1, max_concurrency: int = 32, latency_target_seconds: float = 30.0,
+                 decrease_factor: float = 0.5, max_retries: int = 5, backoff_base_seconds: float = 1.0,
+                 backoff_max_seconds: float = 60.0, background_reserve: float = 0.2,
+                 default_completion_tokens: int = 1000, enabled: bool = True, **_):
+        self.defaults = {
+            "requests_per_minute": requests_per_minute,
+            "tokens_per_minute": tokens_per_minute,
+            "initial_concurrency": initial_concurrency,
+            "min_concurrency": min_concurrency,
+            "max_concurrency": max_concurrency,
+            "latency_target_seconds": latency_target_seconds
+        }
+        self.providers = providers or {}
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.background_reserve = background_reserve
+        self.default_completion_tokens = default_completion_tokens
+        self.enabled = enabled
+
+        self.buckets = TokenBuckets(path)
+        self._limits: Dict[str, AdaptiveConcurrencyLimit] = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _settings(self, provider: str) -> Dict[str, Any]:
+        """Limits for a provider"""
+        return {**self.defaults, **self.providers.get(provider, {})}
+
+    def concurrency(self, provider: str) -> AdaptiveConcurrencyLimit:
+        """The adaptive concurrency limit of a provider, created on first use"""
+        with self._lock:
+            if provider not in self._limits:
+                settings = self._settings(provider)
+                self._limits[provider] = AdaptiveConcurrencyLimit(
+                    settings["initial_concurrency"], settings["min_concurrency"], settings["max_concurrency"],
+                    settings["latency_target_seconds"], self.decrease_factor
+                )
+            return self._limits[provider]
+
+    def _bucket_specs(self, provider: str, tokens: int) -> List[Tuple[str, float, float, float]]:
+        """(name, capacity, rate, amount) of the provider's buckets for one call"""
+        settings = self._settings(provider)
+        specs = []
+        if settings["requests_per_minute"]:
+            rpm = float(settings["requests_per_minute"])
+            specs.append((f"{provider}:requests", rpm, rpm / 60, 1.0))
+        if settings["tokens_per_minute"]:
+            tpm = float(settings["tokens_per_minute"])
+            specs.append((f"{provider}:tokens", tpm, tpm / 60, float(min(tokens, tpm))))
+        return specs
+
+    def _reserve(self, priority: str) -> float:
+        """Share of each bucket a call of this priority must leave untouched"""
+        return 0.0 if priority == PRIORITIES[0] else self.background_reserve
+
+    def _refund(self, provider: str, tokens: int):
+        """Give back reserved tokens that a call did not use"""
+        tpm = self._settings(provider)["tokens_per_minute"]
+        if tpm:
+            self.buckets.give(f"{provider}:tokens", float(tpm), float(tokens))
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        """Exponential backoff with full jitter, but never shorter than the provider's Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+        return max(delay, retry_after(exc) or 0.0)
+
+    def _failed(self, limit: AdaptiveConcurrencyLimit, exc: BaseException, attempt: int) -> bool:
+        """Release a failed call's slot; returns whether to retry it"""
+        overloaded = is_rate_limited(exc)
+        limit.release(None, overloaded)
+        if overloaded:
+            self.rate_limited += 1
+        if attempt >= self.max_retries or not is_transient(exc):
+            return False
+        self.retries += 1
+        return True
+
+    def _completion_tokens(self, result: Any) -> int:
+        """Estimated tokens of a call's result"""
+        return estimate_tokens(result if isinstance(result, str) else json.dumps(result, default=str))
+
+    def call(self, provider: str, call: Callable[[], Any], prompt_tokens: int = 0,
+             max_tokens: Optional[int] = None) -> Any:
+        """Run a provider call within the limits, retrying transient failures"""
+        if not self.enabled:
+            return call()
+
+        priority = _priority.get()
+        max_tokens = max_tokens or self.default_completion_tokens
+        specs = self._bucket_specs(provider, prompt_tokens + max_tokens)
+        limit = self.concurrency(provider)
+
+        attempt = 0
+        while True:
+            wait = self.buckets.take(specs, self._reserve(priority))
+            while wait:
+                time.sleep(wait)
+                wait = self.buckets.take(specs, self._reserve(priority))
+
+            limit.acquire(priority)
+            started = time.monotonic()
+            try:
+                result = call()
+            except Exception as exc:
+                self._refund(provider, prompt_tokens + max_tokens)
+                if not self._failed(limit, exc, attempt):
+                    raise
+                time.sleep(self._backoff(attempt, exc))
+                attempt += 1
+                continue
+            except BaseException:
+                limit.release()
+                raise
+
+            limit.release(time.monotonic() - started)
+            self._refund(provider, max_tokens - self._completion_tokens(result))
+            return result
+
+    async def acall(self, provider: str, call: Callable[[], Awaitable[Any]], prompt_tokens: int = 0,
+                    max_tokens: Optional[int] = None) -> Any:
+        """call() for coroutine calls; bucket reads run on a worker thread"""
+        if not self.enabled:
+            return await call()
+
+        priority = _priority.get()
+        max_tokens = max_tokens or self.default_completion_tokens
+        specs = self._bucket_specs(provider, prompt_tokens + max_tokens)
+        limit = self.concurrency(provider)
+
+        attempt = 0
+        while True:
+            wait = await asyncio.to_thread(self.buckets.take, specs, self._reserve(priority))
+            while wait:
+                await asyncio.sleep(wait)
+                wait = await asyncio.to_thread(self.buckets.take, specs, self._reserve(priority))
+
+            await limit.aacquire(priority)
+            started = time.monotonic()
+            try:
+                result = await call()
+            except Exception as exc:
+                await asyncio.to_thread(self._refund, provider, prompt_tokens + max_tokens)
+                if not self._failed(limit, exc, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, exc))
+                attempt += 1
+                continue
+            except BaseException:
+                limit.release()
+                raise
+
+            limit.release(time.monotonic() - started)
+            await asyncio.to_thread(self._refund, provider, max_tokens - self._completion_tokens(result))
+            return result
+
+    async def astream(self, provider: str, stream: Callable[[], AsyncIterator[str]], prompt_tokens: int = 0,
+                      max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """Stream within the limits, holding a slot until the stream ends.
+
+        Failures before the first chunk are retried; latency is measured to
+        the first chunk.
+        """
+        if not self.enabled:
+            async for chunk in stream():
+                yield chunk
+            return
+
+        priority = _priority.get()
+        max_tokens = max_tokens or self.default_completion_tokens
+        specs = self._bucket_specs(provider, prompt_tokens + max_tokens)
+        limit = self.concurrency(provider)
+
+        attempt = 0
+        while True:
+            wait = await asyncio.to_thread(self.buckets.take, specs, self._reserve(priority))
+            while wait:
+                await asyncio.sleep(wait)
+                wait = await asyncio.to_thread(self.buckets.take, specs, self._reserve(priority))
+
+            await limit.aacquire(priority)
+            started = time.monotonic()
+            latency = None
+            chunks = []
+            try:
+                async for chunk in stream():
+                    if latency is None:
+                        latency = time.monotonic() - started
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as exc:
+                if chunks:
+                    # Text was already delivered, so the stream cannot be retried
+                    limit.release(None, is_rate_limited(exc))
+                    raise
+                await asyncio.to_thread(self._refund, provider, prompt_tokens + max_tokens)
+                if not self._failed(limit, exc, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt, exc))
+                attempt += 1
+                continue
+            except BaseException:
+                limit.release()
+                raise
+
+            limit.release(latency if latency is not None else time.monotonic() - started)
+            await asyncio.to_thread(self._refund, provider, max_tokens - estimate_tokens("".join(chunks)))
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        """Current concurrency limits and this process's retry counters"""
+        with self._lock:
+            limits = {provider: {"limit": round(limit.limit, 2), "in_flight": limit.in_flight}
+                      for provider, limit in self._limits.items()}
+        return {"providers": limits, "retries": self.retries, "rate_limited": self.rate_limited}
+
+_limiters: Dict[str, LLMRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_llm_rate_limiter(path: str = "data/llm_limits.db", **config) -> LLMRateLimiter:
+    """The shared limiter for a bucket file, created on first use"""
+    key = os.path.abspath(path)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = LLMRateLimiter(path, **config)
+        return _limiters[key]
@@ -0,0 +1,12 @@
+import os
+import sys
+import types
+
+# The project's modules import each other relatively from the repository root, so register
+# the root as a package (whatever the checkout is called) and import through it
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+if "dms" not in sys.modules:
+    package = types.ModuleType("dms")
+    package.__path__ = [ROOT]
+    sys.modules["dms"] = package
@@ -0,0 +1,60 @@
+import sqlite3
+
+from dms.models.llm_cache import LLMResponseCache
+
+def request(prompt):
+    return {"provider": "test", "model": "m", "messages": [{"role": "user", "content": prompt}]}
+
+def stored_bytes(cache):
+    conn = sqlite3.connect(cache.path)
+    try:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_second_identical_request_is_a_hit(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"))
+    calls = []
+
+    def call():
+        calls.append(1)
+        return "answer"
+
+    assert cache.cached(request("p"), call) == "answer"
+    assert cache.cached(request("p"), call) == "answer"
+    assert cache.cached(request("other"), call) == "answer"
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_rejected_answers_are_not_cached(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"))
+    answers = iter(["bad", "good", "unused"])
+    valid = lambda text: text == "good"
+
+    assert cache.cached(request("p"), lambda: next(answers), validate=valid) == "bad"
+    assert cache.cached(request("p"), lambda: next(answers), validate=valid) == "good"
+    assert cache.cached(request("p"), lambda: next(answers), validate=valid) == "good"
+    assert cache.stats()["entries"] == 1
+
+def test_eviction_keeps_the_running_total_within_max_bytes(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), max_bytes=1000)
+    for i in range(50):
+        cache.cached(request(str(i)), lambda: "x" * 100)
+    cache.invalidate(LLMResponseCache.key(**request("49")))
+    cache.cached(request("1"), lambda: "y" * 50)
+
+    stats = cache.stats()
+    assert stats["bytes"] == stored_bytes(cache) <= 1000
+    assert cache.get(LLMResponseCache.key(**request("48"))) == "x" * 100
+    assert cache.get(LLMResponseCache.key(**request("0"))) is None
+
+def test_hits_within_the_touch_interval_do_not_write(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), touch_interval_seconds=3600)
+    cache.cached(request("p"), lambda: "answer")
+    key = LLMResponseCache.key(**request("p"))
+    conn = sqlite3.connect(cache.path)
+    before = conn.execute("SELECT accessed_at FROM responses WHERE key = ?", (key,)).fetchone()
+
+    assert cache.get(key) == "answer"
+    assert conn.execute("SELECT accessed_at FROM responses WHERE key = ?", (key,)).fetchone() == before
+    conn.close()
@@ -0,0 +1,76 @@
+import time
+import asyncio
+
+import pytest
+
+from dms.models.llm import LLMService, HedgedLLMService, LatencyTracker, StageLLMServices
+
+class FakeService(LLMService):
+    """Answers after a delay; answer may be an exception to raise"""
+
+    provider = "fake"
+
+    def __init__(self, model, answer, delay=0.0):
+        self.model = model
+        self.answer = answer
+        self.delay = delay
+        self.calls = 0
+
+    def _respond(self):
+        self.calls += 1
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+    def generate(self, prompt, validate=None, **kwargs):
+        time.sleep(self.delay)
+        return self._respond()
+
+    async def agenerate(self, prompt, validate=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        return self._respond()
+
+    def generate_with_tools(self, prompt, tools, **kwargs):
+        return {"type": "text", "content": self.generate(prompt)}
+
+    async def astream(self, prompt, **kwargs):
+        yield self._respond()
+
+def hedged(primary, *fallbacks, delay=0.05):
+    return HedgedLLMService(primary, list(fallbacks), LatencyTracker(), default_delay_seconds=delay)
+
+def test_slow_primary_is_hedged_by_a_fallback():
+    service = hedged(FakeService("slow", "late", delay=1.0), FakeService("fast", "early"))
+
+    assert service.generate("p") == "early"
+    assert service.hedged == 1
+
+def test_only_answers_that_pass_validation_win():
+    service = hedged(FakeService("a", "bad"), FakeService("b", "good"))
+
+    assert service.generate("p", validate=lambda text: text == "good") == "good"
+    assert asyncio.run(service.agenerate("p", validate=lambda text: text == "good")) == "good"
+
+def test_errors_fail_over_and_the_last_error_is_raised():
+    service = hedged(FakeService("a", ValueError("a")), FakeService("b", KeyError("b")))
+
+    with pytest.raises(KeyError):
+        service.generate("p")
+
+def test_no_answer_from_any_service_is_returned_not_a_type_error():
+    service = hedged(FakeService("a", None), FakeService("b", None))
+
+    assert service.generate_with_tools("p", []) == {"type": "text", "content": None}
+    assert service.generate("p") is None
+    assert asyncio.run(service.agenerate("p")) is None
+
+def test_escalation_is_not_hedged_with_the_tier_it_escalates_from(monkeypatch):
+    services = {"fast": FakeService("fast", "bad"), "large": FakeService("large", "good", delay=0.2)}
+    monkeypatch.setattr("dms.models.llm.get_llm_service", lambda config, cache, limiter: services[config["model"]])
+    stage_config = lambda stage, tier=None: {"provider": "fake", "model": tier or "fast"}
+    llm = StageLLMServices(stage_config, fallback_configs=[{"provider": "fake", "model": "fast"}],
+                           hedging={"default_delay_seconds": 0.01})
+
+    assert llm.generate("stage", "p", validate=lambda text: text == "good") == "good"
+    assert llm.escalations == {"stage": 1}
+    assert services["fast"].calls == 1
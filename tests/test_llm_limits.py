@@ -0,0 +1,82 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from dms.models.llm_limits import AdaptiveConcurrencyLimit, LLMRateLimiter, TokenBuckets, llm_priority
+
+class RateLimited(Exception):
+    status_code = 429
+
+def test_waiting_interactive_requests_are_admitted_before_background_ones():
+    limit = AdaptiveConcurrencyLimit(initial=1, maximum=1)
+    limit.acquire()
+    admitted = []
+
+    def request(priority):
+        limit.acquire(priority)
+        admitted.append(priority)
+        limit.release(0.0)
+
+    background = threading.Thread(target=request, args=("background",))
+    background.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=request, args=("interactive",))
+    interactive.start()
+    time.sleep(0.05)
+
+    limit.release(0.0)
+    background.join(2)
+    interactive.join(2)
+    assert admitted == ["interactive", "background"]
+
+def test_limit_grows_on_success_and_halves_on_rate_limiting():
+    limit = AdaptiveConcurrencyLimit(initial=4, decrease_interval=60)
+    limit.acquire()
+    limit.release(0.1)
+    assert limit.limit == 4.25
+
+    for _ in range(2):
+        limit.acquire()
+        limit.release(None, overloaded=True)
+    # A burst of rejections is one signal
+    assert limit.limit == 2.125
+
+def test_buckets_refuse_takes_beyond_their_level_and_keep_the_reserve(tmp_path):
+    buckets = TokenBuckets(str(tmp_path / "limits.db"))
+    spec = [("p:requests", 10.0, 1.0, 4.0)]
+
+    assert buckets.take(spec) == 0
+    assert buckets.take(spec, reserve=0.3) > 0
+    assert buckets.take(spec) == 0
+    assert buckets.take(spec) == pytest.approx(2.0, abs=0.1)
+
+def test_rate_limited_calls_are_retried(tmp_path):
+    limiter = LLMRateLimiter(str(tmp_path / "limits.db"), backoff_base_seconds=0.001)
+    answers = iter([RateLimited(), RateLimited(), "answer"])
+
+    def call():
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert limiter.call("p", call) == "answer"
+    assert (limiter.retries, limiter.rate_limited) == (2, 2)
+    assert limiter.concurrency("p").in_flight == 0
+
+def test_interrupted_calls_release_their_slot(tmp_path):
+    limiter = LLMRateLimiter(str(tmp_path / "limits.db"))
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    async def ainterrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        limiter.call("p", interrupted)
+    with llm_priority("background"), pytest.raises(KeyboardInterrupt):
+        asyncio.run(limiter.acall("p", ainterrupted))
+    assert limiter.concurrency("p").in_flight == 0
@@ -0,0 +1,58 @@
+import time
+import sqlite3
+import threading
+
+import pytest
+
+from dms.utils.parallel_query import ParallelQueryExecutor
+from dms.utils.query_budget import QueryBudget, BudgetExceeded
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("parallel") / "source.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sales (id INTEGER PRIMARY KEY, region TEXT, amount REAL)")
+    conn.executemany("INSERT INTO sales (region, amount) VALUES (?, ?)",
+                     ((("North", "South", "East")[i % 3], i * 0.5) for i in range(50000)))
+    conn.commit()
+    conn.close()
+    return path
+
+@pytest.fixture(scope="module")
+def executor():
+    # Forked workers inherit the test package registration that spawned ones would lack
+    executor = ParallelQueryExecutor(max_workers=2, min_rows=1000, start_method="fork")
+    yield executor
+    executor.close()
+
+def run(executor, path, query, budget):
+    conn = sqlite3.connect(path)
+    try:
+        plan, ranges = executor.plan(conn, query)
+    finally:
+        conn.close()
+    merge = executor.run(path, plan, ranges, budget)
+    return merge.execute(plan.final_sql).fetchall()
+
+def test_parallel_aggregate_matches_serial(executor, source):
+    query = "SELECT region, COUNT(*), SUM(amount), AVG(amount), MAX(amount) FROM sales GROUP BY region ORDER BY region"
+    conn = sqlite3.connect(source)
+    expected = conn.execute(query).fetchall()
+    conn.close()
+
+    assert run(executor, source, query, QueryBudget(timeout_seconds=60)) == expected
+
+def test_cancelled_request_stops_running_partitions(executor, source):
+    # Seconds of work per partition, with no time budget to stop it
+    slow = "SELECT region, SUM(length(hex(randomblob(200000)))) FROM sales GROUP BY region"
+    budget = QueryBudget(timeout_seconds=0)
+    threading.Timer(1.0, budget.cancel).start()
+
+    with pytest.raises(BudgetExceeded) as exceeded:
+        run(executor, source, slow, budget)
+    assert exceeded.value.budget == "cancelled"
+
+    # The workers are free again shortly afterwards
+    started = time.monotonic()
+    run(executor, source, "SELECT COUNT(*) FROM sales", QueryBudget(timeout_seconds=60))
+    assert time.monotonic() - started < 5
@@ -0,0 +1,58 @@
+import numpy as np
+
+from dms.memory.persistence import MemoryPersistence
+
+def store(persistence, key, text, vector):
+    persistence.append("store_memory", key, {"text": text}, np.array(vector, dtype=np.float32))
+
+def test_recovery_replays_the_wal(tmp_path):
+    persistence = MemoryPersistence(str(tmp_path), fsync_policy="always")
+    persistence.recover()
+    store(persistence, "a", "first", [1, 0])
+    store(persistence, "b", "second", [0, 1])
+    persistence.append("delete", "a")
+    persistence.close()
+
+    recovered = MemoryPersistence(str(tmp_path))
+    state = recovered.recover()
+    assert state["conversation_memories"] == {"b": {"text": "second"}}
+    assert list(state["memory_embeddings"]) == ["b"]
+    assert state["memory_embeddings"]["b"].tolist() == [0.0, 1.0]
+    assert recovered.lsn == 3
+    recovered.close()
+
+def test_recovery_loads_the_snapshot_and_replays_only_newer_records(tmp_path):
+    persistence = MemoryPersistence(str(tmp_path), snapshot_every=2)
+    state = persistence.recover()
+    for key, vector in (("a", [1, 0]), ("b", [0, 1])):
+        store(persistence, key, key, vector)
+        state["conversation_memories"][key] = {"text": key}
+        state["memory_embeddings"][key] = np.array(vector, dtype=np.float32)
+    assert persistence.should_snapshot()
+    persistence.snapshot(state["conversation_memories"], state["data_artifacts"], state["memory_embeddings"])
+    store(persistence, "c", "c", [1, 1])
+    persistence.close()
+
+    recovered = MemoryPersistence(str(tmp_path))
+    state = recovered.recover()
+    assert sorted(state["conversation_memories"]) == ["a", "b", "c"]
+    assert state["memory_embeddings"]["a"].tolist() == [1.0, 0.0]
+    assert (recovered.lsn, recovered.records_since_snapshot) == (3, 1)
+    recovered.close()
+
+def test_torn_tail_is_cut_off_before_new_records(tmp_path):
+    persistence = MemoryPersistence(str(tmp_path))
+    persistence.recover()
+    store(persistence, "a", "kept", [1, 0])
+    persistence.close()
+    with open(persistence.wal_path, "a", encoding="utf-8") as f:
+        f.write('{"lsn":2,"op":"store_memory","key":"b","rec')
+
+    recovered = MemoryPersistence(str(tmp_path))
+    assert list(recovered.recover()["conversation_memories"]) == ["a"]
+    store(recovered, "c", "after", [0, 1])
+    recovered.close()
+
+    reopened = MemoryPersistence(str(tmp_path))
+    assert reopened.recover()["conversation_memories"] == {"a": {"text": "kept"}, "c": {"text": "after"}}
+    reopened.close()
@@ -0,0 +1,94 @@
+import sqlite3
+
+import pytest
+
+from dms.utils.preaggregation import PreAggregator
+
+ROLLUPS = [
+    {
+        "name": "sales_by_region_month",
+        "fact_table": "sales",
+        "key": "id",
+        "dimensions": {"region": "region", "month": "strftime('%Y-%m', date)"},
+        "measures": ["amount"]
+    },
+    {
+        "name": "sales_by_product",
+        "fact_table": "sales",
+        "key": "id",
+        "joins": [{"table": "products", "on": ["product_id", "id"]}],
+        "dimensions": {"region": "region", "product_name": "products.name", "category": "category"},
+        "measures": ["amount"]
+    }
+]
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "source.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+    CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, category TEXT);
+    CREATE TABLE sales (id INTEGER PRIMARY KEY, product_id INTEGER, region TEXT, date TEXT, amount REAL, name TEXT);
+    INSERT INTO products VALUES (1, 'widget', 'tools'), (2, 'gadget', 'toys'), (3, 'gizmo', 'toys');
+    INSERT INTO sales VALUES
+        (1, 1, 'North', '2024-01-05', 10.0, 'ann'),
+        (2, 2, 'South', '2024-01-20', 5.5, 'bob'),
+        (3, 3, 'North', '2024-02-02', 7.25, 'ann'),
+        (4, 1, 'East', '2024-02-14', 3.0, 'cy'),
+        (5, 9, 'South', '2024-03-01', 1.0, 'bob');
+    """)
+    conn.commit()
+    conn.close()
+    return path
+
+@pytest.fixture
+def preaggregator(tmp_path):
+    return PreAggregator(ROLLUPS, directory=str(tmp_path / "rollups"))
+
+def exact(path, query):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(conn.execute(query).fetchall(), key=repr)
+    finally:
+        conn.close()
+
+def rewritten(preaggregator, path, query):
+    rewrite = preaggregator.rewrite(query, path)
+    assert rewrite is not None, query
+    return exact(rewrite[0], rewrite[1])
+
+@pytest.mark.parametrize("query", [
+    "SELECT region, SUM(amount) FROM sales GROUP BY region",
+    "SELECT s.region, COUNT(*) AS n, AVG(s.amount) FROM sales s WHERE s.region <> 'East' GROUP BY s.region",
+    "SELECT strftime('%Y-%m', date), MIN(amount), MAX(amount) FROM sales GROUP BY strftime('%Y-%m', date)",
+    "SELECT p.category, SUM(s.amount) FROM sales s JOIN products p ON s.product_id = p.id GROUP BY p.category",
+    "SELECT category, COUNT(*) FROM sales LEFT JOIN products ON sales.product_id = products.id GROUP BY category",
+])
+def test_rewrite_matches_exact_query(preaggregator, source, query):
+    assert rewritten(preaggregator, source, query) == exact(source, query)
+
+def test_dimension_of_a_table_not_in_from_is_not_used(preaggregator, source):
+    # sales.name is not the products.name dimension
+    assert preaggregator.rewrite("SELECT name, SUM(amount) FROM sales GROUP BY name", source) is None
+
+def test_appended_fact_rows_are_merged(preaggregator, source):
+    query = "SELECT region, SUM(amount), COUNT(*) FROM sales GROUP BY region"
+    rewritten(preaggregator, source, query)
+
+    conn = sqlite3.connect(source)
+    conn.execute("INSERT INTO sales VALUES (6, 2, 'North', '2024-03-09', 2.5, 'dee')")
+    conn.commit()
+    conn.close()
+
+    assert rewritten(preaggregator, source, query) == exact(source, query)
+
+def test_updated_dimension_row_rebuilds_rollup(preaggregator, source):
+    query = "SELECT category, SUM(amount) FROM sales JOIN products ON sales.product_id = products.id GROUP BY category"
+    rewritten(preaggregator, source, query)
+
+    conn = sqlite3.connect(source)
+    conn.execute("UPDATE products SET category = 'Z' WHERE id = 1")
+    conn.commit()
+    conn.close()
+
+    assert rewritten(preaggregator, source, query) == exact(source, query)
@@ -0,0 +1,33 @@
+import json
+
+from dms.utils.llm_output import estimate_tokens
+from dms.utils.prompt_compaction import PromptCompactor
+
+def rows(count):
+    return [{"id": i, "region": ("North", "South")[i % 2], "amount": i * 1.5} for i in range(count)]
+
+def test_small_data_is_passed_through():
+    data_json = json.dumps(rows(3))
+    assert PromptCompactor(default_budget_tokens=1000).compact(data_json) == data_json
+
+def test_large_data_is_profiled_within_the_smallest_budget():
+    compactor = PromptCompactor(default_budget_tokens=4000, model_budgets={"small": 600})
+    data_json = json.dumps({"columns": ["id", "region", "amount"], "row_count": 90000,
+                            "data": [[row["id"], row["region"], row["amount"]] for row in rows(2000)]})
+
+    compacted = compactor.compact(data_json, ["large", "small"])
+    note, document = compacted.split("\n", 1)
+    document = json.loads(document)
+
+    assert estimate_tokens(compacted) <= 600
+    assert "90000 rows" in note and document["row_count"] == 90000
+    assert document["profile"]["amount"]["max"] == 1999 * 1.5
+    # The rows holding the extremes are always sampled
+    assert [1999, "South", 2998.5] in document["sample"]["data"]
+
+def test_non_finite_numbers_are_left_out_of_the_profile():
+    data_json = json.dumps(rows(2000) + [{"id": 2000, "region": "North", "amount": float("nan")}])
+
+    document = json.loads(PromptCompactor(default_budget_tokens=600).compact(data_json).split("\n", 1)[1])
+    assert document["profile"]["amount"]["non_finite"] == 1
+    assert document["profile"]["amount"]["min"] == 0.0
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from dms.utils.query_engines import DuckDBEngine, QueryEngineRouter
+
+@pytest.fixture
+def parquet_file(tmp_path):
+    duckdb = pytest.importorskip("duckdb")
+    path = str(tmp_path / "sales.parquet")
+    duckdb.connect().execute(
+        f"COPY (SELECT i AS id, i % 3 AS region FROM range(1000) t(i)) TO '{path}' (FORMAT parquet)"
+    )
+    return path
+
+def test_reopening_a_changed_source_keeps_borrowed_cursors_usable(parquet_file):
+    engine = DuckDBEngine()
+    with engine.connection("parquet", parquet_file) as conn:
+        cursor = engine.execute(conn, "SELECT id FROM sales ORDER BY id")
+        first = cursor.fetchmany(10)
+
+        # The source changes while the query is still being fetched
+        stat = os.stat(parquet_file)
+        os.utime(parquet_file, (stat.st_atime, stat.st_mtime + 10))
+        with engine.connection("parquet", parquet_file) as other:
+            assert engine.execute(other, "SELECT COUNT(*) FROM sales").fetchall() == [(1000,)]
+
+        rest = cursor.fetchall()
+    assert [row[0] for row in first + rest] == list(range(1000))
+    assert not engine._retired and not engine._borrowers
+    engine.close()
+
+def test_sqlite_sources_use_sqlite_by_default():
+    assert QueryEngineRouter().route("sqlite:///example.db", "SELECT COUNT(*) FROM sales")[2] is None
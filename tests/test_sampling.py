@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+from dms.utils.sampling import SampleStore
+
+QUERY = "SELECT region, COUNT(*) AS n, SUM(amount) AS total, AVG(amount) AS mean FROM sales GROUP BY region ORDER BY region"
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "source.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sales (id INTEGER PRIMARY KEY, region TEXT, amount REAL)")
+    conn.executemany("INSERT INTO sales (region, amount) VALUES (?, ?)",
+                     ((("North", "South", "East")[i % 3], float(i % 100)) for i in range(20000)))
+    conn.commit()
+    conn.close()
+    return path
+
+def estimate(store, path, query):
+    approximate, reason = store.plan(query, path)
+    assert approximate is not None, reason
+    conn = sqlite3.connect(store.sidecar_path(path))
+    try:
+        store.attach_source(conn, path)
+        cursor = conn.execute(approximate.sql)
+        columns = [description[0] for description in cursor.description]
+        return approximate.result(columns, cursor.fetchall())
+    finally:
+        conn.close()
+
+def exact(path, query):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+def test_estimates_fall_within_their_error_bounds(tmp_path, source):
+    store = SampleStore([{"table": "sales", "key": "id", "sample_size": 2000}], directory=str(tmp_path / "samples"))
+    columns, rows, metadata = estimate(store, source, QUERY)
+
+    assert columns == ["region", "n", "total", "mean"]
+    assert (metadata["sample_rows"], metadata["population_rows"]) == (2000, 20000)
+    for i, (row, truth) in enumerate(zip(rows, exact(source, QUERY))):
+        assert row[0] == truth[0]
+        for position, name in ((1, "n"), (2, "total"), (3, "mean")):
+            half_width = metadata["error_bounds"][name][i]
+            # Four half-widths is far beyond the 95% interval, so this does not flake
+            assert 0 < half_width and abs(row[position] - truth[position]) <= 4 * half_width
+
+def test_a_sample_of_the_whole_table_is_exact(tmp_path, source):
+    store = SampleStore([{"table": "sales", "key": "id", "sample_size": 50000}], directory=str(tmp_path / "samples"))
+    columns, rows, metadata = estimate(store, source, QUERY)
+
+    assert [tuple(row) for row in rows] == exact(source, QUERY)
+    assert all(width == 0 for widths in metadata["error_bounds"].values() for width in widths)
+
+def test_appended_rows_are_fed_through_the_reservoir(tmp_path, source):
+    store = SampleStore([{"table": "sales", "key": "id", "sample_size": 2000}], directory=str(tmp_path / "samples"))
+    store.refresh(source, "sales")
+
+    conn = sqlite3.connect(source)
+    conn.executemany("INSERT INTO sales (region, amount) VALUES ('West', 1.0)", [()] * 5000)
+    conn.commit()
+    conn.close()
+
+    state = store.refresh(source, "sales")
+    assert (state["sample_rows"], state["population_rows"], state["refreshed"]) == (2000, 25000, True)
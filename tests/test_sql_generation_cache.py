@@ -0,0 +1,52 @@
+from dms.utils.sql_generation_cache import SemanticSQLCache
+
+class ConstantEmbedding:
+    """Embeds every text the same way, so only the wording checks decide hits"""
+
+    def encode(self, text):
+        return [1.0, 0.0]
+
+def make_cache():
+    return SemanticSQLCache(embedding_model=ConstantEmbedding())
+
+def test_same_wording_with_new_literal_reuses_sql():
+    cache = make_cache()
+    cache.store("db", "total sales by region in 2023",
+                "SELECT region, SUM(amount) FROM sales WHERE strftime('%Y', date) = '2023' GROUP BY region")
+
+    hit = cache.lookup("db", "Total sales by region in 2024?")
+
+    assert hit["sql"] == "SELECT region, SUM(amount) FROM sales WHERE strftime('%Y', date) = '2024' GROUP BY region"
+
+def test_filler_words_do_not_cause_a_miss():
+    cache = make_cache()
+    cache.store("db", "Show total sales by region", "SELECT region, SUM(amount) FROM sales GROUP BY region")
+
+    assert cache.lookup("db", "show me total sales by region") is not None
+
+def test_different_aggregate_is_a_miss_when_the_literal_changes():
+    cache = make_cache()
+    cache.store("db", "total sales by region in 2023",
+                "SELECT region, SUM(amount) FROM sales WHERE strftime('%Y', date) = '2023' GROUP BY region")
+
+    assert cache.lookup("db", "average sales by region in 2024") is None
+
+def test_different_ordering_is_a_miss_when_the_literal_changes():
+    cache = make_cache()
+    cache.store("db", "highest sales by region in 2023",
+                "SELECT region, SUM(amount) AS total FROM sales WHERE strftime('%Y', date) = '2023' "
+                "GROUP BY region ORDER BY total DESC LIMIT 1")
+
+    assert cache.lookup("db", "lowest sales by region in 2024") is None
+
+def test_different_value_outside_literals_is_a_miss():
+    cache = make_cache()
+    cache.store("db", "total sales for North region", "SELECT SUM(amount) FROM sales WHERE region = 'North'")
+
+    assert cache.lookup("db", "total sales for South region") is None
+
+def test_other_namespace_is_a_miss():
+    cache = make_cache()
+    cache.store("db", "total sales by region", "SELECT region, SUM(amount) FROM sales GROUP BY region")
+
+    assert cache.lookup("other", "total sales by region") is None
@@ -0,0 +1,39 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+class ToolExecutor:
+    """Runs blocking tool work on a bounded thread pool with per-tool limits.
+
+    MCP servers register async handlers so the event loop keeps serving other
+    requests while a tool waits on an LLM, SQLite or the embedding model. The
+    blocking part runs on a shared pool of max_workers threads, and each tool
+    may additionally be capped by its own semaphore.
+    """
+
+    def __init__(self, name: str, max_workers: int = 8, tool_limits: Optional[Dict[str, int]] = None, **_):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.max_workers = max_workers
+        self.tool_limits = tool_limits or {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, tool_name: str) -> asyncio.Semaphore:
+        """Get the concurrency limit for a tool, creating it on first use"""
+        if tool_name not in self._semaphores:
+            self._semaphores[tool_name] = asyncio.Semaphore(self.tool_limits.get(tool_name, self.max_workers))
+        return self._semaphores[tool_name]
+
+    async def run(self, tool_name: str, func: Callable, *args, **kwargs) -> Any:
+        """Run func on the pool once the tool's concurrency limit allows it"""
+        async with self._semaphore(tool_name):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def offload(self, func: Callable) -> Callable:
+        """Turn a blocking tool function into an async handler that runs on the pool"""
+        @functools.wraps(func)
+        async def handler(*args, **kwargs):
+            return await self.run(func.__name__, func, *args, **kwargs)
+
+        return handler
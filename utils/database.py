@@ -1,6 +1,11 @@
 
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from typing import Dict, Any, List, Optional
+from urllib.parse import quote
 
 class SQLiteStore:
     """Simple SQLite-based metadata store"""
@@ -147,3 +152,118 @@ class SQLiteStore:
             }
             
         return results
+
+def parse_sqlite_path(connection_string: str) -> str:
+    """Extract the database file path from a sqlite:/// connection string"""
+    return connection_string.replace("sqlite:///", "")
+
+class ReadOnlyConnectionPool:
+    """Pool of read-only SQLite connections to a single database file.
+    
+    Connections are opened with a mode=ro URI and PRAGMA query_only, and keep
+    their page cache, memory map and prepared statement cache between
+    queries instead of paying the cold-open cost every time.
+    """
+    
+    def __init__(self, db_path: str, max_connections: int = 8, cache_size_kb: int = 65536,
+                 mmap_size: int = 268435456, cached_statements: int = 256,
+                 acquire_timeout: float = 30.0):
+        self.db_path = os.path.abspath(db_path)
+        self.max_connections = max_connections
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.acquire_timeout = acquire_timeout
+        
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new tuned read-only connection"""
+        conn = sqlite3.connect(
+            f"file:{quote(self.db_path)}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        return conn
+    
+    def acquire(self) -> sqlite3.Connection:
+        """Take an idle connection, opening a new one while under the limit"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            if self._created < self.max_connections:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No SQLite connection available for {self.db_path}")
+    
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool, dropping it if it is unusable"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        self._idle.put(conn)
+    
+    def discard(self, conn: sqlite3.Connection):
+        """Close a connection that should not be reused"""
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+_read_only_pools: Dict[str, ReadOnlyConnectionPool] = {}
+_read_only_pools_lock = threading.Lock()
+
+def get_read_only_pool(db_path: str, **config) -> ReadOnlyConnectionPool:
+    """Get the shared read-only pool for a database, creating it on first use"""
+    key = os.path.abspath(db_path)
+    with _read_only_pools_lock:
+        if key not in _read_only_pools:
+            _read_only_pools[key] = ReadOnlyConnectionPool(key, **config)
+        return _read_only_pools[key]
@@ -1,6 +1,7 @@
 
 import json
 from typing import Dict, Any, List, Optional
+from .sql_results import to_records
 
 class DataFormatter:
     """Format data for presentation"""
@@ -8,9 +9,10 @@ class DataFormatter:
     def format_table_preview(self, data: str, max_rows: int = 5) -> str:
         """Format table data as a readable preview"""
         try:
-            parsed_data = json.loads(data)
+            # Accepts both record and columnar query results
+            parsed_data = to_records(data)
             
-            if not isinstance(parsed_data, list) or not parsed_data:
+            if not parsed_data:
                 return "No data to preview"
                 
             # Get column names
@@ -38,6 +40,8 @@ class DataFormatter:
             
         except json.JSONDecodeError:
             return "Unable to parse data as JSON"
+        except ValueError:
+            return "No data to preview"
         except Exception as e:
             return f"Error formatting data: {str(e)}"
     
@@ -0,0 +1,42 @@
+import re
+import ast
+import json
+from typing import Any, Optional
+
+# A fenced code block, optionally tagged with a language
+_FENCE_PATTERN = re.compile(r"```[\w+-]*\n(.*?)```", re.DOTALL)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+def strip_code_fences(text: str) -> str:
+    """The contents of the first fenced code block in a response, or the response itself"""
+    match = _FENCE_PATTERN.search(text)
+    return match.group(1) if match else text
+
+def parse_json(text: str) -> Optional[Any]:
+    """A response parsed as JSON, or None; like the tools' consumers, fenced JSON is not accepted"""
+    try:
+        return json.loads(text.strip())
+    except (TypeError, ValueError):
+        return None
+
+def is_json(text: str) -> bool:
+    """Whether a response is JSON"""
+    return parse_json(text) is not None
+
+def is_json_object(text: str) -> bool:
+    """Whether a response is a JSON object"""
+    return isinstance(parse_json(text), dict)
+
+def is_python_code(text: str) -> bool:
+    """Whether a response is (or contains one fenced block of) Python that parses"""
+    code = strip_code_fences(text.strip())
+    if not code.strip():
+        return False
+    try:
+        ast.parse(code)
+        return True
+    except (SyntaxError, ValueError):
+        return False
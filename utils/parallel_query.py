@@ -0,0 +1,337 @@
+import os
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from typing import Dict, Any, List, Optional, Tuple
+
+from .sql_parsing import (
+    tokenize_sql_spans, matching_paren, split_top_level, normalize_expression, split_name,
+    split_alias, output_column_name, split_select_clauses, LITERAL_NAMES
+)
+from .query_planner import quote_identifier
+from .query_budget import QueryBudget, BudgetExceeded
+from .database import get_read_only_pool
+
+# Aggregates that can be computed per partition and merged
+DECOMPOSABLE = {"sum", "count", "avg", "min", "max", "total"}
+
+_UNSUPPORTED = {"distinct", "over", "union", "intersect", "except", "with", "window", "right", "full"}
+
+class ParallelAggregatePlan:
+    """An aggregate query split into a per-partition query and a merge query.
+
+    partial_sql groups one rowid range of the fact table (its last two
+    parameters are the range bounds) into partial aggregates g0.., p0..;
+    final_sql re-aggregates the partials table into the original result.
+    """
+
+    def __init__(self, fact_table: str, fact_alias: str, partial_sql: str, final_sql: str,
+                 group_count: int, partial_count: int):
+        self.fact_table = fact_table
+        self.fact_alias = fact_alias
+        self.partial_sql = partial_sql
+        self.final_sql = final_sql
+        self.group_count = group_count
+        self.partial_count = partial_count
+
+def plan_parallel_aggregate(query: str) -> Optional[ParallelAggregatePlan]:
+    """Decompose a GROUP BY aggregate over one fact table, or None if it cannot be split"""
+    query = query.strip().rstrip(";").rstrip()
+    spans = tokenize_sql_spans(query)
+    if not spans or any(token[1].lower() in _UNSUPPORTED for token in spans):
+        return None
+    clauses = split_select_clauses(spans)
+    if clauses is None or "from" not in clauses or not clauses["from"]:
+        return None
+
+    def text(tokens: List[tuple]) -> str:
+        return query[tokens[0][2]:tokens[-1][3]]
+
+    # The first table in FROM is the one partitioned by rowid
+    from_tokens = clauses["from"]
+    if from_tokens[0][0] != "name":
+        return None
+    fact_table = split_name(from_tokens[0][1])[1]
+    fact_alias = from_tokens[0][1]
+    position = 1
+    if position < len(from_tokens) and from_tokens[position][1].lower() == "as":
+        position += 1
+    if position < len(from_tokens) and from_tokens[position][0] == "name" and "." not in from_tokens[position][1]:
+        fact_alias = from_tokens[position][1]
+
+    select_items = []
+    for item in split_top_level(clauses["select"], ","):
+        expression, alias = split_alias(item)
+        if not expression or (len(expression) == 1 and expression[0][1] == "*"):
+            return None
+        select_items.append((expression, alias or output_column_name(query, expression), alias))
+    aliases = {name.lower(): expression for expression, name, alias in select_items if alias}
+
+    # GROUP BY may name select aliases or ordinals
+    groups: List[List[tuple]] = []
+    for item in split_top_level(clauses["group"], ",") if "group" in clauses else []:
+        if not item:
+            return None
+        if len(item) == 1 and item[0][0] == "number":
+            index = int(item[0][1]) - 1
+            if not 0 <= index < len(select_items):
+                return None
+            item = select_items[index][0]
+        elif len(item) == 1 and item[0][0] == "name" and item[0][1].lower() in aliases:
+            item = aliases[item[0][1].lower()]
+        groups.append(item)
+    group_keys = {normalize_expression(group): f"g{i}" for i, group in enumerate(groups)}
+
+    partials: Dict[str, Tuple[str, str]] = {}
+
+    def partial(function: str, argument: str) -> str:
+        key = f"{function}({normalize_expression(tokenize_sql_spans(argument)) if argument != '*' else '*'})"
+        if key not in partials:
+            partials[key] = (f"p{len(partials)}", f"{function.upper()}({argument})")
+        return quote_identifier(partials[key][0])
+
+    def rewrite(tokens: List[tuple], allow_aliases: bool) -> Optional[str]:
+        column = group_keys.get(normalize_expression(tokens))
+        if column is not None:
+            return quote_identifier(column)
+
+        parts = []
+        i = 0
+        while i < len(tokens):
+            kind, token_text = tokens[i][0], tokens[i][1]
+            lower = token_text.lower()
+            followed_by_call = i + 1 < len(tokens) and tokens[i + 1][1] == "("
+            if kind == "name" and followed_by_call and lower in DECOMPOSABLE:
+                end = matching_paren(tokens, i + 1)
+                if end < 0:
+                    return None
+                argument_tokens = tokens[i + 2:end]
+                arguments = split_top_level(argument_tokens, ",")
+                if lower in ("min", "max") and len(arguments) > 1:
+                    # Scalar MIN/MAX of several values; keep walking inside it
+                    parts.append(token_text)
+                    i += 1
+                    continue
+                if not argument_tokens or argument_tokens[0][1].lower() == "distinct":
+                    return None
+                argument = "*" if argument_tokens[0][1] == "*" else text(argument_tokens)
+                if lower in ("sum", "total"):
+                    parts.append(f"{lower.upper()}({partial('sum', argument)})")
+                elif lower == "count":
+                    parts.append(f"COALESCE(SUM({partial('count', argument)}), 0)")
+                elif lower == "avg":
+                    parts.append(f"(CAST(SUM({partial('sum', argument)}) AS REAL) / SUM({partial('count', argument)}))")
+                else:
+                    parts.append(f"{lower.upper()}({partial(lower, argument)})")
+                i = end + 1
+                continue
+            if kind == "name" and not followed_by_call and lower not in LITERAL_NAMES:
+                column = group_keys.get(normalize_expression([tokens[i]]))
+                if column is not None:
+                    parts.append(quote_identifier(column))
+                elif allow_aliases and split_name(token_text)[1].lower() in aliases:
+                    parts.append(token_text)
+                else:
+                    return None
+            elif kind == "param":
+                return None
+            else:
+                parts.append(token_text)
+            i += 1
+        return " ".join(parts)
+
+    final_items = []
+    for expression, name, _ in select_items:
+        rewritten = rewrite(expression, allow_aliases=False)
+        if rewritten is None:
+            return None
+        final_items.append(f"{rewritten} AS {quote_identifier(name)}")
+    if not partials:
+        # Nothing to aggregate; serial execution is just as good
+        return None
+
+    final_sql = f"SELECT {', '.join(final_items)} FROM partials"
+    if groups:
+        final_sql += " GROUP BY " + ", ".join(quote_identifier(f"g{i}") for i in range(len(groups)))
+    if "having" in clauses:
+        having = rewrite(clauses["having"], allow_aliases=True)
+        if having is None:
+            return None
+        final_sql += " HAVING " + having
+    if "order" in clauses:
+        order_parts = []
+        for item in split_top_level(clauses["order"], ","):
+            direction = ""
+            if item and item[-1][1].lower() in ("asc", "desc"):
+                direction = " " + item[-1][1].upper()
+                item = item[:-1]
+            if not item:
+                return None
+            rewritten = item[0][1] if len(item) == 1 and item[0][0] == "number" else rewrite(item, allow_aliases=True)
+            if rewritten is None:
+                return None
+            order_parts.append(rewritten + direction)
+        final_sql += " ORDER BY " + ", ".join(order_parts)
+    if "limit" in clauses:
+        if any(token[0] == "name" for token in clauses["limit"]):
+            return None
+        final_sql += " LIMIT " + text(clauses["limit"])
+
+    partial_items = [f"{text(group)} AS {quote_identifier(f'g{i}')}" for i, group in enumerate(groups)]
+    partial_items += [f"{expression} AS {quote_identifier(name)}" for name, expression in partials.values()]
+    rowid = f"{fact_alias}.rowid"
+    where = f"{rowid} >= ? AND {rowid} < ?"
+    if "where" in clauses:
+        where = f"({text(clauses['where'])}) AND {where}"
+    partial_sql = f"SELECT {', '.join(partial_items)} FROM {text(from_tokens)} WHERE {where}"
+    if groups:
+        partial_sql += " GROUP BY " + ", ".join(text(group) for group in groups)
+
+    return ParallelAggregatePlan(fact_table, fact_alias, partial_sql, final_sql, len(groups), len(partials))
+
+def _watch_cancellation(cancelled, finished: threading.Event, budget: QueryBudget):
+    """Worker thread: cancel the partition's query once the request sets its cancellation event"""
+    while not finished.is_set():
+        if cancelled.wait(0.1):
+            budget.cancel()
+            return
+
+def _run_partition(db_path: str, sql: str, params: tuple, pool_config: Dict[str, Any],
+                   budget_config: Dict[str, Any], cancelled) -> Dict[str, Any]:
+    """Worker: aggregate one partition on the process's own read-only connection, until cancelled is set"""
+    budget = QueryBudget(**budget_config)
+    finished = threading.Event()
+    threading.Thread(target=_watch_cancellation, args=(cancelled, finished, budget), daemon=True).start()
+    try:
+        with get_read_only_pool(db_path, **pool_config).connection() as conn:
+            budget.install(conn)
+            try:
+                return {"rows": [tuple(row) for row in conn.execute(sql, params).fetchall()]}
+            finally:
+                budget.uninstall(conn)
+    except Exception as e:
+        exceeded = budget.error_for(e)
+        if exceeded is not None:
+            return {"budget": exceeded.budget, "limit": exceeded.limit, "partial": exceeded.partial}
+        return {"error": str(e)}
+    finally:
+        finished.set()
+
+class ParallelQueryExecutor:
+    """Runs decomposable aggregate queries over rowid ranges on a process pool.
+
+    SQLite executes a statement on one core, so large GROUP BY aggregates
+    are split into rowid ranges of their first FROM table, each range is
+    aggregated by a worker process on its own read-only connection, and the
+    partial aggregates are merged in an in-memory database by a rewritten
+    query. Tables smaller than min_rows and queries that cannot be
+    decomposed run serially as before.
+    """
+
+    def __init__(self, max_workers: int = 0, min_rows: int = 200000, partitions_per_worker: int = 2,
+                 start_method: str = "spawn", pool_config: Optional[Dict[str, Any]] = None, **_):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self.partitions_per_worker = partitions_per_worker
+        self.start_method = start_method
+        self.pool_config = pool_config or {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Serves the per-request cancellation events shared with the workers
+        self._manager = None
+        self._pool_lock = threading.Lock()
+
+    def _processes(self) -> ProcessPoolExecutor:
+        """Start the worker pool on first use"""
+        with self._pool_lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(self.start_method)
+                self._manager = context.Manager()
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            return self._pool
+
+    def plan(self, conn: sqlite3.Connection, query: str) -> Optional[Tuple[ParallelAggregatePlan, List[Tuple[int, int]]]]:
+        """Decompose a query and pick rowid ranges, if it is worth running in parallel"""
+        if self.max_workers < 2:
+            return None
+        plan = plan_parallel_aggregate(query)
+        if plan is None:
+            return None
+        try:
+            low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {quote_identifier(plan.fact_table)}").fetchone()
+        except sqlite3.OperationalError:
+            # WITHOUT ROWID tables and views cannot be split by rowid
+            return None
+        if low is None or high - low + 1 < self.min_rows:
+            return None
+
+        count = self.max_workers * self.partitions_per_worker
+        step = (high - low + count) // count
+        ranges = [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+        return plan, ranges
+
+    def run(self, db_path: str, plan: ParallelAggregatePlan, ranges: List[Tuple[int, int]],
+            budget: QueryBudget) -> sqlite3.Connection:
+        """Aggregate every range in parallel and load the partials into an in-memory database.
+
+        The returned connection holds a "partials" table; run plan.final_sql on it.
+        """
+        remaining = budget.remaining_seconds()
+        budget_config = {
+            "timeout_seconds": remaining if remaining is not None else 0,
+            "max_vm_steps": budget.max_vm_steps,
+            "progress_interval": budget.progress_interval
+        }
+        pool = self._processes()
+        cancelled = self._manager.Event()
+        futures = [
+            pool.submit(_run_partition, db_path, plan.partial_sql, (start, end), self.pool_config, budget_config,
+                        cancelled)
+            for start, end in ranges
+        ]
+
+        # Wait in short slices so a cancelled request stops waiting promptly
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_EXCEPTION)
+            failed = budget.cancelled or any(future.exception() is not None for future in done) or any(
+                "rows" not in future.result() for future in done
+            )
+            remaining = budget.remaining_seconds()
+            if failed or remaining == 0.0:
+                # Queued partitions are dropped and running ones stop at their next progress check
+                for future in pending:
+                    future.cancel()
+                cancelled.set()
+                break
+
+        merge = sqlite3.connect(":memory:", check_same_thread=False)
+        columns = [quote_identifier(f"g{i}") for i in range(plan.group_count)]
+        columns += [quote_identifier(f"p{i}") for i in range(plan.partial_count)]
+        merge.execute(f"CREATE TABLE partials ({', '.join(columns)})")
+        insert = f"INSERT INTO partials VALUES ({', '.join('?' for _ in columns)})"
+
+        for future in futures:
+            if budget.cancelled:
+                raise BudgetExceeded("cancelled", None, budget.partial())
+            if not future.done():
+                raise BudgetExceeded("time", budget.timeout_seconds, budget.partial())
+            if future.exception() is not None:
+                raise future.exception()
+            result = future.result()
+            if "budget" in result:
+                raise BudgetExceeded(result["budget"], result["limit"], result["partial"])
+            if "error" in result:
+                raise sqlite3.OperationalError(result["error"])
+            merge.executemany(insert, result["rows"])
+        return merge
+
+    def close(self):
+        """Stop the worker processes"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+            manager, self._manager = self._manager, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
@@ -0,0 +1,611 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import quote
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from .sql_parsing import (
+    tokenize_sql, tokenize_sql_spans, matching_paren, split_top_level, split_name,
+    split_alias, output_column_name, split_select_clauses, LITERAL_NAMES
+)
+from .query_planner import quote_identifier
+
+AGGREGATES = {"sum", "count", "avg", "min", "max", "total"}
+
+# Tokens that put a query outside what a rollup can answer
+_UNSUPPORTED = {"distinct", "over", "union", "intersect", "except", "with", "window", "natural", "using", "cross"}
+
+def qualified_expression(tokens: List[tuple], aliases: Dict[str, str], columns: Dict[str, Set[str]]) -> Optional[str]:
+    """normalize_expression() with every column reference qualified by its table.
+
+    aliases maps the (lowercase) names and aliases in scope to tables and
+    columns maps those tables to their column names. Qualified references
+    resolve through aliases, unqualified ones to the only table in scope
+    that has the column; names no table has (keywords, output aliases) stay
+    bare. Returns None for an unknown qualifier or an ambiguous column.
+    """
+    tables = list(dict.fromkeys(aliases.values()))
+    parts = []
+    for i, token in enumerate(tokens):
+        kind, text = token[0], token[1]
+        if kind != "name":
+            parts.append(text if kind in ("string", "number") else text.lower())
+            continue
+        qualifier, name = split_name(text)
+        name = name.lower()
+        if qualifier is not None:
+            table = aliases.get(qualifier.lower())
+            if table is None:
+                return None
+            parts.append(f"{table}.{name}")
+        elif i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+            parts.append(name)
+        else:
+            owners = [table for table in tables if name in columns.get(table, ())]
+            if len(owners) > 1:
+                return None
+            parts.append(f"{owners[0]}.{name}" if owners else name)
+    return " ".join(parts)
+
+class RollupDefinition:
+    """A rollup: a fact table (plus left-joined dimension tables) grouped by dimension expressions.
+
+    dimensions maps rollup column names to SQL expressions over the source
+    tables; measures lists the columns whose sum, non-null count, min and max
+    are kept per group. joins are {"table", "on": [fact_column, table_column]}.
+    """
+
+    def __init__(self, name: str, fact_table: str, key: str, dimensions: Dict[str, str],
+                 measures: List[str], joins: Optional[List[Dict[str, Any]]] = None, **_):
+        self.name = name
+        self.fact_table = fact_table
+        self.key = key
+        self.dimensions = dimensions
+        self.measures = measures
+        self.joins = joins or []
+
+        self.table = f"rollup_{name}"
+        self.tables = [fact_table.lower()] + [join["table"].lower() for join in self.joins]
+
+    def qualified_columns(self, columns: Dict[str, Set[str]]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Table-qualified dimension expressions and measures mapped to their rollup columns and measures"""
+        aliases = {table: table for table in self.tables}
+        dimension_columns = {}
+        for column, expression in self.dimensions.items():
+            qualified = qualified_expression(tokenize_sql(expression), aliases, columns)
+            if qualified is not None:
+                dimension_columns[qualified] = column
+        measure_columns = {}
+        for measure in self.measures:
+            qualified = qualified_expression(tokenize_sql(measure), aliases, columns)
+            if qualified is not None:
+                measure_columns[qualified] = measure
+        return dimension_columns, measure_columns
+
+    def signature(self) -> str:
+        """Hash of the definition; a changed definition forces a rebuild"""
+        raw = json.dumps([self.fact_table, self.key, self.dimensions, self.measures, self.joins], sort_keys=True)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def source_sql(self, low: Optional[int] = None, high: Optional[int] = None) -> str:
+        """Aggregate the attached source database, optionally for a key range (low, high]"""
+        fact = f"src.{quote_identifier(self.fact_table)}"
+        selects = [f"{expression} AS {quote_identifier(column)}" for column, expression in self.dimensions.items()]
+        joins = []
+        for join in self.joins:
+            table = quote_identifier(join["table"])
+            selects.append(f"src.{table}.{quote_identifier(join['on'][1])} IS NOT NULL AS {quote_identifier('_has_' + join['table'])}")
+            joins.append(
+                f"LEFT JOIN src.{table} ON {fact}.{quote_identifier(join['on'][0])} = src.{table}.{quote_identifier(join['on'][1])}"
+            )
+        selects.append('COUNT(*) AS "row_count"')
+        for measure in self.measures:
+            column = quote_identifier(measure)
+            selects.extend([
+                f"SUM({column}) AS {quote_identifier('sum_' + measure)}",
+                f"COUNT({column}) AS {quote_identifier('count_' + measure)}",
+                f"MIN({column}) AS {quote_identifier('min_' + measure)}",
+                f"MAX({column}) AS {quote_identifier('max_' + measure)}"
+            ])
+
+        where = ""
+        if low is not None:
+            key = f"{fact}.{quote_identifier(self.key)}"
+            where = f" WHERE {key} > {int(low)} AND {key} <= {int(high)}"
+
+        return (
+            f"SELECT {', '.join(selects)} FROM {fact} {' '.join(joins)}{where} "
+            f"GROUP BY {', '.join(str(i + 1) for i in range(len(self.dimensions) + len(self.joins)))}"
+        )
+
+    def merge_sql(self, delta: str) -> str:
+        """Re-aggregate the current rollup together with a delta table"""
+        groups = [quote_identifier(column) for column in self.dimensions]
+        groups += [quote_identifier("_has_" + join["table"]) for join in self.joins]
+        selects = groups + ['SUM("row_count")']
+        for measure in self.measures:
+            selects.extend([
+                f"SUM({quote_identifier('sum_' + measure)})",
+                f"SUM({quote_identifier('count_' + measure)})",
+                f"MIN({quote_identifier('min_' + measure)})",
+                f"MAX({quote_identifier('max_' + measure)})"
+            ])
+        return (
+            f"SELECT {', '.join(selects)} FROM (SELECT * FROM {quote_identifier(self.table)} "
+            f"UNION ALL SELECT * FROM {delta}) GROUP BY {', '.join(groups)}"
+        )
+
+class _Scope:
+    """Tables in a query's FROM clause and the rollup columns its expressions can map to"""
+
+    def __init__(self, aliases: Dict[str, str], columns: Dict[str, Set[str]], dimension_columns: Dict[str, str],
+                 measure_columns: Dict[str, str]):
+        self.aliases = aliases
+        self.columns = columns
+        self.dimension_columns = dimension_columns
+        self.measure_columns = measure_columns
+
+    def qualify(self, tokens: List[tuple]) -> Optional[str]:
+        return qualified_expression(tokens, self.aliases, self.columns)
+
+class RollupRewriter:
+    """Rewrites an aggregate query over a rollup's source tables to read the rollup instead.
+
+    Supported queries select dimension expressions and SUM/COUNT/AVG/MIN/MAX/
+    TOTAL of measures from the fact table, optionally joined to the rollup's
+    dimension tables on the same keys, filter only on dimension expressions
+    and group only by them. HAVING, ORDER BY and LIMIT are carried over.
+    Column references are matched by table, using columns (the source
+    tables' column names), so an expression only matches a dimension whose
+    tables the query actually reads. Anything else returns None so the
+    query runs against the base tables.
+    """
+
+    def __init__(self, definition: RollupDefinition):
+        self.definition = definition
+
+    def rewrite(self, query: str, columns: Dict[str, Set[str]]) -> Optional[str]:
+        query = query.strip().rstrip(";").rstrip()
+        spans = tokenize_sql_spans(query)
+        if not spans or any(token[1].lower() in _UNSUPPORTED for token in spans):
+            return None
+        try:
+            clauses = split_select_clauses(spans)
+            if clauses is None or "from" not in clauses:
+                return None
+
+            matched = self._match_from(clauses["from"])
+            if matched is None:
+                return None
+            required_joins, from_aliases = matched
+            scope = _Scope(from_aliases, columns, *self.definition.qualified_columns(columns))
+
+            # Dimensions the result is grouped by, in query order
+            group_columns: List[str] = []
+            for item in split_top_level(clauses["group"], ",") if "group" in clauses else []:
+                column = self._dimension(item, scope)
+                if column is None:
+                    return None
+                group_columns.append(column)
+
+            aliases = set()
+            select_parts = []
+            for item in split_top_level(clauses["select"], ","):
+                expression, alias = split_alias(item)
+                if not expression or (len(expression) == 1 and expression[0][1] == "*"):
+                    return None
+                output_name = alias or output_column_name(query, expression)
+                rewritten = self._rewrite_expression(expression, group_columns, set(), scope)
+                if rewritten is None:
+                    return None
+                aliases.add(output_name.lower())
+                select_parts.append(f"{rewritten} AS {quote_identifier(output_name)}")
+
+            conditions = [f"{quote_identifier('_has_' + table)} = 1" for table in required_joins]
+            if "where" in clauses:
+                condition = self._rewrite_condition(clauses["where"], scope)
+                if condition is None:
+                    return None
+                conditions.append(f"({condition})")
+
+            sql = f"SELECT {', '.join(select_parts)} FROM {quote_identifier(self.definition.table)}"
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            if group_columns:
+                sql += " GROUP BY " + ", ".join(quote_identifier(column) for column in group_columns)
+            if "having" in clauses:
+                having = self._rewrite_expression(clauses["having"], group_columns, aliases, scope)
+                if having is None:
+                    return None
+                sql += " HAVING " + having
+            if "order" in clauses:
+                order_parts = []
+                for item in split_top_level(clauses["order"], ","):
+                    direction = ""
+                    if item and item[-1][1].lower() in ("asc", "desc"):
+                        direction = " " + item[-1][1].upper()
+                        item = item[:-1]
+                    if len(item) == 1 and item[0][0] == "number":
+                        rewritten = item[0][1]
+                    else:
+                        rewritten = self._rewrite_expression(item, group_columns, aliases, scope)
+                    if rewritten is None:
+                        return None
+                    order_parts.append(rewritten + direction)
+                sql += " ORDER BY " + ", ".join(order_parts)
+            if "limit" in clauses:
+                if any(token[0] == "name" for token in clauses["limit"]):
+                    return None
+                sql += " LIMIT " + " ".join(token[1] for token in clauses["limit"])
+            return sql
+        except (IndexError, ValueError):
+            return None
+
+    def _match_from(self, tokens: List[tuple]) -> Optional[Tuple[List[str], Dict[str, str]]]:
+        """Check the FROM clause joins only the rollup's tables on its keys.
+
+        Returns the dimension tables joined with an inner join, whose rows
+        must then have a match in the rollup, and the names and aliases of
+        the tables read mapped to those tables.
+        """
+        definition = self.definition
+        joins = {join["table"].lower(): join for join in definition.joins}
+        aliases: Dict[str, str] = {}
+
+        def read_table(i: int) -> Tuple[Optional[str], int]:
+            if i >= len(tokens) or tokens[i][0] != "name":
+                return None, i
+            table = split_name(tokens[i][1])[1].lower()
+            alias = table
+            i += 1
+            if i < len(tokens) and tokens[i][1].lower() == "as":
+                i += 1
+            if i < len(tokens) and tokens[i][0] == "name" and "." not in tokens[i][1]:
+                alias = split_name(tokens[i][1])[1].lower()
+                i += 1
+            aliases[alias] = table
+            aliases[table] = table
+            return table, i
+
+        table, i = read_table(0)
+        if table != definition.fact_table.lower():
+            return None
+
+        required = []
+        seen = set()
+        while i < len(tokens):
+            kind = "inner"
+            if tokens[i][1].lower() in ("inner", "left"):
+                kind = tokens[i][1].lower()
+                i += 1
+                if kind == "left" and i < len(tokens) and tokens[i][1].lower() == "outer":
+                    i += 1
+            if i >= len(tokens) or tokens[i][1].lower() != "join":
+                return None
+            table, i = read_table(i + 1)
+            if table not in joins or table in seen or i >= len(tokens) or tokens[i][1].lower() != "on":
+                return None
+            seen.add(table)
+
+            # ON <fact>.<key> = <table>.<key>, in either order
+            condition = tokens[i + 1:i + 4]
+            if len(condition) != 3 or condition[1][1] not in ("=", "=="):
+                return None
+            sides = set()
+            for token in (condition[0], condition[2]):
+                qualifier, column = split_name(token[1])
+                if token[0] != "name" or qualifier is None:
+                    return None
+                sides.add((aliases.get(qualifier.lower()), column.lower()))
+            expected = {
+                (definition.fact_table.lower(), joins[table]["on"][0].lower()),
+                (table, joins[table]["on"][1].lower())
+            }
+            if sides != expected:
+                return None
+            if kind == "inner":
+                required.append(joins[table]["table"])
+            i += 4
+
+        return required, aliases
+
+    @staticmethod
+    def _dimension(tokens: List[tuple], scope: _Scope) -> Optional[str]:
+        """Rollup column for a dimension expression over the same tables, if the rollup has one"""
+        qualified = scope.qualify(tokens)
+        return None if qualified is None else scope.dimension_columns.get(qualified)
+
+    def _rewrite_expression(self, tokens: List[tuple], group_columns: List[str], aliases: set,
+                            scope: _Scope) -> Optional[str]:
+        """Rewrite a select/having/order expression onto rollup columns"""
+        column = self._dimension(tokens, scope)
+        if column is not None:
+            return quote_identifier(column) if column in group_columns else None
+
+        parts = []
+        i = 0
+        while i < len(tokens):
+            kind, text = tokens[i][0], tokens[i][1]
+            followed_by_call = i + 1 < len(tokens) and tokens[i + 1][1] == "("
+            if kind == "name" and followed_by_call and text.lower() in AGGREGATES:
+                end = matching_paren(tokens, i + 1)
+                if end < 0:
+                    return None
+                aggregate = self._rewrite_aggregate(text.lower(), tokens[i + 2:end], scope)
+                if aggregate is None:
+                    return None
+                parts.append(aggregate)
+                i = end + 1
+                continue
+            if kind == "name" and not followed_by_call and text.lower() not in LITERAL_NAMES:
+                column = self._dimension([tokens[i]], scope)
+                if column is not None and column in group_columns:
+                    parts.append(quote_identifier(column))
+                elif split_name(text)[1].lower() in aliases:
+                    parts.append(text)
+                else:
+                    return None
+            elif kind == "param":
+                return None
+            else:
+                parts.append(text)
+            i += 1
+        return " ".join(parts)
+
+    @staticmethod
+    def _rewrite_aggregate(function: str, argument: List[tuple], scope: _Scope) -> Optional[str]:
+        """Map an aggregate over the base rows to one over the rollup's partial aggregates"""
+        if function == "count" and len(argument) == 1 and argument[0][1] == "*":
+            return 'COALESCE(SUM("row_count"), 0)'
+
+        qualified = scope.qualify(argument)
+        measure = None if qualified is None else scope.measure_columns.get(qualified)
+        if measure is None:
+            return None
+
+        def column(prefix):
+            return quote_identifier(f"{prefix}_{measure}")
+
+        if function == "sum":
+            return f"SUM({column('sum')})"
+        if function == "total":
+            return f"TOTAL({column('sum')})"
+        if function == "count":
+            return f"COALESCE(SUM({column('count')}), 0)"
+        if function == "avg":
+            return f"CAST(SUM({column('sum')}) AS REAL) / SUM({column('count')})"
+        if function == "min":
+            return f"MIN({column('min')})"
+        return f"MAX({column('max')})"
+
+    def _rewrite_condition(self, tokens: List[tuple], scope: _Scope) -> Optional[str]:
+        """Rewrite a WHERE condition that only compares dimension expressions with constants"""
+        disjuncts = split_top_level(tokens, "or")
+        if len(disjuncts) > 1:
+            parts = [self._rewrite_condition(part, scope) for part in disjuncts]
+            return None if None in parts else " OR ".join(f"({part})" for part in parts)
+
+        conjuncts = self._split_conjuncts(tokens)
+        if len(conjuncts) > 1:
+            parts = [self._rewrite_condition(part, scope) for part in conjuncts]
+            return None if None in parts else " AND ".join(f"({part})" for part in parts)
+
+        if tokens and tokens[0][1].lower() == "not":
+            inner = self._rewrite_condition(tokens[1:], scope)
+            return None if inner is None else f"NOT ({inner})"
+        if tokens and tokens[0][1] == "(" and matching_paren(tokens, 0) == len(tokens) - 1:
+            return self._rewrite_condition(tokens[1:-1], scope)
+
+        # <dimension expression> <operator> <constant expression>
+        depth = 0
+        for i, token in enumerate(tokens):
+            if token[1] == "(":
+                depth += 1
+            elif token[1] == ")":
+                depth -= 1
+            elif depth == 0 and token[1].lower() in ("=", "==", "!=", "<>", "<", ">", "<=", ">=", "in", "not",
+                                                     "between", "like", "glob", "is"):
+                column = self._dimension(tokens[:i], scope)
+                if column is None:
+                    return None
+                rest = tokens[i:]
+                for j, other in enumerate(rest):
+                    if other[0] == "name" and other[1].lower() not in LITERAL_NAMES \
+                            and not (j + 1 < len(rest) and rest[j + 1][1] == "("):
+                        return None
+                    if other[1].lower() == "select":
+                        return None
+                return quote_identifier(column) + " " + " ".join(token[1] for token in rest)
+        return None
+
+    @staticmethod
+    def _split_conjuncts(tokens: List[tuple]) -> List[List[tuple]]:
+        """Split on top-level AND, keeping BETWEEN x AND y together"""
+        parts: List[List[tuple]] = [[]]
+        depth = 0
+        pending_between = False
+        for token in tokens:
+            lower = token[1].lower()
+            if token[1] == "(":
+                depth += 1
+            elif token[1] == ")":
+                depth -= 1
+            if depth == 0 and lower == "between":
+                pending_between = True
+            elif depth == 0 and lower == "and":
+                if pending_between:
+                    pending_between = False
+                else:
+                    parts.append([])
+                    continue
+            parts[-1].append(token)
+        return parts
+
+class PreAggregator:
+    """Incrementally refreshed rollups of a source SQLite database, kept in a sidecar file"""
+
+    def __init__(self, rollups: List[Dict[str, Any]], directory: str = "data/rollups", **_):
+        self.definitions = [RollupDefinition(**rollup) for rollup in rollups]
+        self.rewriters = {definition.name: RollupRewriter(definition) for definition in self.definitions}
+        self.directory = directory
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # (sidecar, rollup) pairs whose source lacks the needed tables or columns
+        self._unavailable: Dict[Tuple[str, str], int] = {}
+        # Source database -> (schema version, columns of the rollups' tables)
+        self._columns: Dict[str, Tuple[int, Dict[str, Set[str]]]] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def sidecar_path(self, db_path: str) -> str:
+        """Rollup database for a source database"""
+        source = os.path.abspath(db_path)
+        digest = hashlib.sha1(source.encode()).hexdigest()[:10]
+        base = os.path.splitext(os.path.basename(source))[0]
+        return os.path.abspath(os.path.join(self.directory, f"{base}-{digest}.rollups.db"))
+
+    def rewrite(self, query: str, db_path: str) -> Optional[Tuple[str, str, str]]:
+        """Rewrite a query onto the smallest fresh rollup that answers it.
+
+        Returns (rollup database path, rewritten SQL, rollup name) or None.
+        """
+        try:
+            columns = self._source_columns(db_path)
+        except sqlite3.Error:
+            return None
+
+        candidates = []
+        for definition in self.definitions:
+            sql = self.rewriters[definition.name].rewrite(query, columns)
+            if sql is not None:
+                candidates.append((len(definition.dimensions), definition, sql))
+
+        for _, definition, sql in sorted(candidates, key=lambda candidate: candidate[0]):
+            state = self.refresh(db_path, definition)
+            if state is not None:
+                return self.sidecar_path(db_path), sql, definition.name
+        return None
+
+    def _source_columns(self, db_path: str) -> Dict[str, Set[str]]:
+        """Lowercase column names of the rollups' source tables in a database, cached per schema version"""
+        source = os.path.abspath(db_path)
+        conn = sqlite3.connect(f"file:{quote(source)}?mode=ro", uri=True)
+        try:
+            schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+            cached = self._columns.get(source)
+            if cached is not None and cached[0] == schema_version:
+                return cached[1]
+            tables = {table for definition in self.definitions for table in definition.tables}
+            columns = {
+                table: {row[1].lower() for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")}
+                for table in tables
+            }
+        finally:
+            conn.close()
+        self._columns[source] = (schema_version, columns)
+        return columns
+
+    def refresh(self, db_path: str, definition: RollupDefinition, rebuild: bool = False) -> Optional[Dict[str, Any]]:
+        """Bring a rollup up to date with its source; None if the source cannot support it"""
+        sidecar = self.sidecar_path(db_path)
+        with self._lock_for(sidecar):
+            conn = sqlite3.connect(sidecar)
+            try:
+                conn.execute("ATTACH DATABASE ? AS src", (f"file:{quote(os.path.abspath(db_path))}?mode=ro",))
+                schema_version = conn.execute("PRAGMA src.schema_version").fetchone()[0]
+                if self._unavailable.get((sidecar, definition.name)) == schema_version:
+                    return None
+                try:
+                    return self._refresh(conn, definition, schema_version, rebuild)
+                except sqlite3.OperationalError:
+                    # The source lacks a table or column the rollup needs
+                    conn.rollback()
+                    self._unavailable[(sidecar, definition.name)] = schema_version
+                    return None
+            finally:
+                conn.close()
+
+    def refresh_all(self, db_path: str, rebuild: bool = False) -> List[Dict[str, Any]]:
+        """Refresh every configured rollup for a source database"""
+        results = []
+        for definition in self.definitions:
+            state = self.refresh(db_path, definition, rebuild)
+            results.append(state or {"name": definition.name, "available": False})
+        return results
+
+    def status(self, db_path: str) -> List[Dict[str, Any]]:
+        """Stored state of each rollup without refreshing it"""
+        sidecar = self.sidecar_path(db_path)
+        states = {}
+        if os.path.exists(sidecar):
+            conn = sqlite3.connect(sidecar)
+            try:
+                self._ensure_state_table(conn)
+                for row in conn.execute(
+                        "SELECT name, high_water, row_count, refreshed_at FROM _rollup_state").fetchall():
+                    states[row[0]] = {"high_water": row[1], "row_count": row[2], "refreshed_at": row[3]}
+            finally:
+                conn.close()
+        return [
+            {"name": definition.name, "dimensions": list(definition.dimensions), "measures": definition.measures,
+             "built": definition.name in states, **states.get(definition.name, {})}
+            for definition in self.definitions
+        ]
+
+    def _lock_for(self, sidecar: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(sidecar, threading.Lock())
+
+    @staticmethod
+    def _ensure_state_table(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _rollup_state (name TEXT PRIMARY KEY, definition TEXT, "
+            "dimension_signature TEXT, high_water INTEGER, row_count INTEGER, refreshed_at REAL)"
+        )
+
+    def _refresh(self, conn: sqlite3.Connection, definition: RollupDefinition, schema_version: int,
+                 rebuild: bool) -> Dict[str, Any]:
+        self._ensure_state_table(conn)
+        fact = f"src.{quote_identifier(definition.fact_table)}"
+        high_water = conn.execute(f"SELECT MAX({quote_identifier(definition.key)}) FROM {fact}").fetchone()[0] or 0
+
+        # Any change to the (small) joined dimension tables' contents invalidates the whole rollup
+        digest = hashlib.sha1(str(schema_version).encode())
+        for join in definition.joins:
+            digest.update(join["table"].encode())
+            for dimension_row in conn.execute(f"SELECT rowid, * FROM src.{quote_identifier(join['table'])} ORDER BY rowid"):
+                digest.update(json.dumps(dimension_row, default=str).encode())
+        dimension_signature = digest.hexdigest()
+
+        row = conn.execute(
+            "SELECT definition, dimension_signature, high_water FROM _rollup_state WHERE name = ?", (definition.name,)
+        ).fetchone()
+        table = quote_identifier(definition.table)
+        stale = rebuild or row is None or row[0] != definition.signature() or row[1] != dimension_signature \
+            or high_water < row[2]
+        if not stale and high_water == row[2]:
+            return {"name": definition.name, "high_water": high_water, "row_count": None, "refreshed": False}
+
+        # Replace the contents in one transaction so readers never see a partial rollup
+        conn.execute("BEGIN IMMEDIATE")
+        if stale:
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"CREATE TABLE {table} AS {definition.source_sql()}")
+        else:
+            # Aggregate only the rows appended since the last refresh and merge them in
+            conn.execute(f"CREATE TEMP TABLE rollup_delta AS {definition.source_sql(row[2], high_water)}")
+            conn.execute(f"CREATE TEMP TABLE rollup_merged AS {definition.merge_sql('temp.rollup_delta')}")
+            conn.execute(f"DELETE FROM {table}")
+            conn.execute(f"INSERT INTO {table} SELECT * FROM temp.rollup_merged")
+            conn.execute("DROP TABLE temp.rollup_delta")
+            conn.execute("DROP TABLE temp.rollup_merged")
+
+        row_count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        conn.execute(
+            "INSERT OR REPLACE INTO _rollup_state VALUES (?, ?, ?, ?, ?, ?)",
+            (definition.name, definition.signature(), dimension_signature, high_water, row_count, time.time())
+        )
+        conn.commit()
+        return {"name": definition.name, "high_water": high_water, "row_count": row_count, "refreshed": True}
@@ -0,0 +1,183 @@
+import json
+import math
+from collections import Counter
+from typing import Dict, Any, List, Optional, Iterable
+
+from .sql_results import to_records
+from .llm_output import estimate_tokens
+
+# Placed before compacted data, so the model does not mistake the sample for the dataset
+_COMPACTED_NOTE = (
+    "Note: the dataset has {row_count} rows, too many to include. Below are its columns, a profile of each "
+    "column and a sample of rows, not the full data. Base totals and statistics on row_count and the profile, "
+    "and do not embed the sample rows in code as if they were the complete dataset."
+)
+_TRUNCATED_NOTE = (
+    "Note: the dataset is too large to include and is cut off below. "
+    "Do not embed it in code as if it were the complete dataset."
+)
+
+def _kind(values: List[Any]) -> str:
+    """JSON type of a column's non-null values: number, boolean, string or mixed"""
+    kinds = set()
+    for value in values:
+        if isinstance(value, bool):
+            kinds.add("boolean")
+        elif isinstance(value, (int, float)):
+            kinds.add("number")
+        else:
+            kinds.add("string")
+        if len(kinds) > 1:
+            return "mixed"
+    return kinds.pop() if kinds else "null"
+
+class PromptCompactor:
+    """Replaces query results too large for a prompt's token budget with a profile and a sample"""
+
+    def __init__(self, default_budget_tokens: int = 4000, model_budgets: Optional[Dict[str, int]] = None,
+                 max_sample_rows: int = 50, max_categories: int = 10, max_strata: int = 10,
+                 max_value_length: int = 200, enabled: bool = True, **_):
+        self.default_budget_tokens = default_budget_tokens
+        self.model_budgets = model_budgets or {}
+        self.max_sample_rows = max_sample_rows
+        self.max_categories = max_categories
+        self.max_strata = max_strata
+        self.max_value_length = max_value_length
+        self.enabled = enabled
+
+    def budget(self, models: Iterable[str] = ()) -> int:
+        """Tokens of data a prompt may inline when it can go to any of these models"""
+        return min((self.model_budgets.get(model, self.default_budget_tokens) for model in models),
+                   default=self.default_budget_tokens)
+
+    def compact(self, data_json: str, models: Iterable[str] = ()) -> str:
+        """data_json if it fits every model's budget, otherwise a note and a compact description of it"""
+        budget = self.budget(models)
+        if not self.enabled or estimate_tokens(data_json) <= budget:
+            return data_json
+
+        try:
+            records = to_records(data_json)
+        except (ValueError, TypeError, KeyError):
+            records = None
+        if not records or not all(isinstance(record, dict) for record in records):
+            return _TRUNCATED_NOTE + "\n" + self._truncate(data_json, budget - self._note_tokens(_TRUNCATED_NOTE))
+
+        row_count = self._row_count(data_json, len(records))
+        note = _COMPACTED_NOTE.format(row_count=row_count)
+        budget -= self._note_tokens(note)
+
+        names = list(dict.fromkeys(name for record in records for name in record))
+        columns = {name: [record.get(name) for record in records] for name in names}
+        profile = {name: self._profile(values) for name, values in columns.items()}
+        document = {
+            "compacted": True,
+            "row_count": row_count,
+            "columns": [{"name": name, "type": profile[name]["type"]} for name in names],
+            "profile": profile
+        }
+
+        extremes = self._extremes(columns, profile)
+        stratum_column = self._stratum_column(profile)
+        size = self.max_sample_rows
+        while True:
+            if size > 0:
+                indexes = self._sample(records, stratum_column, extremes, size)
+                document["sample"] = {
+                    "columns": names,
+                    "data": [[self._clip(records[index].get(name)) for name in names] for index in indexes]
+                }
+            else:
+                document.pop("sample", None)
+            text = json.dumps(document, default=str)
+            if estimate_tokens(text) <= budget or size == 0:
+                break
+            size //= 2
+
+        if estimate_tokens(text) > budget:
+            # Too many columns even for a profile: keep the schema only
+            document.pop("profile")
+            text = json.dumps(document, default=str)
+            if estimate_tokens(text) > budget:
+                text = self._truncate(text, budget)
+        return note + "\n" + text
+
+    @staticmethod
+    def _note_tokens(note: str) -> int:
+        """Tokens a note and its line break take from the budget, rounded up"""
+        return -(-(len(note) + 1) // 4)
+
+    @staticmethod
+    def _row_count(data_json: str, rows: int) -> int:
+        """Rows in the whole result: its row_count when it carries one (e.g. a resolved spill sample)"""
+        try:
+            payload = json.loads(data_json)
+        except (TypeError, ValueError):
+            return rows
+        row_count = payload.get("row_count") if isinstance(payload, dict) else None
+        return row_count if isinstance(row_count, int) and row_count >= rows else rows
+
+    def _profile(self, values: List[Any]) -> Dict[str, Any]:
+        """Type, null count and either the range and mean or the most common values of a column"""
+        present = [value for value in values if value is not None]
+        kind = _kind(present)
+        profile = {"type": kind, "nulls": len(values) - len(present)}
+
+        if kind == "number":
+            # NaN and infinities (which json.loads accepts) have no place in a range or mean
+            finite = [value for value in present if not (isinstance(value, float) and not math.isfinite(value))]
+            if len(finite) < len(present):
+                profile["non_finite"] = len(present) - len(finite)
+            if finite:
+                profile.update(min=min(finite), max=max(finite), mean=round(sum(finite) / len(finite), 6))
+        elif present:
+            counts = Counter(value if isinstance(value, (str, int, float, bool)) else json.dumps(value, default=str)
+                             for value in present)
+            profile["distinct"] = len(counts)
+            profile["top"] = [[self._clip(value), count] for value, count in counts.most_common(self.max_categories)]
+        return profile
+
+    @staticmethod
+    def _extremes(columns: Dict[str, List[Any]], profile: Dict[str, Dict[str, Any]]) -> List[int]:
+        """Indexes of the first rows holding each numeric column's minimum and maximum"""
+        indexes = []
+        for name, values in columns.items():
+            if "min" not in profile[name]:
+                continue
+            for target in (profile[name]["min"], profile[name]["max"]):
+                indexes.append(next(index for index, value in enumerate(values) if value == target))
+        return list(dict.fromkeys(indexes))
+
+    def _stratum_column(self, profile: Dict[str, Dict[str, Any]]) -> Optional[str]:
+        """The first categorical column with between 2 and max_strata values, if any"""
+        for name, column in profile.items():
+            if column["type"] in ("string", "boolean") and 2 <= column.get("distinct", 0) <= self.max_strata:
+                return name
+        return None
+
+    @staticmethod
+    def _sample(records: List[Dict[str, Any]], stratum_column: Optional[str], extremes: List[int], size: int) -> List[int]:
+        """Row indexes of the sample: the extremes plus evenly spaced rows from every stratum, in data order"""
+        strata: Dict[Any, List[int]] = {}
+        for index, record in enumerate(records):
+            key = record.get(stratum_column) if stratum_column is not None else None
+            strata.setdefault(json.dumps(key, default=str), []).append(index)
+
+        remaining = max(0, size - len(extremes))
+        chosen = set(extremes)
+        for members in strata.values():
+            quota = min(len(members), max(1, round(remaining * len(members) / len(records)))) if remaining else 0
+            chosen.update(members[int(i * len(members) / quota)] for i in range(quota))
+        return sorted(chosen)
+
+    def _clip(self, value: Any) -> Any:
+        """A value with long text shortened to max_value_length characters"""
+        if isinstance(value, str) and len(value) > self.max_value_length:
+            return value[:self.max_value_length] + "..."
+        return value
+
+    @staticmethod
+    def _truncate(text: str, budget: int) -> str:
+        """Data that cannot be profiled, cut to the budget"""
+        marker = "\n... [truncated]"
+        return text[:max(0, budget * 4 - len(marker))] + marker
@@ -0,0 +1,149 @@
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, Optional
+
+class BudgetExceeded(Exception):
+    """Raised when a query runs past one of its budgets"""
+
+    def __init__(self, budget: str, limit: Any, partial: Dict[str, Any]):
+        super().__init__(f"Query exceeded its {budget} budget ({limit})")
+        self.budget = budget
+        self.limit = limit
+        self.partial = partial
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Structured error payload returned to the caller"""
+        return {
+            "error": "budget_exceeded",
+            "budget": self.budget,
+            "limit": self.limit,
+            "message": str(self),
+            "partial": self.partial
+        }
+
+class QueryBudget:
+    """Wall-clock, VM-step, row and byte budgets for a single SQLite query.
+
+    The time and VM-step budgets are enforced by a progress handler that
+    SQLite calls every progress_interval virtual machine instructions, so a
+    runaway statement is aborted even while no rows are being returned.
+    cancel() may be called from another thread to abort the query at once.
+    Connections without a progress handler (e.g. DuckDB) get the time budget
+    from a timer that interrupts them instead. A limit of 0 disables that
+    budget.
+    """
+
+    def __init__(self, timeout_seconds: float = 30.0, max_vm_steps: int = 0, max_rows: int = 0,
+                 max_bytes: int = 0, progress_interval: int = 10000, **_):
+        self.timeout_seconds = timeout_seconds
+        self.max_vm_steps = max_vm_steps
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.progress_interval = progress_interval
+
+        self.started_at = time.monotonic()
+        self.vm_steps = 0
+        self.rows = 0
+        self.bytes = 0
+        self.exceeded: Optional[BudgetExceeded] = None
+        self.cancelled = False
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def install(self, conn: sqlite3.Connection):
+        """Attach the progress handler to a connection for the next query"""
+        with self._lock:
+            self._conn = conn
+            self.started_at = time.monotonic()
+            cancelled = self.cancelled
+        if hasattr(conn, "set_progress_handler"):
+            conn.set_progress_handler(self._on_progress, self.progress_interval)
+        elif self.timeout_seconds:
+            self._timer = threading.Timer(self.timeout_seconds, self._on_timeout)
+            self._timer.daemon = True
+            self._timer.start()
+        if cancelled:
+            conn.interrupt()
+
+    def uninstall(self, conn: sqlite3.Connection):
+        """Detach the progress handler before the connection is reused"""
+        if hasattr(conn, "set_progress_handler"):
+            conn.set_progress_handler(None, 0)
+        with self._lock:
+            self._conn = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def cancel(self):
+        """Abort the query, e.g. because the MCP request was abandoned"""
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def remaining_seconds(self) -> Optional[float]:
+        """Time left in the wall-clock budget, or None when it is unlimited"""
+        if not self.timeout_seconds:
+            return None
+        return max(0.0, self.timeout_seconds - (time.monotonic() - self.started_at))
+
+    def account(self, rows: int, nbytes: int = 0):
+        """Record fetched rows and bytes, raising once a cap is passed"""
+        self.rows += rows
+        self.bytes += nbytes
+        if self.max_rows and self.rows > self.max_rows:
+            self._exceed("rows", self.max_rows)
+        if self.max_bytes and self.bytes > self.max_bytes:
+            self._exceed("bytes", self.max_bytes)
+        if self.exceeded is not None:
+            raise self.exceeded
+
+    def partial(self) -> Dict[str, Any]:
+        """Metadata about the work done before the query was stopped"""
+        return {
+            "rows_fetched": self.rows,
+            "bytes_fetched": self.bytes,
+            "vm_steps": self.vm_steps,
+            "elapsed_ms": round((time.monotonic() - self.started_at) * 1000, 1)
+        }
+
+    def _exceed(self, budget: str, limit: Any):
+        """Remember the first budget that was exceeded"""
+        if self.exceeded is None:
+            self.exceeded = BudgetExceeded(budget, limit, self.partial())
+
+    def _on_progress(self) -> int:
+        """SQLite progress callback; a non-zero return aborts the statement"""
+        self.vm_steps += self.progress_interval
+
+        if self.cancelled:
+            self._exceed("cancelled", None)
+        elif self.timeout_seconds and time.monotonic() - self.started_at > self.timeout_seconds:
+            self._exceed("time", self.timeout_seconds)
+        elif self.max_vm_steps and self.vm_steps > self.max_vm_steps:
+            self._exceed("vm_steps", self.max_vm_steps)
+
+        return 1 if self.exceeded is not None else 0
+
+    def _on_timeout(self):
+        """Timer callback for connections without a progress handler"""
+        with self._lock:
+            self._exceed("time", self.timeout_seconds)
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def error_for(self, exc: BaseException) -> Optional[BudgetExceeded]:
+        """Map an interrupted-query error back to the budget that caused it"""
+        if isinstance(exc, BudgetExceeded):
+            return exc
+        # sqlite3 raises OperationalError when interrupted, other engines their own errors
+        if isinstance(exc, Exception) and (self.exceeded is not None or self.cancelled):
+            if self.exceeded is None:
+                self._exceed("cancelled", None)
+            self.exceeded.partial = self.partial()
+            return self.exceeded
+        return None
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Quoted literals and identifiers are kept verbatim during normalization
+_QUOTED_PATTERN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+def normalize_sql(query: str) -> str:
+    """Normalize whitespace and keyword case so trivially different SQL shares a key"""
+    parts = _QUOTED_PATTERN.split(query.strip().rstrip(";").strip())
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            normalized.append(part)
+        else:
+            # Drop -- comments, collapse whitespace and lowercase outside quotes
+            part = re.sub(r"--[^\n]*", " ", part)
+            normalized.append(re.sub(r"\s+", " ", part).lower())
+    return "".join(normalized).strip()
+
+def database_stamp(db_path: str) -> Tuple[int, int, int, int]:
+    """Cheap data version of a SQLite file: mtime and size of the file and its WAL"""
+    stat = os.stat(db_path)
+    try:
+        wal = os.stat(db_path + "-wal")
+        wal_stamp = (wal.st_mtime_ns, wal.st_size)
+    except FileNotFoundError:
+        wal_stamp = (0, 0)
+    return (stat.st_mtime_ns, stat.st_size) + wal_stamp
+
+class QueryResultCache:
+    """LRU cache of serialized query results bounded by total bytes.
+
+    Entries are keyed by normalized SQL, database file and any extra options,
+    and are valid only while the database stamp is unchanged and their TTL
+    has not expired. Validation is a stat() call, so hits never touch SQLite.
+    Entries evicted from memory can optionally be spilled to disk.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0,
+                 spill_dir: Optional[str] = None, **_):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self.purge_spill()
+
+    def make_key(self, query: str, db_path: str, **options) -> str:
+        """Build the cache key for a query against a database"""
+        raw = json.dumps([normalize_sql(query), os.path.abspath(db_path), options], sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, query: str, db_path: str, **options) -> Optional[str]:
+        """Return the cached result if it is still valid"""
+        key = self.make_key(query, db_path, **options)
+        stamp = database_stamp(db_path)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["stamp"] == stamp and entry["expires_at"] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["value"]
+                self._remove(key)
+
+        # Fall back to the on-disk spill
+        entry = self._read_spill(key)
+        if entry is not None and tuple(entry["stamp"]) == stamp and entry["expires_at"] > now:
+            with self._lock:
+                self._insert(key, entry["value"], stamp, entry["expires_at"])
+                self.hits += 1
+            return entry["value"]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, query: str, db_path: str, value: str, ttl: Optional[float] = None,
+            stamp: Optional[Tuple] = None, **options):
+        """Cache a serialized result for a query.
+
+        Pass the stamp taken before the query ran so a write that lands while
+        it executes invalidates the entry instead of being masked by it.
+        """
+        key = self.make_key(query, db_path, **options)
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._insert(key, value, stamp or database_stamp(db_path), expires_at)
+
+    def clear(self):
+        """Drop all in-memory entries"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def purge_spill(self) -> int:
+        """Delete expired spill files and return how many were removed"""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    expired = json.load(f)["expires_at"] <= now
+            except (OSError, ValueError, KeyError):
+                expired = True
+            if expired:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _insert(self, key: str, value: str, stamp: Tuple, expires_at: float):
+        """Add an entry and evict least recently used ones; the caller holds the lock"""
+        size = len(value)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = {"value": value, "stamp": stamp, "expires_at": expires_at, "size": size}
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["size"]
+            self._write_spill(evicted_key, evicted)
+
+    def _remove(self, key: str):
+        """Remove an entry; the caller holds the lock"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.json")
+
+    def _write_spill(self, key: str, entry: Dict[str, Any]):
+        """Persist an evicted entry to disk if spilling is enabled"""
+        if not self.spill_dir or entry["expires_at"] <= time.time():
+            return
+
+        path = self._spill_path(key)
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"value": entry["value"], "stamp": entry["stamp"], "expires_at": entry["expires_at"]}, f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+
+    def _read_spill(self, key: str) -> Optional[Dict[str, Any]]:
+        """Load and remove a spilled entry, if present"""
+        if not self.spill_dir:
+            return None
+
+        path = self._spill_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.remove(path)
+            return entry
+        except (OSError, json.JSONDecodeError):
+            return None
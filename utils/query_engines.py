@@ -0,0 +1,316 @@
+import os
+import glob
+import datetime
+import decimal
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+from .sql_parsing import tokenize_sql, tokenize_sql_spans, split_select_clauses, split_top_level, split_alias, output_column_name
+
+# Connection string schemes and the kind of source they point at
+SCHEMES = {
+    "sqlite:///": "sqlite",
+    "duckdb:///": "duckdb",
+    "parquet:///": "parquet"
+}
+
+# Functions that mark a query as an analytical scan worth a columnar engine
+ANALYTICAL_FUNCTIONS = {"sum", "count", "avg", "min", "max", "total", "group_concat", "stddev", "variance", "median"}
+
+_SQLITE_HEADER = b"SQLite format 3\x00"
+
+def parse_connection_string(connection_string: str) -> Tuple[str, str]:
+    """Split a connection string into its source kind and path.
+
+    sqlite:///file.db is a SQLite file, duckdb:///file is a SQLite or DuckDB
+    file read by DuckDB, and parquet:///path is a Parquet file, directory or
+    glob. A bare path is treated as a SQLite file.
+    """
+    for prefix, kind in SCHEMES.items():
+        if connection_string.startswith(prefix):
+            return kind, connection_string[len(prefix):]
+    return "sqlite", connection_string
+
+def is_analytical(query: str) -> bool:
+    """Whether a query aggregates or groups, rather than looking up rows"""
+    tokens = tokenize_sql(query)
+    for i, (kind, text) in enumerate(tokens):
+        lower = text.lower()
+        if lower == "group" and i + 1 < len(tokens) and tokens[i + 1][1].lower() == "by":
+            return True
+        if kind == "name" and lower in ANALYTICAL_FUNCTIONS and i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+            return True
+    return False
+
+def paged_engine_query(query: str, max_rows: int, offset: int) -> Tuple[str, tuple]:
+    """Like sql_results.paged_query, without SQLite's LIMIT -1 for "no limit" """
+    inner = query.strip().rstrip(";")
+    if max_rows:
+        return f"SELECT * FROM (\n{inner}\n) LIMIT ? OFFSET ?", (max_rows + 1, offset)
+    return f"SELECT * FROM (\n{inner}\n) OFFSET ?", (offset,)
+
+def sqlite_column_names(query: str, columns: List[str]) -> List[str]:
+    """Name unaliased result columns the way SQLite does (COUNT(*), not count_star())"""
+    query = query.strip().rstrip(";").rstrip()
+    clauses = split_select_clauses(tokenize_sql_spans(query))
+    if clauses is None or "select" not in clauses:
+        return columns
+    items = split_top_level(clauses["select"], ",")
+    if len(items) != len(columns):
+        return columns
+
+    names = []
+    for item, column in zip(items, columns):
+        expression, alias = split_alias(item)
+        if alias is not None or not expression or expression[-1][1].endswith("*"):
+            names.append(column)
+        else:
+            names.append(output_column_name(query, expression))
+    return names
+
+def _sqlite_value(value: Any) -> Any:
+    """Convert a DuckDB value to what sqlite3 would have returned for it"""
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value.isoformat()
+    return str(value)
+
+class EngineCursor:
+    """DB-API cursor wrapper whose rows hold only SQLite-compatible values.
+
+    Keeps fetch_or_spill and serialize_result producing exactly the same JSON
+    whichever engine ran the query.
+    """
+
+    def __init__(self, cursor, columns: Optional[List[str]] = None):
+        self._cursor = cursor
+        self.description = cursor.description
+        if columns is not None:
+            self.description = [(name,) + tuple(description[1:]) for name, description in zip(columns, self.description)]
+
+    def fetchmany(self, size: int) -> List[tuple]:
+        return [tuple(_sqlite_value(value) for value in row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self) -> List[tuple]:
+        return [tuple(_sqlite_value(value) for value in row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+class DuckDBEngine:
+    """Vectorized, multi-threaded DuckDB engine over local SQLite, DuckDB or Parquet data.
+
+    One in-process DuckDB database is kept per source; SQLite files are
+    attached read-only through the sqlite extension and Parquet files are
+    exposed as views named after the file (or directory, for partitioned
+    datasets). Each query runs on its own cursor of that database.
+    """
+
+    def __init__(self, threads: int = 0, memory_limit: str = "", extension_directory: str = "", **_):
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self.extension_directory = extension_directory
+
+        self._databases: Dict[Tuple[str, str, float], Any] = {}
+        # Borrowed cursors per database, and replaced databases left for their last borrower to close
+        self._borrowers: Dict[Tuple[str, str, float], int] = {}
+        self._retired: Dict[Tuple[str, str, float], Any] = {}
+        self._lock = threading.Lock()
+        # Why the sqlite extension could not be installed or loaded; not retried while the process lives
+        self.sqlite_extension_error: Optional[str] = None
+
+    @staticmethod
+    def available() -> bool:
+        """Whether the duckdb package is installed"""
+        try:
+            import duckdb  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _config(self) -> Dict[str, Any]:
+        """Database settings from the engine configuration"""
+        config: Dict[str, Any] = {}
+        if self.threads:
+            config["threads"] = self.threads
+        if self.memory_limit:
+            config["memory_limit"] = self.memory_limit
+        if self.extension_directory:
+            config["extension_directory"] = self.extension_directory
+        return config
+
+    def _open(self, kind: str, path: str):
+        """Open a DuckDB database over a source"""
+        import duckdb
+
+        if kind == "duckdb" and not _is_sqlite_file(path):
+            return duckdb.connect(path, read_only=True, config=self._config())
+
+        if kind in ("sqlite", "duckdb") and self.sqlite_extension_error is not None:
+            raise RuntimeError(f"DuckDB sqlite extension unavailable: {self.sqlite_extension_error}")
+
+        database = duckdb.connect(":memory:", config=self._config())
+        if kind in ("sqlite", "duckdb"):
+            try:
+                self._load_sqlite_extension(database)
+            except duckdb.Error as e:
+                database.close()
+                self.sqlite_extension_error = str(e)
+                raise
+            database.execute(f"ATTACH {_string_literal(path)} AS src (TYPE sqlite, READ_ONLY)")
+        else:
+            for name, pattern in parquet_views(path).items():
+                database.execute(
+                    f'CREATE VIEW "{name}" AS SELECT * FROM read_parquet({_string_literal(pattern)}, hive_partitioning = true)'
+                )
+        return database
+
+    @staticmethod
+    def _load_sqlite_extension(database):
+        """Load the sqlite extension, installing it (which may download it) only when it is missing"""
+        import duckdb
+
+        try:
+            database.execute("LOAD sqlite")
+        except duckdb.Error:
+            database.execute("INSTALL sqlite")
+            database.execute("LOAD sqlite")
+
+    def _borrow(self, kind: str, path: str) -> Tuple[Tuple[str, str, float], Any]:
+        """The shared database for a source (reopened when the source changes on disk) and its key, counted as borrowed"""
+        path = os.path.abspath(path)
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            if kind != "parquet":
+                raise
+            modified = 0.0
+        key = (kind, path, modified)
+
+        with self._lock:
+            database = self._databases.get(key)
+            if database is None:
+                for stale in [old for old in self._databases if old[:2] == key[:2]]:
+                    self._retire(stale)
+                database = self._databases[key] = self._open(kind, path)
+            self._borrowers[key] = self._borrowers.get(key, 0) + 1
+            return key, database
+
+    def _release(self, key: Tuple[str, str, float]):
+        """Return a borrowed database, closing it if it was replaced and this was its last borrower"""
+        with self._lock:
+            self._borrowers[key] -= 1
+            if not self._borrowers[key]:
+                del self._borrowers[key]
+                if key in self._retired:
+                    self._retired.pop(key).close()
+
+    def _retire(self, key: Tuple[str, str, float]):
+        """Stop sharing a database; it is closed now or, while cursors are borrowed from it, by the last one"""
+        database = self._databases.pop(key)
+        if self._borrowers.get(key):
+            self._retired[key] = database
+        else:
+            database.close()
+
+    @contextmanager
+    def connection(self, kind: str, path: str):
+        """Borrow a cursor on the source's database for the duration of a with block"""
+        key, database = self._borrow(kind, path)
+        try:
+            conn = database.cursor()
+            try:
+                if kind == "sqlite" or (kind == "duckdb" and _is_sqlite_file(path)):
+                    # Session settings: resolve unqualified names in the SQLite file and divide integers like SQLite
+                    conn.execute("USE src")
+                    conn.execute("SET integer_division = true")
+                yield conn
+            finally:
+                conn.close()
+        finally:
+            self._release(key)
+
+    def execute(self, conn, query: str, max_rows: int = 0, offset: int = 0) -> EngineCursor:
+        """Run a query (one page of it, when paging) and return a cursor with SQLite-compatible rows"""
+        if max_rows or offset:
+            sql, params = paged_engine_query(query, max_rows, offset)
+            cursor = conn.execute(sql, list(params))
+        else:
+            cursor = conn.execute(query)
+        columns = sqlite_column_names(query, [description[0] for description in cursor.description or []])
+        return EngineCursor(cursor, columns)
+
+    def close(self):
+        """Close every open database; those with borrowed cursors close when the cursors are returned"""
+        with self._lock:
+            for key in list(self._databases):
+                self._retire(key)
+
+class QueryEngineRouter:
+    """Chooses the engine that runs a query from its connection string.
+
+    sqlite:/// sources run on SQLite unless sqlite_engine is "duckdb" (every
+    query) or "auto" (analytical queries, when DuckDB is installed and its
+    sqlite extension has not failed to load); duckdb:/// and parquet:///
+    sources always run on DuckDB.
+    """
+
+    def __init__(self, sqlite_engine: str = "sqlite", duckdb: Optional[Dict[str, Any]] = None, **_):
+        if sqlite_engine not in ("sqlite", "duckdb", "auto"):
+            raise ValueError(f"Unsupported SQLite engine setting: {sqlite_engine}")
+        self.sqlite_engine = sqlite_engine
+        self.duckdb = DuckDBEngine(**(duckdb or {}))
+
+    def route(self, connection_string: str, query: str) -> Tuple[str, str, Optional[DuckDBEngine]]:
+        """Return (source kind, path, DuckDB engine or None to use SQLite)"""
+        kind, path = parse_connection_string(connection_string)
+
+        if kind != "sqlite":
+            if not self.duckdb.available():
+                raise ImportError(f"duckdb is required for {kind}:/// connection strings")
+            return kind, path, self.duckdb
+
+        if self.sqlite_engine == "duckdb" or (self.sqlite_engine == "auto" and is_analytical(query)):
+            if self.duckdb.available() and self.duckdb.sqlite_extension_error is None:
+                return kind, path, self.duckdb
+        return kind, path, None
+
+def parquet_views(path: str) -> Dict[str, str]:
+    """View name -> read_parquet pattern for a Parquet file, glob or directory"""
+    if os.path.isfile(path):
+        return {_view_name(path): path}
+    if not os.path.isdir(path):
+        return {_view_name(path.split("*")[0].rstrip("/_")) or "data": path}
+
+    views = {}
+    for entry in sorted(os.listdir(path)):
+        full_path = os.path.join(path, entry)
+        if os.path.isdir(full_path) and glob.glob(os.path.join(full_path, "**", "*.parquet"), recursive=True):
+            # Hive-style partitioned dataset, e.g. sales/year=2024/part-0.parquet
+            views[_view_name(entry)] = os.path.join(full_path, "**", "*.parquet")
+        elif entry.endswith(".parquet"):
+            views[_view_name(entry)] = full_path
+    return views
+
+def _view_name(path: str) -> str:
+    """Table name for a Parquet file or dataset directory"""
+    name = os.path.basename(path.rstrip("/"))
+    if name.endswith(".parquet"):
+        name = name[:-len(".parquet")]
+    return name.replace('"', "")
+
+def _is_sqlite_file(path: str) -> bool:
+    """Whether a file starts with the SQLite header"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_SQLITE_HEADER)) == _SQLITE_HEADER
+    except OSError:
+        return False
+
+def _string_literal(value: str) -> str:
+    """Quote a value as an SQL string literal"""
+    return "'" + value.replace("'", "''") + "'"
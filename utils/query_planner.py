@@ -0,0 +1,324 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional
+
+from .sql_parsing import extract_predicates, query_fingerprint, query_shape, table_references
+
+# "SCAN sales", "SCAN s", "SCAN TABLE sales AS s USING INDEX ..." (older SQLite)
+_SCAN_PATTERN = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS (\S+))?(?: (.*))?$")
+_SEARCH_PATTERN = re.compile(r"^SEARCH (?:TABLE )?(\S+)(?: AS (\S+))? USING AUTOMATIC")
+
+def quote_identifier(name: str) -> str:
+    """Quote an identifier for use in generated SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
+def explain_query_plan(conn: sqlite3.Connection, query: str) -> List[Dict[str, Any]]:
+    """Run EXPLAIN QUERY PLAN and return its rows; the query itself is only prepared.
+
+    EXPLAIN never checks the schema cookie, so a pooled connection would keep
+    planning against the schema it first loaded and a cached EXPLAIN statement
+    would never be re-prepared. A real read reloads a changed schema, and the
+    schema version in the statement text keeps stale cached plans from being reused.
+    """
+    conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    rows = conn.execute(f"EXPLAIN QUERY PLAN /* schema {version} */ " + query.strip().rstrip(";")).fetchall()
+    return [{"id": row[0], "parent": row[1], "detail": row[3]} for row in rows]
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[Dict[str, Any]]:
+    """Column names and primary-key positions of a table"""
+    rows = conn.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall()
+    return [{"name": row[1], "type": row[2], "pk": row[5]} for row in rows]
+
+def table_indexes(conn: sqlite3.Connection, table: str) -> List[List[str]]:
+    """Column lists of the existing indexes on a table"""
+    indexes = []
+    for row in conn.execute(f"PRAGMA index_list({quote_identifier(table)})").fetchall():
+        columns = [info[2] for info in conn.execute(f"PRAGMA index_info({quote_identifier(row[1])})").fetchall()]
+        indexes.append(columns)
+    return indexes
+
+def estimate_rows(conn: sqlite3.Connection, table: str) -> int:
+    """Cheap row count estimate: the largest rowid, or COUNT(*) for WITHOUT ROWID tables"""
+    try:
+        return conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(table)}").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table)}").fetchone()[0]
+
+def scanned_tables(plan: List[Dict[str, Any]], aliases: Dict[str, str]) -> List[str]:
+    """Tables read by a full scan (or a per-query automatic index) in a query plan"""
+    tables = []
+    for step in plan:
+        detail = step["detail"]
+        match = _SCAN_PATTERN.match(detail)
+        if match:
+            rest = match.group(3) or ""
+            if "INDEX" in rest and "AUTOMATIC" not in rest:
+                continue
+        else:
+            match = _SEARCH_PATTERN.match(detail)
+            if not match:
+                continue
+        name = (match.group(2) or match.group(1)).lower()
+        table = aliases.get(name)
+        if table is not None and table not in tables:
+            tables.append(table)
+    return tables
+
+def resolve_predicates(conn: sqlite3.Connection, query: str, aliases: Dict[str, str]) -> Dict[str, Dict[str, List[str]]]:
+    """Attribute the query's filter, join and grouping columns to its tables"""
+    columns = {}
+    for table in set(aliases.values()):
+        try:
+            columns[table] = {column["name"].lower(): column["name"] for column in table_columns(conn, table)}
+        except sqlite3.DatabaseError:
+            continue
+
+    usage: Dict[str, Dict[str, List[str]]] = {}
+
+    def add(ref: Dict[str, Any], kind: str):
+        if ref["qualifier"] is not None:
+            candidates = [aliases.get(ref["qualifier"].lower())]
+        else:
+            candidates = list(columns)
+        for table in candidates:
+            column = columns.get(table, {}).get(ref["column"].lower())
+            if column is not None:
+                entry = usage.setdefault(table, {"equality": [], "range": [], "join": [], "group_by": []})
+                if column not in entry[kind]:
+                    entry[kind].append(column)
+                return
+
+    predicates = extract_predicates(query)
+    for ref in predicates["filters"]:
+        add(ref, ref["kind"])
+    for join in predicates["joins"]:
+        add(join["left"], "join")
+        add(join["right"], "join")
+    for ref in predicates["group_by"]:
+        add(ref, "group_by")
+    return usage
+
+class QueryShapeLog:
+    """Aggregated log of the query shapes seen per database.
+
+    A shape is the query with its literals replaced by placeholders. For each
+    shape we keep how often it ran, which tables it fully scanned and which
+    columns it filtered, joined and grouped on. The log is bounded to
+    max_shapes (least recently seen shapes are dropped) and periodically
+    written to a JSON file so recommendations survive restarts.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_shapes: int = 1000, flush_every: int = 20, **_):
+        self.path = path
+        self.max_shapes = max_shapes
+        self.flush_every = flush_every
+
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._shapes = json.load(f)
+            except (OSError, ValueError):
+                self._shapes = {}
+
+    def record(self, query: str, db_path: str, full_scans: List[Dict[str, Any]],
+               columns: Dict[str, Dict[str, List[str]]]):
+        """Count one execution of a query's shape"""
+        key = f"{os.path.abspath(db_path)}:{query_fingerprint(query)}"
+        now = time.time()
+
+        with self._lock:
+            entry = self._shapes.get(key)
+            if entry is None:
+                entry = self._shapes[key] = {
+                    "shape": query_shape(query),
+                    "db_path": os.path.abspath(db_path),
+                    "count": 0,
+                    "first_seen": now
+                }
+            entry["count"] += 1
+            entry["last_seen"] = now
+            entry["full_scans"] = full_scans
+            entry["columns"] = columns
+
+            if len(self._shapes) > self.max_shapes:
+                oldest = min(self._shapes, key=lambda k: self._shapes[k]["last_seen"])
+                del self._shapes[oldest]
+
+            self._pending += 1
+            if self.path and self._pending >= self.flush_every:
+                self._flush()
+
+    def shapes(self, db_path: Optional[str] = None, limit: int = 0) -> List[Dict[str, Any]]:
+        """Logged shapes, most frequent first, optionally for one database"""
+        with self._lock:
+            entries = [
+                dict(entry) for entry in self._shapes.values()
+                if db_path is None or entry["db_path"] == os.path.abspath(db_path)
+            ]
+        entries.sort(key=lambda entry: entry["count"], reverse=True)
+        return entries[:limit] if limit else entries
+
+    def flush(self):
+        """Write the log to disk"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        """Write the log atomically; the caller holds the lock"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        try:
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self._shapes, f)
+            os.replace(self.path + ".tmp", self.path)
+            self._pending = 0
+        except OSError:
+            pass
+
+class QueryPlanGate:
+    """Inspects every query's plan before it runs.
+
+    Full scans of tables with at least large_table_rows rows are flagged. In
+    "warn" mode flagged queries still run and are only recorded in the shape
+    log; in "block" mode they are rejected before execution.
+    """
+
+    def __init__(self, mode: str = "warn", large_table_rows: int = 10000,
+                 shape_log: Optional[QueryShapeLog] = None, **_):
+        if mode not in ("warn", "block"):
+            raise ValueError(f"Unsupported plan gate mode: {mode}")
+        self.mode = mode
+        self.large_table_rows = large_table_rows
+        self.shape_log = shape_log
+
+    def inspect(self, conn: sqlite3.Connection, query: str, db_path: Optional[str] = None) -> Dict[str, Any]:
+        """Explain a query, flag large full scans and record its shape"""
+        plan = explain_query_plan(conn, query)
+        aliases = table_references(query)
+
+        full_scans = []
+        for table in scanned_tables(plan, aliases):
+            rows = estimate_rows(conn, table)
+            if rows >= self.large_table_rows:
+                full_scans.append({"table": table, "rows": rows})
+
+        if self.shape_log is not None and db_path is not None:
+            self.shape_log.record(query, db_path, full_scans, resolve_predicates(conn, query, aliases))
+
+        warnings = [
+            f"Full scan of {scan['table']} (~{scan['rows']} rows); consider an index on its filter or join columns"
+            for scan in full_scans
+        ]
+        return {
+            "plan": plan,
+            "full_scans": full_scans,
+            "warnings": warnings,
+            "blocked": self.mode == "block" and bool(full_scans)
+        }
+
+class IndexAdvisor:
+    """Recommends indexes from the predicates recorded in a QueryShapeLog.
+
+    For every shape that fully scanned a table, the candidate index is that
+    table's equality columns followed by one range column, or failing that
+    each join column. Candidates are weighted by execution count and table
+    size, merged when one is a prefix of another, and dropped when an
+    existing index or the rowid already serves them.
+    """
+
+    def __init__(self, shape_log: QueryShapeLog, max_recommendations: int = 5, min_occurrences: int = 1, **_):
+        self.shape_log = shape_log
+        self.max_recommendations = max_recommendations
+        self.min_occurrences = min_occurrences
+
+    def recommend(self, conn: sqlite3.Connection, db_path: str) -> List[Dict[str, Any]]:
+        """Rank index candidates for a database"""
+        candidates: Dict[tuple, Dict[str, Any]] = {}
+
+        for entry in self.shape_log.shapes(db_path):
+            if entry["count"] < self.min_occurrences:
+                continue
+            for scan in entry.get("full_scans", []):
+                usage = entry.get("columns", {}).get(scan["table"])
+                if not usage:
+                    continue
+                if usage["equality"] or usage["range"]:
+                    column_sets = [usage["equality"] + usage["range"][:1]]
+                else:
+                    column_sets = [[column] for column in usage["join"]]
+
+                for columns in column_sets:
+                    key = (scan["table"], tuple(columns))
+                    candidate = candidates.setdefault(key, {
+                        "table": scan["table"], "columns": list(columns), "score": 0, "shapes": []
+                    })
+                    candidate["score"] += entry["count"] * scan["rows"]
+                    candidate["shapes"].append(entry["shape"])
+
+        # Longer indexes also serve queries on their prefixes
+        accepted: List[Dict[str, Any]] = []
+        for candidate in sorted(candidates.values(), key=lambda c: len(c["columns"]), reverse=True):
+            for existing in accepted:
+                if existing["table"] == candidate["table"] and \
+                        existing["columns"][:len(candidate["columns"])] == candidate["columns"]:
+                    existing["score"] += candidate["score"]
+                    existing["shapes"].extend(candidate["shapes"])
+                    break
+            else:
+                accepted.append(candidate)
+
+        recommendations = []
+        for candidate in accepted:
+            table, columns = candidate["table"], candidate["columns"]
+            if self._is_served(conn, table, columns):
+                continue
+            name = "idx_" + "_".join(re.sub(r"\W", "_", part) for part in [table] + columns)
+            recommendations.append({
+                "table": table,
+                "columns": columns,
+                "index_name": name,
+                "statement": (
+                    f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} ON {quote_identifier(table)} "
+                    f"({', '.join(quote_identifier(column) for column in columns)})"
+                ),
+                "score": candidate["score"],
+                "shapes": sorted(set(candidate["shapes"]))
+            })
+
+        recommendations.sort(key=lambda recommendation: recommendation["score"], reverse=True)
+        return recommendations[:self.max_recommendations]
+
+    def apply(self, db_path: str, recommendations: List[Dict[str, Any]]) -> List[str]:
+        """Create recommended indexes on a writable connection and refresh planner statistics"""
+        conn = sqlite3.connect(db_path)
+        try:
+            for recommendation in recommendations:
+                conn.execute(recommendation["statement"])
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+        return [recommendation["index_name"] for recommendation in recommendations]
+
+    @staticmethod
+    def _is_served(conn: sqlite3.Connection, table: str, columns: List[str]) -> bool:
+        """Whether an existing index (or the integer primary key) already leads with these columns"""
+        lowered = [column.lower() for column in columns]
+        for index in table_indexes(conn, table):
+            if [column.lower() for column in index if column][:len(lowered)] == lowered:
+                return True
+        primary_keys = [column for column in table_columns(conn, table) if column["pk"]]
+        return (
+            len(primary_keys) == 1 and primary_keys[0]["type"].upper() == "INTEGER"
+            and primary_keys[0]["name"].lower() == lowered[0]
+        )
@@ -0,0 +1,347 @@
+import os
+import math
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from statistics import NormalDist
+from urllib.parse import quote
+from typing import Dict, Any, List, Optional, Tuple
+
+from .sql_parsing import (
+    tokenize_sql_spans, matching_paren, split_top_level, split_alias, output_column_name, table_references
+)
+from .query_planner import quote_identifier
+
+# Aggregates whose value grows with the number of rows and must be scaled up
+SCALED_AGGREGATES = {"sum", "count", "total"}
+
+class ApproximateQuery:
+    """A query rewritten to run on a uniform sample, plus how to turn its output into estimates.
+
+    SUM/COUNT/TOTAL are multiplied by population_rows / sample_rows in SQL.
+    For every top-level select item that is a bare SUM, COUNT, TOTAL or AVG,
+    hidden columns carry the raw sample moments needed for a normal-theory
+    confidence interval; result() strips them and returns the half-widths.
+    """
+
+    def __init__(self, sql: str, table: str, bounds: List[Dict[str, Any]], sample_rows: int,
+                 population_rows: int, confidence: float, warnings: List[str]):
+        self.sql = sql
+        self.table = table
+        self.bounds = bounds
+        self.sample_rows = sample_rows
+        self.population_rows = population_rows
+        self.confidence = confidence
+        self.warnings = warnings
+
+    def result(self, columns: List[str], rows: List[tuple]) -> Tuple[List[str], List[tuple], Dict[str, Any]]:
+        """Drop hidden columns and compute error bounds; returns (columns, rows, metadata)"""
+        hidden = {column for bound in self.bounds for column in bound["moments"].values()}
+        index = {column: i for i, column in enumerate(columns)}
+        keep = [i for i, column in enumerate(columns) if column not in hidden]
+
+        n, population = self.sample_rows, self.population_rows
+        z = NormalDist().inv_cdf((1 + self.confidence) / 2)
+        correction = max(0.0, 1 - n / population) if population else 0.0
+
+        error_bounds: Dict[str, List[Optional[float]]] = {}
+        for bound in self.bounds:
+            moments = bound["moments"]
+            half_widths = []
+            for row in rows:
+                values = {name: row[index[column]] for name, column in moments.items()}
+                half_widths.append(self._half_width(bound["function"], values, n, population, correction, z))
+            error_bounds[bound["column"]] = half_widths
+
+        metadata = {
+            "approximate": True,
+            "sampled_table": self.table,
+            "sample_rows": n,
+            "population_rows": population,
+            "sample_fraction": round(n / population, 6) if population else 1.0,
+            "confidence": self.confidence,
+            "error_bounds": error_bounds,
+            "warnings": self.warnings
+        }
+        return [columns[i] for i in keep], [tuple(row[i] for i in keep) for row in rows], metadata
+
+    @staticmethod
+    def _half_width(function: str, values: Dict[str, Any], n: int, population: int,
+                    correction: float, z: float) -> Optional[float]:
+        """Confidence interval half-width for one estimate"""
+        if function == "avg":
+            count, total, squares = values["count"] or 0, values["sum"] or 0.0, values["squares"] or 0.0
+            if count < 2:
+                return None
+            variance = max(0.0, (squares - total * total / count) / (count - 1))
+            return z * math.sqrt(variance / count * correction)
+
+        # Totals: the estimate is N * mean(y) over all sample rows, with y = 0 outside the group
+        if n < 2:
+            return None
+        total = values["sum"] or 0.0
+        squares = values.get("squares", total) or 0.0
+        variance = max(0.0, (squares - total * total / n) / (n - 1))
+        return z * population * math.sqrt(correction * variance / n)
+
+class SampleStore:
+    """Uniform reservoir samples of large tables, kept in a sidecar database per source.
+
+    Each sampled table gets a table of the same name in the sidecar holding
+    at most sample_size rows. New rows above the append-only key's high-water
+    mark are fed through reservoir sampling (Algorithm R) on refresh, so the
+    sample stays uniform over the whole table without rescanning it. The
+    source database is attached read-only when queries run, so joins to
+    tables that are not sampled read the originals.
+    """
+
+    def __init__(self, tables: List[Dict[str, Any]], directory: str = "data/samples",
+                 confidence: float = 0.95, batch_size: int = 10000, **_):
+        self.tables = {table["table"].lower(): table for table in tables}
+        self.directory = directory
+        self.confidence = confidence
+        self.batch_size = batch_size
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def sidecar_path(self, db_path: str) -> str:
+        """Sample database for a source database"""
+        source = os.path.abspath(db_path)
+        digest = hashlib.sha1(source.encode()).hexdigest()[:10]
+        base = os.path.splitext(os.path.basename(source))[0]
+        return os.path.abspath(os.path.join(self.directory, f"{base}-{digest}.samples.db"))
+
+    @staticmethod
+    def attach_source(conn: sqlite3.Connection, db_path: str):
+        """Attach the source database (read-only) to a sidecar connection if needed"""
+        if not any(row[1] == "src" for row in conn.execute("PRAGMA database_list").fetchall()):
+            conn.execute("ATTACH DATABASE ? AS src", (f"file:{quote(os.path.abspath(db_path))}?mode=ro",))
+
+    def plan(self, query: str, db_path: str) -> Tuple[Optional[ApproximateQuery], Optional[str]]:
+        """Rewrite a query to run on a fresh sample; returns (plan, reason it cannot be sampled)"""
+        referenced = {table.lower() for table in table_references(query).values()}
+        sampled = [name for name in referenced if name in self.tables]
+        if not sampled:
+            return None, "Query does not read a sampled table"
+        if len(sampled) > 1:
+            return None, "Query reads more than one sampled table"
+
+        config = self.tables[sampled[0]]
+        state = self.refresh(db_path, config["table"])
+        if state is None:
+            return None, f"Table {config['table']} cannot be sampled in this database"
+
+        n, population = state["sample_rows"], state["population_rows"]
+        scale = population / n if n else 1.0
+        rewritten = rewrite_for_sample(query, scale)
+        if rewritten is None:
+            return None, "Query uses an aggregate that cannot be estimated from a sample"
+        sql, bounds, warnings = rewritten
+        return ApproximateQuery(sql, config["table"], bounds, n, population, self.confidence, warnings), None
+
+    def refresh(self, db_path: str, table: str, rebuild: bool = False) -> Optional[Dict[str, Any]]:
+        """Feed rows appended since the last refresh through the reservoir"""
+        config = self.tables[table.lower()]
+        sidecar = self.sidecar_path(db_path)
+        with self._lock_for(sidecar):
+            conn = sqlite3.connect(sidecar)
+            try:
+                self.attach_source(conn, db_path)
+                return self._refresh(conn, config, rebuild)
+            except sqlite3.OperationalError:
+                # The source lacks the table or its key column
+                conn.rollback()
+                return None
+            finally:
+                conn.close()
+
+    def status(self, db_path: str) -> List[Dict[str, Any]]:
+        """Stored state of each sample without refreshing it"""
+        sidecar = self.sidecar_path(db_path)
+        states = {}
+        if os.path.exists(sidecar):
+            conn = sqlite3.connect(sidecar)
+            try:
+                self._ensure_state_table(conn)
+                for row in conn.execute(
+                        "SELECT name, sample_rows, population_rows, high_water, refreshed_at FROM _sample_state"):
+                    states[row[0].lower()] = {
+                        "sample_rows": row[1], "population_rows": row[2], "high_water": row[3], "refreshed_at": row[4]
+                    }
+            finally:
+                conn.close()
+        return [
+            {"table": config["table"], "sample_size": config.get("sample_size", 10000), "built": name in states,
+             **states.get(name, {})}
+            for name, config in self.tables.items()
+        ]
+
+    def _lock_for(self, sidecar: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(sidecar, threading.Lock())
+
+    @staticmethod
+    def _ensure_state_table(conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _sample_state (name TEXT PRIMARY KEY, sample_rows INTEGER, "
+            "population_rows INTEGER, high_water INTEGER, refreshed_at REAL)"
+        )
+
+    def _refresh(self, conn: sqlite3.Connection, config: Dict[str, Any], rebuild: bool) -> Dict[str, Any]:
+        self._ensure_state_table(conn)
+        table, key = config["table"], config.get("key", "rowid")
+        capacity = config.get("sample_size", 10000)
+        source = f"src.{quote_identifier(table)}"
+        high_water = conn.execute(f"SELECT MAX({quote_identifier(key)}) FROM {source}").fetchone()[0] or 0
+
+        row = conn.execute(
+            "SELECT sample_rows, population_rows, high_water FROM _sample_state WHERE name = ?", (table,)
+        ).fetchone()
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone() is not None
+
+        if row is not None and exists and not rebuild and high_water == row[2]:
+            return {"table": table, "sample_rows": row[0], "population_rows": row[1], "refreshed": False}
+
+        conn.execute("BEGIN IMMEDIATE")
+        if rebuild or row is None or not exists or high_water < row[2]:
+            # Start over: the key went backwards or there is no usable sample yet
+            conn.execute(f"DROP TABLE IF EXISTS main.{quote_identifier(table)}")
+            conn.execute(f"CREATE TABLE main.{quote_identifier(table)} AS SELECT * FROM {source} WHERE 0")
+            sample_rows, population, low = 0, 0, None
+        else:
+            sample_rows, population, low = row[0], row[1], row[2]
+
+        columns = [info[1] for info in conn.execute(f"PRAGMA main.table_info({quote_identifier(table)})")]
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+        insert = (
+            f"INSERT OR REPLACE INTO main.{quote_identifier(table)} "
+            f"(rowid, {', '.join(quote_identifier(column) for column in columns)}) VALUES ({placeholders})"
+        )
+
+        where = f"WHERE {quote_identifier(key)} <= ?" if low is None else \
+            f"WHERE {quote_identifier(key)} > ? AND {quote_identifier(key)} <= ?"
+        params = (high_water,) if low is None else (low, high_water)
+        cursor = conn.execute(
+            f"SELECT {', '.join(quote_identifier(column) for column in columns)} FROM {source} {where}", params
+        )
+
+        # Algorithm R: the i-th row replaces a random slot with probability capacity / i
+        rng = random.Random()
+        while True:
+            batch = cursor.fetchmany(self.batch_size)
+            if not batch:
+                break
+            slots: Dict[int, tuple] = {}
+            for values in batch:
+                population += 1
+                if population <= capacity:
+                    slots[population - 1] = values
+                else:
+                    slot = rng.randrange(population)
+                    if slot < capacity:
+                        slots[slot] = values
+            conn.executemany(insert, [(slot,) + tuple(values) for slot, values in slots.items()])
+        sample_rows = min(population, capacity)
+
+        conn.execute(
+            "INSERT OR REPLACE INTO _sample_state VALUES (?, ?, ?, ?, ?)",
+            (table, sample_rows, population, high_water, time.time())
+        )
+        conn.commit()
+        return {"table": table, "sample_rows": sample_rows, "population_rows": population, "refreshed": True}
+
+def rewrite_for_sample(query: str, scale: float) -> Optional[Tuple[str, List[Dict[str, Any]], List[str]]]:
+    """Scale up row-count-dependent aggregates and add the moments needed for error bounds.
+
+    Returns (sql, bounds, warnings), or None when the query aggregates in a
+    way a uniform sample cannot estimate (COUNT(DISTINCT ...)).
+    """
+    query = query.strip().rstrip(";").rstrip()
+    spans = tokenize_sql_spans(query)
+    # (start, end, replacement, order); inserts at the same offset are applied in descending order
+    edits: List[Tuple[int, int, str, int]] = []
+    warnings: List[str] = []
+    aggregated = False
+
+    for i, token in enumerate(spans):
+        lower = token[1].lower()
+        if token[0] != "name" or i + 1 >= len(spans) or spans[i + 1][1] != "(":
+            continue
+        aggregated = aggregated or lower in SCALED_AGGREGATES | {"avg", "min", "max"}
+        if lower in ("min", "max") and i + 2 < len(spans) and spans[i + 2][1] != ")":
+            warnings.append(f"{token[1].upper()} is taken over the sample and may miss extreme values")
+        if lower not in SCALED_AGGREGATES:
+            continue
+        end = matching_paren(spans, i + 1)
+        if end < 0:
+            return None
+        if i + 2 < len(spans) and spans[i + 2][1].lower() == "distinct":
+            return None
+        edits.append((token[2], spans[end][3], f"({query[token[2]:spans[end][3]]} * {scale!r})", 0))
+
+    # Locate the top-level select list to name outputs and append hidden moment columns
+    bounds: List[Dict[str, Any]] = []
+    depth = 0
+    select_start = select_end = None
+    compound = False
+    for i, token in enumerate(spans):
+        if token[1] == "(":
+            depth += 1
+        elif token[1] == ")":
+            depth -= 1
+        elif depth == 0 and token[1].lower() == "select" and select_start is None:
+            select_start = i + 1
+        elif depth == 0 and token[1].lower() == "from" and select_end is None and select_start is not None:
+            select_end = i
+        elif depth == 0 and token[1].lower() in ("union", "intersect", "except"):
+            compound = True
+
+    if select_start is not None and select_end is not None and not compound \
+            and spans[select_start][1].lower() not in ("distinct", "all"):
+        extra = []
+        for item in split_top_level(spans[select_start:select_end], ","):
+            expression, alias = split_alias(item)
+            if not expression:
+                continue
+            name = alias or output_column_name(query, expression)
+            if alias is None and any(start >= expression[0][2] and end <= expression[-1][3] for start, end, _, _ in edits):
+                # Keep the column name SQLite would have given the original expression
+                edits.append((item[-1][3], item[-1][3], f" AS {quote_identifier(name)}", 1))
+
+            function = expression[0][1].lower()
+            if not (expression[0][0] == "name" and len(expression) > 3 and expression[1][1] == "("
+                    and matching_paren(expression, 1) == len(expression) - 1
+                    and function in SCALED_AGGREGATES | {"avg"}):
+                continue
+            argument = query[expression[2][2]:expression[-2][3]] if len(expression) > 3 else "*"
+            prefix = f"__bound_{len(bounds)}"
+            moments = {}
+            if function == "count":
+                condition = "1" if argument.strip() == "*" else f"({argument}) IS NOT NULL"
+                extra.append(f"SUM(CASE WHEN {condition} THEN 1 ELSE 0 END) AS {quote_identifier(prefix + '_sum')}")
+                moments["sum"] = prefix + "_sum"
+            else:
+                extra.append(f"SUM({argument}) AS {quote_identifier(prefix + '_sum')}")
+                extra.append(f"SUM(({argument}) * ({argument})) AS {quote_identifier(prefix + '_squares')}")
+                moments["sum"] = prefix + "_sum"
+                moments["squares"] = prefix + "_squares"
+                if function == "avg":
+                    extra.append(f"COUNT({argument}) AS {quote_identifier(prefix + '_count')}")
+                    moments["count"] = prefix + "_count"
+            bounds.append({"column": name, "function": "avg" if function == "avg" else "total", "moments": moments})
+
+        if extra:
+            position = spans[select_end - 1][3]
+            edits.append((position, position, ", " + ", ".join(extra), 2))
+
+    if not aggregated:
+        warnings.append("Rows are a uniform sample of the table, not the full result")
+
+    for start, end, replacement, _ in sorted(edits, key=lambda edit: (edit[0], edit[1], edit[3]), reverse=True):
+        query = query[:start] + replacement + query[end:]
+    return query, bounds, warnings
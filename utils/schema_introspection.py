@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from .query_planner import quote_identifier, estimate_rows
+from .query_cache import database_stamp
+
+# Declared types whose columns are never listed as categorical values
+_CONTINUOUS_AFFINITIES = ("REAL", "FLOA", "DOUB", "BLOB")
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """SQLite's schema cookie; it changes whenever a table, index or view changes"""
+    return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+class SchemaIntrospector:
+    """Builds schema documents for SQLite databases and caches them per schema version.
+
+    A document lists every table and view with its columns (declared type,
+    nullability, default, primary key), indexes, foreign keys, estimated
+    row count and, for low-cardinality columns, their distinct values taken
+    from the first sample_rows rows. The expensive part is only redone when
+    PRAGMA schema_version changes; row counts are refreshed when the file
+    changes.
+    """
+
+    def __init__(self, max_distinct_values: int = 20, sample_rows: int = 10000, max_value_length: int = 64, **_):
+        self.max_distinct_values = max_distinct_values
+        self.sample_rows = sample_rows
+        self.max_value_length = max_value_length
+
+        # db path -> (schema version, document); db path -> (file stamp, row counts)
+        self._documents: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._row_counts: Dict[str, Tuple[tuple, Dict[str, int]]] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, conn: sqlite3.Connection, db_path: str) -> Dict[str, Any]:
+        """The schema document for a database, rebuilt only after a schema change"""
+        key = os.path.abspath(db_path)
+        version = schema_version(conn)
+
+        with self._lock:
+            cached = self._documents.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, self._build(conn, version))
+            with self._lock:
+                self._documents[key] = cached
+        document = cached[1]
+
+        stamp = database_stamp(db_path)
+        with self._lock:
+            counted = self._row_counts.get(key)
+        if counted is None or counted[0] != stamp:
+            counts = {table["name"]: estimate_rows(conn, table["name"]) for table in document["tables"] if table["type"] == "table"}
+            counted = (stamp, counts)
+            with self._lock:
+                self._row_counts[key] = counted
+
+        return {
+            **document,
+            "tables": [
+                {**table, "row_count": counted[1][table["name"]]} if table["name"] in counted[1] else table
+                for table in document["tables"]
+            ]
+        }
+
+    def _build(self, conn: sqlite3.Connection, version: int) -> Dict[str, Any]:
+        """Introspect every user table and view"""
+        objects = conn.execute(
+            "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY type, name"
+        ).fetchall()
+
+        tables = []
+        for name, kind in objects:
+            columns = self._columns(conn, name)
+            table = {"name": name, "type": kind, "columns": columns}
+            if kind == "table":
+                table["indexes"] = self._indexes(conn, name)
+                table["foreign_keys"] = self._foreign_keys(conn, name)
+            tables.append(table)
+
+        return {"schema_version": version, "tables": tables}
+
+    def _columns(self, conn: sqlite3.Connection, table: str) -> List[Dict[str, Any]]:
+        """Column definitions plus the values of low-cardinality columns"""
+        columns = []
+        for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall():
+            column = {"name": row[1], "type": row[2] or "", "nullable": not row[3], "primary_key": bool(row[5])}
+            if row[4] is not None:
+                column["default"] = row[4]
+            if not row[5] and not (row[2] or "").upper().startswith(_CONTINUOUS_AFFINITIES):
+                values = self._distinct_values(conn, table, row[1])
+                if values is not None:
+                    column["values"] = values
+            columns.append(column)
+        return columns
+
+    def _distinct_values(self, conn: sqlite3.Connection, table: str, column: str) -> Optional[List[Any]]:
+        """Distinct values of a column in a row sample, or None if there are too many"""
+        rows = conn.execute(
+            f"SELECT DISTINCT value FROM (SELECT {quote_identifier(column)} AS value FROM {quote_identifier(table)} LIMIT ?) "
+            f"WHERE value IS NOT NULL LIMIT ?",
+            (self.sample_rows, self.max_distinct_values + 1)
+        ).fetchall()
+        if not rows or len(rows) > self.max_distinct_values:
+            return None
+
+        values = [row[0] for row in rows]
+        if any(isinstance(value, bytes) or (isinstance(value, str) and len(value) > self.max_value_length) for value in values):
+            return None
+        return sorted(values, key=lambda value: (isinstance(value, str), value))
+
+    @staticmethod
+    def _indexes(conn: sqlite3.Connection, table: str) -> List[Dict[str, Any]]:
+        """Named indexes with their columns and uniqueness"""
+        indexes = []
+        for row in conn.execute(f"PRAGMA index_list({quote_identifier(table)})").fetchall():
+            columns = [info[2] for info in conn.execute(f"PRAGMA index_info({quote_identifier(row[1])})").fetchall()]
+            indexes.append({"name": row[1], "columns": columns, "unique": bool(row[2])})
+        return indexes
+
+    @staticmethod
+    def _foreign_keys(conn: sqlite3.Connection, table: str) -> List[Dict[str, Any]]:
+        """Declared foreign keys"""
+        return [
+            {"column": row[3], "references_table": row[2], "references_column": row[4]}
+            for row in conn.execute(f"PRAGMA foreign_key_list({quote_identifier(table)})").fetchall()
+        ]
@@ -0,0 +1,140 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Set
+
+import numpy as np
+
+class SchemaRetriever:
+    """Selects the tables of a schema document that are relevant to a question.
+
+    Every table and every column gets a short text description that is
+    embedded once; vectors are cached by the hash of their description, so
+    after a schema change only the tables that actually changed are
+    re-embedded. A table scores the best cosine similarity of its own or any
+    of its columns' descriptions to the question. The top_k tables are kept
+    together with the tables they reference (by a declared foreign key or a
+    <table>_id column), so lookups through joins stay possible. Schemas with
+    at most min_tables tables are passed through unchanged.
+    """
+
+    def __init__(self, top_k: int = 5, min_tables: int = 8, embedding: Optional[Dict[str, Any]] = None,
+                 max_cached_embeddings: int = 50000, max_values: int = 10, embedding_model=None, **_):
+        self.top_k = top_k
+        self.min_tables = min_tables
+        self.embedding_config = embedding
+        self.max_cached_embeddings = max_cached_embeddings
+        self.max_values = max_values
+
+        self._model = embedding_model
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """Embedding model, loaded on first use"""
+        if self._model is None:
+            from ..models.embeddings import get_shared_embedding_model
+            self._model = get_shared_embedding_model(self.embedding_config)
+        return self._model
+
+    def prune_json(self, schema: str, question: str) -> str:
+        """prune() for a schema passed as JSON text; anything else is returned unchanged"""
+        try:
+            document = json.loads(schema)
+        except (TypeError, ValueError):
+            return schema
+        if not isinstance(document, dict) or not isinstance(document.get("tables"), list):
+            return schema
+        return json.dumps(self.prune(document, question))
+
+    def prune(self, document: Dict[str, Any], question: str) -> Dict[str, Any]:
+        """A copy of a schema document restricted to the tables relevant to the question"""
+        tables = document["tables"]
+        if len(tables) <= self.min_tables:
+            return document
+
+        scores = self.score(tables, question)
+        ranked = sorted(range(len(tables)), key=lambda i: scores[i], reverse=True)
+        selected = {tables[i]["name"] for i in ranked[:self.top_k]}
+        selected |= self._neighbours(tables, selected)
+
+        return {
+            **document,
+            "tables": [table for table in tables if table["name"] in selected],
+            "total_tables": len(tables)
+        }
+
+    def score(self, tables: List[Dict[str, Any]], question: str) -> List[float]:
+        """Relevance of each table to the question"""
+        descriptions = [[self._describe_table(table)] + [self._describe_column(table, column) for column in table.get("columns", [])]
+                        for table in tables]
+        vectors = self._embed([text for group in descriptions for text in group] + [question])
+        query = vectors[-1]
+
+        similarities = vectors[:-1] @ query
+        scores = []
+        position = 0
+        for group in descriptions:
+            scores.append(float(similarities[position:position + len(group)].max()))
+            position += len(group)
+        return scores
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """Normalized embeddings of texts, computing only those not cached yet"""
+        keys = [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+        # Vectors are collected here, so evictions by concurrent calls cannot lose them
+        vectors: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._vectors:
+                    self._vectors.move_to_end(key)
+                    vectors[key] = self._vectors[key]
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            encoded = np.atleast_2d(np.asarray(self.model.encode([text_by_key[key] for key in missing]), dtype=np.float32))
+            encoded /= np.maximum(np.linalg.norm(encoded, axis=1, keepdims=True), 1e-12)
+            with self._lock:
+                for key, vector in zip(missing, encoded):
+                    vectors[key] = self._vectors[key] = vector
+                while len(self._vectors) > self.max_cached_embeddings:
+                    self._vectors.popitem(last=False)
+
+        return np.stack([vectors[key] for key in keys])
+
+    def _describe_table(self, table: Dict[str, Any]) -> str:
+        """Text embedded for a whole table"""
+        columns = ", ".join(column["name"] for column in table.get("columns", []))
+        return f"table {table['name']} with columns {columns}"
+
+    def _describe_column(self, table: Dict[str, Any], column: Dict[str, Any]) -> str:
+        """Text embedded for one column, including some of its values"""
+        text = f"{table['name']}.{column['name']} {column.get('type', '')}".rstrip()
+        values = column.get("values")
+        if values:
+            text += ": " + ", ".join(str(value) for value in values[:self.max_values])
+        return text
+
+    @staticmethod
+    def _neighbours(tables: List[Dict[str, Any]], selected: Set[str]) -> Set[str]:
+        """Tables the selected ones reference by a declared or <table>_id foreign key"""
+        names = {table["name"].lower(): table["name"] for table in tables}
+
+        def references(table: Dict[str, Any]) -> Set[str]:
+            referenced = {foreign_key["references_table"] for foreign_key in table.get("foreign_keys", [])}
+            for column in table.get("columns", []):
+                name = column["name"].lower()
+                if name.endswith("_id") and len(name) > 3:
+                    stem = name[:-3]
+                    for candidate in (stem, stem + "s", stem + "es"):
+                        if candidate in names:
+                            referenced.add(names[candidate])
+            return referenced
+
+        neighbours = set()
+        for table in tables:
+            if table["name"] in selected:
+                neighbours |= references(table)
+        return neighbours - selected
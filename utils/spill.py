@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import uuid
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+SPILL_SCHEME = "spill://"
+
+class ResultSpillStore:
+    """Local files holding query results too large to pass around inline.
+
+    Files are columnar in row groups: a JSON header line with the column
+    names, followed by one JSON line per fetched batch holding that batch's
+    values column by column. Writers never hold more than one batch in
+    memory. Callers get a small handle with the schema, row count and a
+    sample; tools that need the data resolve the handle locally to at most
+    resolve_max_rows evenly spaced rows. Files older than ttl seconds are
+    garbage-collected on later writes and reads.
+    """
+
+    def __init__(self, directory: str = "data/spill", threshold_bytes: int = 1024 * 1024,
+                 ttl: float = 3600.0, sample_rows: int = 20, gc_interval: float = 600.0,
+                 resolve_max_rows: int = 5000, **_):
+        self.directory = os.path.abspath(directory)
+        self.threshold_bytes = threshold_bytes
+        self.ttl = ttl
+        self.sample_rows = sample_rows
+        self.gc_interval = gc_interval
+        self.resolve_max_rows = resolve_max_rows
+
+        self._last_gc = 0.0
+        self._gc_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def open_writer(self, columns: List[str]) -> "SpillWriter":
+        """Start a new spill file for a result with the given columns"""
+        self.collect_garbage()
+        spill_id = uuid.uuid4().hex
+        return SpillWriter(self, spill_id, os.path.join(self.directory, f"{spill_id}.jsonl"), columns)
+
+    def path_for(self, handle: str) -> str:
+        """Map a spill:// handle to its file, rejecting paths outside the store"""
+        if not handle.startswith(SPILL_SCHEME):
+            raise ValueError(f"Not a spill handle: {handle}")
+        spill_id = handle[len(SPILL_SCHEME):]
+        if not spill_id.isalnum():
+            raise ValueError(f"Invalid spill handle: {handle}")
+        return os.path.join(self.directory, f"{spill_id}.jsonl")
+
+    def read(self, handle: str) -> Tuple[List[str], List[tuple]]:
+        """Load a spilled result as (columns, rows)"""
+        path = self.path_for(handle)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Spilled result expired or missing: {handle}")
+
+        rows: List[tuple] = []
+        with open(path, "r", encoding="utf-8") as f:
+            columns = json.loads(f.readline())["columns"]
+            for line in f:
+                rows.extend(zip(*json.loads(line)))
+        return columns, rows
+
+    def read_sample(self, handle: str, max_rows: int, row_count: Optional[int] = None) -> Tuple[List[str], List[tuple]]:
+        """Load at most max_rows rows of a spilled result, one row group at a time.
+
+        With the result's row_count the rows are spread evenly over the
+        whole result, otherwise they are its first max_rows rows.
+        """
+        self.collect_garbage()
+        path = self.path_for(handle)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Spilled result expired or missing: {handle}")
+
+        step = row_count / max_rows if row_count and row_count > max_rows else 1.0
+        rows: List[tuple] = []
+        index = 0
+        with open(path, "r", encoding="utf-8") as f:
+            columns = json.loads(f.readline())["columns"]
+            for line in f:
+                for row in zip(*json.loads(line)):
+                    if index == int(len(rows) * step):
+                        rows.append(row)
+                        if len(rows) >= max_rows:
+                            return columns, rows
+                    index += 1
+        return columns, rows
+
+    def collect_garbage(self, force: bool = False) -> int:
+        """Delete expired spill files, at most once per gc_interval unless forced"""
+        now = time.time()
+        with self._gc_lock:
+            if not force and now - self._last_gc < self.gc_interval:
+                return 0
+            self._last_gc = now
+
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+class SpillWriter:
+    """Streams fetched batches into a single spill file"""
+
+    def __init__(self, store: ResultSpillStore, spill_id: str, path: str, columns: List[str]):
+        self.store = store
+        self.handle = f"{SPILL_SCHEME}{spill_id}"
+        self.path = path
+        self.columns = columns
+        self.row_count = 0
+        self.sample: List[list] = []
+        self.types: List[Optional[str]] = [None] * len(columns)
+
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write(json.dumps({"columns": columns}) + "\n")
+
+    def write_batch(self, rows: List[tuple]):
+        """Append one batch of rows as a columnar row group"""
+        if not rows:
+            return
+
+        self._file.write(json.dumps([list(column) for column in zip(*rows)]) + "\n")
+        self.row_count += len(rows)
+
+        for row in rows[:self.store.sample_rows - len(self.sample)]:
+            self.sample.append(list(row))
+
+        # Infer column types from the first non-null value seen
+        for i, value in enumerate(rows[0]):
+            if self.types[i] is None and value is not None:
+                self.types[i] = type(value).__name__
+
+    def close(self) -> Dict[str, Any]:
+        """Finish the file and return the handle payload"""
+        self._file.close()
+        return {
+            "handle": self.handle,
+            "schema": [{"name": name, "type": self.types[i] or "null"} for i, name in enumerate(self.columns)],
+            "row_count": self.row_count,
+            "sample": {"columns": self.columns, "data": self.sample},
+            "expires_at": time.time() + self.store.ttl
+        }
+
+    def abort(self):
+        """Discard a partially written file"""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def fetch_or_spill(cursor, store: Optional[ResultSpillStore], max_rows: int = 0,
+                   batch_size: int = 1000, budget=None):
+    """Stream rows from a cursor, spilling to disk once they exceed the threshold.
+
+    Returns (columns, rows, has_more, handle). When the result was spilled,
+    rows is empty and handle is the payload from SpillWriter.close(). If a
+    QueryBudget is given, every batch is charged against its row/byte caps.
+    """
+    columns = [description[0] for description in cursor.description or []]
+    rows: List[tuple] = []
+    buffered_bytes = 0
+    writer = None
+    fetched = 0
+    has_more = False
+
+    try:
+        while True:
+            batch = [tuple(row) for row in cursor.fetchmany(batch_size)]
+            if not batch:
+                break
+
+            if max_rows and fetched + len(batch) > max_rows:
+                batch = batch[:max_rows - fetched]
+                has_more = True
+            fetched += len(batch)
+
+            measure = (writer is None and store is not None) or (budget is not None and budget.max_bytes)
+            batch_bytes = len(json.dumps(batch, default=str)) if measure else 0
+            if budget is not None:
+                budget.account(len(batch), batch_bytes)
+
+            if writer is not None:
+                writer.write_batch(batch)
+            else:
+                rows.extend(batch)
+                if store is not None:
+                    buffered_bytes += batch_bytes
+                    if buffered_bytes > store.threshold_bytes:
+                        # Move what we have to disk and keep streaming there
+                        writer = store.open_writer(columns)
+                        writer.write_batch(rows)
+                        rows = []
+
+            if has_more:
+                break
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if writer is not None:
+        return columns, [], has_more, writer.close()
+    return columns, rows, has_more, None
+
+def resolve_data_json(data_json: str, store: ResultSpillStore) -> str:
+    """Replace a spill handle with a bounded inline columnar sample of the result; pass other data through.
+
+    At most store.resolve_max_rows rows are read; row_count stays the size
+    of the whole result and "sampled" marks a partial read. Raises
+    FileNotFoundError for an expired handle.
+    """
+    try:
+        payload = json.loads(data_json)
+    except (TypeError, ValueError):
+        return data_json
+
+    if not (isinstance(payload, dict) and str(payload.get("handle", "")).startswith(SPILL_SCHEME)):
+        return data_json
+
+    row_count = payload.get("row_count")
+    columns, rows = store.read_sample(payload["handle"], store.resolve_max_rows, row_count)
+    resolved = {"columns": columns, "data": [list(row) for row in rows], "row_count": row_count or len(rows)}
+    if len(rows) < row_count if row_count is not None else len(rows) >= store.resolve_max_rows:
+        resolved["sampled"] = True
+    return json.dumps(resolved)
@@ -0,0 +1,185 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from .sql_parsing import tokenize_sql_spans
+
+# Literals in a question that may be swapped for others: quoted strings and numbers
+_SLOT_PATTERN = re.compile(r"'([^']+)'|\"([^\"]+)\"|(?<![\w.])(\d+(?:\.\d+)?)(?![\w.])")
+
+# Words of a question template, placeholders included
+_WORD_PATTERN = re.compile(r"<\w+>|\w+")
+
+# Filler words that do not change what a question asks for
+_STOPWORDS = {
+    "a", "an", "the", "me", "us", "i", "you", "please", "show", "give", "list", "display", "tell", "find", "get",
+    "what", "whats", "is", "are", "was", "were", "can", "could", "would", "will", "want", "like", "let", "see"
+}
+
+def schema_hash(schema: str) -> str:
+    """Hash of a schema that ignores row counts, so data changes keep cache entries valid"""
+    try:
+        document = json.loads(schema)
+    except (TypeError, ValueError):
+        document = None
+    if isinstance(document, dict) and isinstance(document.get("tables"), list):
+        tables = [{key: value for key, value in table.items() if key != "row_count"} for table in document["tables"]]
+        schema = json.dumps(tables, sort_keys=True)
+    return hashlib.sha1(schema.encode("utf-8")).hexdigest()
+
+def question_slots(question: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """Replace literals with placeholders; returns (template, [(kind, value), ...])"""
+    slots = []
+
+    def placeholder(match: re.Match) -> str:
+        if match.group(3) is not None:
+            slots.append(("number", match.group(3)))
+            return "<number>"
+        slots.append(("string", match.group(1) if match.group(1) is not None else match.group(2)))
+        return "<value>"
+
+    return _SLOT_PATTERN.sub(placeholder, question), slots
+
+def template_words(template: str) -> List[str]:
+    """Lowercase words of a question template without filler words, punctuation or spacing"""
+    return [word for word in _WORD_PATTERN.findall(template.lower()) if word not in _STOPWORDS]
+
+def fill_slots(sql: str, cached: List[Tuple[str, str]], new: List[Tuple[str, str]]) -> Optional[str]:
+    """Rewrite the literals of cached SQL for a question whose slot values differ.
+
+    Each changed value must occur in the SQL, as a number token, a whole
+    string literal or (for numbers, e.g. years in dates) a digit run inside
+    a string literal; otherwise the SQL cannot be adapted and None is returned.
+    """
+    replacements: Dict[str, str] = {}
+    for (kind, old), (new_kind, value) in zip(cached, new):
+        if kind != new_kind or replacements.get(old, value) != value:
+            return None
+        if old != value:
+            replacements[old] = value
+    if not replacements:
+        return sql
+
+    edits = []
+    found = set()
+    for kind, text, start, end in tokenize_sql_spans(sql):
+        if kind == "number" and text in replacements:
+            edits.append((start, end, replacements[text]))
+            found.add(text)
+        elif kind == "string":
+            inner = text[1:-1].replace("''", "'")
+            if inner in replacements:
+                replaced = replacements[inner]
+                found.add(inner)
+            else:
+                replaced = inner
+                for old, value in replacements.items():
+                    if old.replace(".", "").isdigit():
+                        replaced, count = re.subn(rf"(?<!\d){re.escape(old)}(?!\d)", value, replaced)
+                        if count:
+                            found.add(old)
+            if replaced != inner:
+                edits.append((start, end, "'" + replaced.replace("'", "''") + "'"))
+
+    if found != set(replacements):
+        return None
+    for start, end, text in sorted(edits, reverse=True):
+        sql = sql[:start] + text + sql[end:]
+    return sql
+
+class SemanticSQLCache:
+    """Cache of generated SQL keyed by schema and question wording; hits may differ only in their literals"""
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 2000, ttl_seconds: float = 86400,
+                 embedding: Optional[Dict[str, Any]] = None, embedding_model=None, **_):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedding_config = embedding
+
+        self._model = embedding_model
+        # (namespace, entry id) -> entry, in LRU order
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self):
+        """Embedding model, loaded on first use"""
+        if self._model is None:
+            from ..models.embeddings import get_shared_embedding_model
+            self._model = get_shared_embedding_model(self.embedding_config)
+        return self._model
+
+    def _embed(self, template: str) -> np.ndarray:
+        """Normalized embedding of a question template"""
+        vector = np.asarray(self.model.encode(template), dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, namespace: str, question: str) -> Optional[Dict[str, Any]]:
+        """Best cached SQL for a question, adapted to its literals, or None.
+
+        Returns {"sql", "key", "similarity"}; pass key to invalidate() if the
+        SQL turns out to be invalid.
+        """
+        template, slots = question_slots(question)
+        query = self._embed(template)
+        now = time.time()
+
+        with self._lock:
+            candidates = []
+            for key, entry in list(self._entries.items()):
+                if self.ttl_seconds and now - entry["created_at"] > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                if key[0] == namespace and len(entry["slots"]) == len(slots):
+                    candidates.append((key, entry))
+
+        words = template_words(template)
+        best = None
+        for key, entry in candidates:
+            similarity = float(entry["vector"] @ query)
+            if similarity >= self.threshold and (best is None or similarity > best[0]):
+                if entry["words"] != words:
+                    continue
+                sql = fill_slots(entry["sql"], entry["slots"], slots)
+                if sql is not None:
+                    best = (similarity, key, sql)
+
+        with self._lock:
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if best[1] in self._entries:
+                self._entries.move_to_end(best[1])
+        return {"sql": best[2], "key": best[1], "similarity": round(best[0], 4)}
+
+    def store(self, namespace: str, question: str, sql: str):
+        """Remember the SQL generated for a question"""
+        template, slots = question_slots(question)
+        words = template_words(template)
+        entry = {"sql": sql, "slots": slots, "words": words, "vector": self._embed(template), "created_at": time.time()}
+        key = (namespace, hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Tuple[str, str]):
+        """Drop an entry whose SQL failed validation"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and hit/miss counters"""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,292 @@
+import re
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+
+# Strings, quoted identifiers, numbers, (qualified) names, multi-char operators and punctuation
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*')
+    | (?P<name>(?:"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|[A-Za-z_][A-Za-z0-9_$]*)
+               (?:\.(?:"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|[A-Za-z_][A-Za-z0-9_$]*|\*))?)
+    | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+    | (?P<param>[?:@$][A-Za-z0-9_]*)
+    | (?P<op><=|>=|<>|!=|==|\|\||<<|>>|[-+*/%<>=(),;&|~])
+    """,
+    re.VERBOSE
+)
+
+_COMMENT_PATTERN = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+# Keywords that can never be a table alias
+_RESERVED = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross", "natural", "on", "using",
+    "group", "order", "having", "limit", "offset", "union", "intersect", "except", "window", "as",
+    "select", "from", "and", "or", "not", "by", "values", "set", "returning"
+}
+
+# Comparison operators by the kind of index access they allow
+EQUALITY_OPERATORS = {"=", "==", "in", "is"}
+RANGE_OPERATORS = {"<", ">", "<=", ">=", "between", "like", "glob"}
+
+_KEYWORDS = _RESERVED | {"in", "is", "between", "like", "glob"}
+
+# Bare words that are constants or expression syntax rather than column references
+LITERAL_NAMES = {
+    "null", "true", "false", "current_date", "current_time", "current_timestamp",
+    "case", "when", "then", "else", "end", "escape"
+}
+
+# Top-level clauses of a simple SELECT, in order
+SELECT_CLAUSES = ("select", "from", "where", "group", "having", "order", "limit")
+
+def tokenize_sql_spans(query: str) -> List[Tuple[str, str, int, int]]:
+    """Split SQL into (kind, text, start, end) tokens; comments and whitespace are dropped"""
+    # Blank out comments with spaces so offsets still index the original query
+    stripped = _COMMENT_PATTERN.sub(lambda match: " " * len(match.group()), query)
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(stripped):
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "name" and "." not in text and text.lower() in _KEYWORDS:
+            kind = "keyword"
+        tokens.append((kind, text, match.start(), match.end()))
+    return tokens
+
+def tokenize_sql(query: str) -> List[Tuple[str, str]]:
+    """Split SQL into (kind, text) tokens; comments and whitespace are dropped"""
+    return [(kind, text) for kind, text, _, _ in tokenize_sql_spans(query)]
+
+def matching_paren(tokens: List[tuple], start: int) -> int:
+    """Index of the ")" closing the "(" at tokens[start], or -1"""
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i][1] == "(":
+            depth += 1
+        elif tokens[i][1] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+def split_top_level(tokens: List[tuple], separator: str) -> List[List[tuple]]:
+    """Split tokens on a separator (a punctuation mark or keyword) outside parentheses"""
+    parts: List[List[tuple]] = [[]]
+    depth = 0
+    for token in tokens:
+        if token[1] == "(":
+            depth += 1
+        elif token[1] == ")":
+            depth -= 1
+        if depth == 0 and token[1].lower() == separator:
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return parts
+
+def normalize_expression(tokens: List[tuple]) -> str:
+    """Canonical text of an expression: column qualifiers dropped, case and spacing collapsed"""
+    parts = []
+    for token in tokens:
+        kind, text = token[0], token[1]
+        if kind == "name":
+            parts.append(split_name(text)[1].lower())
+        elif kind in ("string", "number"):
+            parts.append(text)
+        else:
+            parts.append(text.lower())
+    return " ".join(parts)
+
+def unquote_identifier(name: str) -> str:
+    """Strip SQL identifier quoting"""
+    if len(name) >= 2 and name[0] in "\"`[":
+        return name[1:-1].replace('""', '"')
+    return name
+
+def split_name(name: str) -> Tuple[Optional[str], str]:
+    """Split a possibly qualified name into (qualifier, name)"""
+    match = re.match(r'^((?:"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|[^.]+))(?:\.(.+))?$', name)
+    if match.group(2) is None:
+        return None, unquote_identifier(name)
+    return unquote_identifier(match.group(1)), unquote_identifier(match.group(2))
+
+def split_select_clauses(spans: List[tuple]) -> Optional[Dict[str, List[tuple]]]:
+    """Split a single SELECT statement's tokens into its top-level clauses.
+
+    Returns {"select": [...], "from": [...], ...} keyed by clause keyword
+    ("group"/"order" for GROUP BY/ORDER BY), or None for statements with
+    subqueries or repeated clauses.
+    """
+    if spans[0][1].lower() != "select":
+        return None
+    clauses: Dict[str, List[tuple]] = {}
+    current = None
+    depth = 0
+    i = 0
+    while i < len(spans):
+        token = spans[i]
+        lower = token[1].lower()
+        if token[1] == "(":
+            depth += 1
+        elif token[1] == ")":
+            depth -= 1
+        if depth == 0 and token[0] == "keyword" and lower in SELECT_CLAUSES:
+            if lower in clauses:
+                return None
+            current = lower
+            clauses[current] = []
+            if lower in ("group", "order"):
+                if i + 1 >= len(spans) or spans[i + 1][1].lower() != "by":
+                    return None
+                i += 1
+        elif depth > 0 and lower == "select":
+            # Subqueries are not supported
+            return None
+        elif current is not None:
+            clauses[current].append(token)
+        i += 1
+    return clauses
+
+def split_alias(item: List[tuple]) -> Tuple[List[tuple], Optional[str]]:
+    """Separate a select item ("expr AS alias" or "expr alias") into its tokens and alias"""
+    if len(item) >= 3 and item[-2][1].lower() == "as":
+        return item[:-2], split_name(item[-1][1])[1]
+    if len(item) >= 2 and item[-1][0] == "name" and "." not in item[-1][1] and item[-1][1].lower() != "end" \
+            and item[-2][1] != "(" and (item[-2][1] == ")" or item[-2][0] in ("name", "string", "number")):
+        return item[:-1], split_name(item[-1][1])[1]
+    return item, None
+
+def output_column_name(query: str, expression: List[tuple]) -> str:
+    """Column name SQLite gives an unaliased result column (expression tokens carry spans)"""
+    if len(expression) == 1 and expression[0][0] == "name":
+        return split_name(expression[0][1])[1]
+    return query[expression[0][2]:expression[-1][3]]
+
+def query_shape(query: str) -> str:
+    """Normalize a query to its shape: literals become ?, whitespace and case are collapsed"""
+    parts = []
+    for kind, text in tokenize_sql(query):
+        if kind in ("string", "number", "param"):
+            parts.append("?")
+        elif kind == "op" and text == ";":
+            continue
+        elif kind == "name" and text[0] in "\"`[":
+            parts.append(text)
+        else:
+            parts.append(text.lower())
+    # Collapse IN lists of any length to a single placeholder list
+    shape = " ".join(parts)
+    return re.sub(r"\( \?(?: , \?)* \)", "( ? )", shape)
+
+def query_fingerprint(query: str) -> str:
+    """Stable short identifier for a query shape"""
+    return hashlib.sha1(query_shape(query).encode()).hexdigest()[:16]
+
+def table_references(query: str) -> Dict[str, str]:
+    """Map every alias (and bare table name) used in FROM/JOIN clauses to its table"""
+    tokens = tokenize_sql(query)
+    aliases: Dict[str, str] = {}
+    # Parenthesis depths at which a FROM clause is open, innermost last
+    from_depths: List[int] = []
+    depth = 0
+    expect_table = False
+
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        lower = text.lower()
+        in_from = bool(from_depths) and from_depths[-1] == depth
+
+        if text == "(":
+            # A derived table has no name of its own; its inner FROM is picked up later
+            depth += 1
+            expect_table = False
+        elif text == ")":
+            depth -= 1
+            while from_depths and from_depths[-1] > depth:
+                from_depths.pop()
+        elif kind == "keyword" and lower in ("from", "join"):
+            if not in_from:
+                from_depths.append(depth)
+            expect_table = True
+        elif in_from and text == ",":
+            expect_table = True
+        elif in_from and kind == "keyword" and lower in (
+                "where", "group", "order", "having", "limit", "union", "intersect", "except", "window"):
+            from_depths.pop()
+            expect_table = False
+        elif expect_table and kind == "name":
+            table = split_name(text)[1]
+            alias = table
+            j = i + 1
+            if j < len(tokens) and tokens[j][1].lower() == "as":
+                j += 1
+            if j < len(tokens) and tokens[j][0] == "name" and "." not in tokens[j][1]:
+                alias = unquote_identifier(tokens[j][1])
+                i = j
+            aliases[alias.lower()] = table
+            aliases.setdefault(table.lower(), table)
+            expect_table = False
+        i += 1
+
+    return aliases
+
+def extract_predicates(query: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Find column predicates, join conditions and grouping columns in a query.
+
+    Returns {"filters": [...], "joins": [...], "group_by": [...]}. Filters are
+    {"qualifier", "column", "kind"} with kind "equality" or "range"; joins are
+    pairs of (qualifier, column) compared with = in ON/WHERE clauses. Column
+    names are not resolved against the schema here.
+    """
+    tokens = tokenize_sql(query)
+    filters: List[Dict[str, Any]] = []
+    joins: List[Dict[str, Any]] = []
+    group_by: List[Dict[str, Any]] = []
+    clause = None
+
+    for i, (kind, text) in enumerate(tokens):
+        lower = text.lower()
+
+        if kind == "keyword" and lower in ("where", "on", "having"):
+            clause = lower
+            continue
+        if kind == "keyword" and lower == "by" and i > 0 and tokens[i - 1][1].lower() in ("group", "order"):
+            clause = tokens[i - 1][1].lower()
+            continue
+        if kind == "keyword" and lower in ("select", "from", "join", "limit", "union", "intersect", "except"):
+            clause = None
+            continue
+
+        if kind != "name" or text.endswith(".*"):
+            continue
+        # Function calls are not column references
+        if i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+            continue
+
+        qualifier, column = split_name(text)
+        ref = {"qualifier": qualifier, "column": column}
+
+        if clause == "group":
+            group_by.append(ref)
+            continue
+        if clause not in ("where", "on"):
+            continue
+
+        following = tokens[i + 1][1].lower() if i + 1 < len(tokens) else ""
+        if following == "not" and i + 2 < len(tokens):
+            following = tokens[i + 2][1].lower()
+        previous = tokens[i - 1][1].lower() if i > 0 else ""
+
+        if following in EQUALITY_OPERATORS | RANGE_OPERATORS:
+            other = tokens[i + 2] if i + 2 < len(tokens) else ("", "")
+            if following in ("=", "==") and other[0] == "name" and not (
+                    i + 3 < len(tokens) and tokens[i + 3][1] == "("):
+                other_qualifier, other_column = split_name(other[1])
+                joins.append({"left": ref, "right": {"qualifier": other_qualifier, "column": other_column}})
+                continue
+            filters.append({**ref, "kind": "equality" if following in EQUALITY_OPERATORS else "range"})
+        elif previous in EQUALITY_OPERATORS | RANGE_OPERATORS and i > 1 and tokens[i - 2][0] in ("string", "number", "param"):
+            # Literal on the left-hand side, e.g. 100 < amount
+            filters.append({**ref, "kind": "equality" if previous in EQUALITY_OPERATORS else "range"})
+
+    return {"filters": filters, "joins": joins, "group_by": group_by}
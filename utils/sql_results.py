@@ -0,0 +1,113 @@
+import json
+import base64
+from typing import Dict, Any, List, Optional, Tuple
+
+# Output layouts supported by execute_sql_query
+ORIENTS = ("records", "columns", "arrow")
+
+def encode_cursor(offset: int) -> str:
+    """Encode a row offset as an opaque paging cursor"""
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode("ascii")
+
+def decode_cursor(cursor: str) -> int:
+    """Decode a paging cursor back into a row offset"""
+    if not cursor:
+        return 0
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["offset"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def paged_query(query: str, max_rows: int, offset: int) -> Tuple[str, tuple]:
+    """Wrap a query so SQLite only produces one page (plus one row to detect more)"""
+    inner = query.strip().rstrip(";")
+    limit = max_rows + 1 if max_rows else -1
+    return f"SELECT * FROM (\n{inner}\n) LIMIT ? OFFSET ?", (limit, offset)
+
+def fetch_rows(cursor, max_rows: int = 0, batch_size: int = 1000) -> Tuple[List[str], List[tuple], bool]:
+    """Stream rows from a cursor with fetchmany.
+
+    Returns (columns, rows, has_more). At most max_rows rows are kept (0 means
+    no limit); one extra row is read to tell whether more rows exist.
+    """
+    columns = [description[0] for description in cursor.description or []]
+    rows: List[tuple] = []
+    has_more = False
+
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+
+        if max_rows and len(rows) + len(batch) > max_rows:
+            rows.extend(tuple(row) for row in batch[:max_rows - len(rows)])
+            has_more = True
+            break
+
+        rows.extend(tuple(row) for row in batch)
+
+    return columns, rows, has_more
+
+def serialize_result(columns: List[str], rows: List[tuple], orient: str = "records",
+                     next_cursor: Optional[str] = None) -> str:
+    """Serialize fetched rows in the requested layout.
+
+    "records" without paging keeps the original list-of-dicts format. With a
+    next page, records are wrapped as {"data": [...], "next_cursor": ...}.
+    "columns" emits {"columns": [...], "data": [[...]]}, and "arrow" carries
+    base64 Arrow IPC stream bytes and requires pyarrow.
+    """
+    if orient == "records":
+        records = [dict(zip(columns, row)) for row in rows]
+        if next_cursor is None:
+            return json.dumps(records)
+        return json.dumps({"data": records, "row_count": len(rows), "next_cursor": next_cursor})
+
+    if orient == "columns":
+        return json.dumps({
+            "columns": columns,
+            "data": [list(row) for row in rows],
+            "row_count": len(rows),
+            "next_cursor": next_cursor
+        })
+
+    if orient == "arrow":
+        import pyarrow as pa
+
+        table = pa.table({name: [row[i] for row in rows] for i, name in enumerate(columns)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        return json.dumps({
+            "format": "arrow",
+            "columns": columns,
+            "ipc": base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii"),
+            "row_count": len(rows),
+            "next_cursor": next_cursor
+        })
+
+    raise ValueError(f"Unsupported result orient: {orient}")
+
+def to_records(payload: Any) -> List[Dict[str, Any]]:
+    """Convert any execute_sql_query payload (or its JSON string) to a list of dicts"""
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+
+    if isinstance(payload, list):
+        return payload
+
+    if isinstance(payload, dict):
+        if payload.get("format") == "arrow":
+            import pyarrow as pa
+
+            reader = pa.ipc.open_stream(base64.b64decode(payload["ipc"]))
+            return reader.read_all().to_pylist()
+
+        if "columns" in payload and "data" in payload:
+            return [dict(zip(payload["columns"], row)) for row in payload["data"]]
+
+        if isinstance(payload.get("data"), list):
+            return payload["data"]
+
+    raise ValueError("Unrecognized query result format")